@@ -0,0 +1,71 @@
+"""
+The auth dependency (login_manager) with and without the verified tokens payloads cache.
+STATELESS_AUTH is on, so only the token handling is measured, without the database.
+
+Run from the API directory:
+python -m benchmarks.auth_dependency [calls number]
+"""
+from os import environ
+from sys import argv
+
+
+environ['IS_TEST'] = 'True'
+environ['STATELESS_AUTH'] = 'True'
+# the stateless tokens are revoked only in-process, so the settings allow them only with one worker
+environ['WEB_WORKERS'] = '1'
+environ['BROADCAST_BACKEND'] = 'memory'
+
+
+# imports must be here because we must set environment variables before importing API modules
+from asyncio import run
+from time import perf_counter
+
+from fastapi.security import SecurityScopes
+from starlette.requests import Request
+
+from core import schemas
+from core.cache import token_payload_cache
+from core.login_manager import login_manager
+from sql.crud import scope_registry
+
+
+def make_request(token: str) -> Request:
+    return Request({
+        'type': 'http',
+        'method': 'GET',
+        'path': '/users/me',
+        'headers': [(b'cookie', f'access-token={token}'.encode())],
+    })
+
+
+async def measure(calls_number: int, cached: bool) -> float:
+    """
+    Return the mean time (µs) of a login_manager call
+    """
+
+    user = schemas.User(id=1, username='benchmark_auth_user', discord_id=-1, is_active=True)
+
+    token = login_manager.create_user_access_token(user, ['me'], scope_registry.get_all())
+    request = make_request(token)
+    security_scopes = SecurityScopes(['me'])
+
+    start_time = perf_counter()
+
+    for _ in range(calls_number):
+
+        if not cached:
+            token_payload_cache.clear()
+
+        await login_manager(request, security_scopes, db=None)
+
+    return (perf_counter() - start_time) / calls_number * 1_000_000
+
+
+def main(calls_number: int) -> None:
+
+    for title, cached in (('without cache', False), ('with cache', True)):
+        print(f'{title}: {run(measure(calls_number, cached)):.1f} µs per call')
+
+
+if __name__ == '__main__':
+    main(*[int(i) for i in argv[1:]] or [20000])
@@ -0,0 +1,94 @@
+"""
+Rendering of a p2p requests page (like /p2p_request/all returns it), without the database:
+the previous path (the route returns the schema, FastAPI validates it by the response model again, serializes it
+to python objects and JSONResponse dumps them with json), the same with ORJSONResponse and SchemaResponse.
+
+Run from the API directory:
+python -m benchmarks.json_responses [page size] [pages number]
+"""
+from os import environ
+from sys import argv
+
+
+environ['IS_TEST'] = 'True'
+
+
+# imports must be here because we must set environment variables before importing API modules
+from asyncio import run
+from datetime import datetime
+from time import perf_counter
+from typing import Callable, Type
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from starlette.responses import Response
+
+from core import schemas
+from core.pagination import make_page
+from sql import models
+from sql.models_enums import ReviewStateEnum
+
+
+PAGE_SCHEMA = schemas.Page[schemas.P2PRequest]
+
+# FastAPI makes it once, on the route creation
+RESPONSE_FIELD = create_response_field('Response', PAGE_SCHEMA)
+
+
+def make_p2p_requests(page_size: int) -> list[models.P2PRequest]:
+    return [
+        models.P2PRequest(
+            id=i,
+            repository_link=f'https://github.com/user/project_{i}',
+            comment='benchmark',
+            creator_id=i,
+            publication_date=datetime.now(),
+            review_state=ReviewStateEnum.PENDING,
+        )
+        for i in range(page_size)
+    ]
+
+
+async def render_with_response_model(p2p_requests: list, response_class: Type[Response]) -> bytes:
+
+    page = PAGE_SCHEMA(items=[schemas.P2PRequest.model_validate(i) for i in p2p_requests], next_cursor=None)
+
+    content = await serialize_response(field=RESPONSE_FIELD, response_content=page)
+
+    return response_class(content).body
+
+
+async def render_schema_response(p2p_requests: list) -> bytes:
+    return make_page(schemas.P2PRequest, p2p_requests, None).body
+
+
+async def measure(render: Callable, p2p_requests: list, pages_number: int) -> float:
+    """
+    Return pages per second
+    """
+
+    start_time = perf_counter()
+
+    for _ in range(pages_number):
+        await render(p2p_requests)
+
+    return pages_number / (perf_counter() - start_time)
+
+
+async def main(page_size: int, pages_number: int) -> None:
+
+    p2p_requests = make_p2p_requests(page_size)
+
+    paths = {
+        'response model + JSONResponse': lambda i: render_with_response_model(i, JSONResponse),
+        'response model + ORJSONResponse': lambda i: render_with_response_model(i, ORJSONResponse),
+        'SchemaResponse': render_schema_response,
+    }
+
+    for name, render in paths.items():
+        print(f'{name}: {await measure(render, p2p_requests, pages_number):.0f} pages/s')
+
+
+if __name__ == '__main__':
+    run(main(*[int(i) for i in argv[1:]] or [500, 200]))
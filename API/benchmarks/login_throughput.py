@@ -0,0 +1,100 @@
+"""
+Login (/token) throughput with passwords hashing in the threadpool and in the process pool.
+While logins run, a cheap route is polled to show how much the logins stall the other requests.
+
+Run from the API directory against a test database (it creates a user there):
+python -m benchmarks.login_throughput [logins number] [concurrency] [processes]
+"""
+from os import environ
+from sys import argv
+
+
+environ['IS_TEST'] = 'True'
+environ['RATE_LIMIT_ENABLED'] = 'False'  # the benchmark logs in as one user from one address
+
+
+# imports must be here because we must set environment variables before importing API modules
+from asyncio import run, gather, sleep, Semaphore, create_task
+from time import perf_counter
+
+from httpx import AsyncClient
+
+from core import schemas
+from core.config import get_settings
+from core.main import app
+from core.passwords import start_password_executor, shutdown_password_executor
+from sql.crud import UserCrud
+from sql.database import get_db_not_dependency
+
+
+SETTINGS = get_settings()
+
+USERNAME = 'benchmark_login_user'
+PASSWORD = 'benchmark_login_password'
+
+
+def create_user() -> None:
+
+    db = get_db_not_dependency()
+
+    if not UserCrud(db).get(username=USERNAME):
+        UserCrud(db).create(schemas.UserCreate(username=USERNAME, password=PASSWORD, discord_id=-1))
+
+
+async def measure(logins_number: int, concurrency: int) -> tuple[float, float]:
+    """
+    Return logins per second and the mean latency (ms) of the cheap route during the logins
+    """
+
+    semaphore = Semaphore(concurrency)
+    latencies = []
+
+    async with AsyncClient(app=app, base_url='http://benchmark') as client:
+
+        async def login() -> None:
+            async with semaphore:
+                response = await client.post(f'/{SETTINGS.TOKEN_URL}', data={'username': USERNAME, 'password': PASSWORD})
+                assert response.status_code == 200
+
+        async def poll(logins_task) -> None:
+            while not logins_task.done():
+                start_time = perf_counter()
+                await client.get(SETTINGS.OPENAPI_URL)
+                latencies.append(perf_counter() - start_time)
+                await sleep(0.01)
+
+        start_time = perf_counter()
+
+        async def login_all() -> None:
+            await gather(*[login() for _ in range(logins_number)])
+
+        logins_task = create_task(login_all())
+
+        await gather(logins_task, poll(logins_task))
+
+        elapsed_time = perf_counter() - start_time
+
+    return logins_number / elapsed_time, sum(latencies) / max(len(latencies), 1) * 1000
+
+
+def main(logins_number: int, concurrency: int, processes: int) -> None:
+
+    create_user()
+
+    for title, max_workers in (('threadpool', 0), (f'process pool ({processes})', processes)):
+
+        start_password_executor(max_workers)
+
+        try:
+            run(measure(concurrency, concurrency))  # warm up (starts the pool processes)
+            logins_per_second, latency = run(measure(logins_number, concurrency))
+
+        finally:
+            shutdown_password_executor()
+
+        print(f'{title}: {logins_per_second:.1f} logins/s, cheap route latency during logins {latency:.1f} ms')
+
+
+if __name__ == '__main__':
+    # with several workers the default is 0 processes, the pool is compared with 2 then
+    main(*[int(i) for i in argv[1:]] or [200, 20, SETTINGS.PASSWORD_HASHING_PROCESSES or 2])
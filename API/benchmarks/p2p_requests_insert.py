@@ -0,0 +1,83 @@
+"""
+P2P requests inserted per second: one by one (a commit per request, like /p2p_request/create)
+and with P2PRequestCrud.create_many (multi-row inserts) with different batch sizes.
+
+Run from the API directory against a test database (it creates a user and p2p requests there):
+python -m benchmarks.p2p_requests_insert [requests number]
+"""
+from os import environ
+from sys import argv
+
+
+environ['IS_TEST'] = 'True'
+
+
+# imports must be here because we must set environment variables before importing API modules
+from time import perf_counter
+
+from core import schemas
+from core.config import get_settings
+from sql.crud import UserCrud, P2PRequestCrud
+from sql.database import get_db_not_dependency
+
+
+SETTINGS = get_settings()
+
+USERNAME = 'benchmark_p2p_requests_user'
+
+
+def get_creator_id() -> int:
+
+    db = get_db_not_dependency()
+
+    if not (user := UserCrud(db).get(username=USERNAME)):
+        user = UserCrud(db).create(schemas.UserCreate(username=USERNAME, password=USERNAME, discord_id=-2))
+
+    return user.id
+
+
+def make_p2p_requests_create(requests_number: int, creator_id: int) -> list[schemas.P2PRequestCreate]:
+    return [
+        schemas.P2PRequestCreate(repository_link=f'benchmark_link_{i}', comment='benchmark', creator_id=creator_id)
+        for i in range(requests_number)
+    ]
+
+
+def measure_one_by_one(p2p_requests_create: list[schemas.P2PRequestCreate]) -> float:
+
+    crud = P2PRequestCrud(get_db_not_dependency())
+
+    start_time = perf_counter()
+
+    for p2p_request_create in p2p_requests_create:
+        crud.create(p2p_request_create)
+
+    return len(p2p_requests_create) / (perf_counter() - start_time)
+
+
+def measure_create_many(p2p_requests_create: list[schemas.P2PRequestCreate], batch_size: int) -> float:
+
+    SETTINGS.P2P_REQUESTS_BULK_CREATE_BATCH_SIZE = batch_size
+
+    crud = P2PRequestCrud(get_db_not_dependency())
+
+    start_time = perf_counter()
+
+    crud.create_many(p2p_requests_create)
+
+    return len(p2p_requests_create) / (perf_counter() - start_time)
+
+
+def main(requests_number: int) -> None:
+
+    p2p_requests_create = make_p2p_requests_create(requests_number, get_creator_id())
+
+    # a tenth of the requests is enough, one by one insert is slow
+    print(f'one by one: {measure_one_by_one(p2p_requests_create[:requests_number // 10]):.0f} rows/s')
+
+    for batch_size in (100, 1000, 5000):
+        print(f'create_many, batch {batch_size}: {measure_create_many(p2p_requests_create, batch_size):.0f} rows/s')
+
+
+if __name__ == '__main__':
+    main(*[int(i) for i in argv[1:]] or [20000])
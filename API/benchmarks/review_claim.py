@@ -0,0 +1,82 @@
+"""
+Concurrent review claims per second (P2PRequestCrud.claim_oldest_not_user_without_reviews, FOR UPDATE SKIP LOCKED):
+the reviewers claim the pending p2p requests in parallel threads, every one with its own session.
+
+Run from the API directory against a test database (it creates users and p2p requests there,
+the other pending p2p requests are claimed too):
+python -m benchmarks.review_claim [requests number] [claimers number]
+"""
+from os import environ
+from sys import argv
+
+
+environ['IS_TEST'] = 'True'
+
+
+# imports must be here because we must set environment variables before importing API modules
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+from core import schemas
+from core.config import get_settings
+from sql.crud import UserCrud, P2PRequestCrud
+from sql.database import get_db_not_dependency, SessionLocal
+
+
+SETTINGS = get_settings()
+
+CREATOR_USERNAME = 'benchmark_claim_creator'
+REVIEWER_USERNAME = 'benchmark_claim_reviewer'
+
+
+def get_user_id(username: str, discord_id: int) -> int:
+
+    db = get_db_not_dependency()
+
+    if not (user := UserCrud(db).get(username=username)):
+        user = UserCrud(db).create(schemas.UserCreate(username=username, password=username, discord_id=discord_id))
+
+    return user.id
+
+
+def create_p2p_requests(requests_number: int, creator_id: int) -> None:
+    P2PRequestCrud(get_db_not_dependency()).create_many([
+        schemas.P2PRequestCreate(
+            repository_link=f'benchmark_claim_link_{i}', comment='benchmark', creator_id=creator_id
+        )
+        for i in range(requests_number)
+    ])
+
+
+def claim_all(reviewer_id: int) -> int:
+
+    claims_number = 0
+
+    with SessionLocal() as db:
+        while P2PRequestCrud(db).claim_oldest_not_user_without_reviews(reviewer_id):
+            claims_number += 1
+
+    return claims_number
+
+
+def main(requests_number: int, claimers_number: int) -> None:
+
+    create_p2p_requests(requests_number, get_user_id(CREATOR_USERNAME, -3))
+
+    reviewers_ids = [get_user_id(f'{REVIEWER_USERNAME}_{i}', -4 - i) for i in range(claimers_number)]
+
+    start_time = perf_counter()
+
+    with ThreadPoolExecutor(claimers_number) as executor:
+        claims_number = sum(executor.map(claim_all, reviewers_ids))
+
+    elapsed_time = perf_counter() - start_time
+
+    print(
+        f'{claims_number} claims by {claimers_number} concurrent claimers in {elapsed_time:.2f}s '
+        f'({claims_number / elapsed_time:.0f} claims/s)'
+    )
+
+
+if __name__ == '__main__':
+    main(*[int(i) for i in argv[1:]] or [2000, 16])
@@ -0,0 +1,246 @@
+"""
+Fan-out of the review events to the subscribers (the review events stream, GET /p2p_request/review/events).
+The memory broadcaster delivers the events only to the subscribers of the publishing worker, the postgres one
+publishes them by NOTIFY and every worker delivers them to its subscribers from its LISTEN connection
+(BROADCAST_BACKEND)
+"""
+from asyncio import (
+    AbstractEventLoop, CancelledError, Event, Lock, Queue, QueueEmpty, Task, create_task, get_running_loop, sleep, wait_for
+)
+from contextlib import asynccontextmanager, suppress
+from typing import AsyncIterator
+
+import asyncpg
+from orjson import dumps, loads
+from sqlalchemy import make_url
+
+from core.config import get_settings
+from core.get_logger import get_logger
+from sql.database import DATABASE_URL
+
+
+SETTINGS = get_settings()
+
+logger = get_logger('main')
+
+REVIEW_EVENTS_CHANNEL = 'review_events'
+
+# a NOTIFY payload must be shorter than 8000 bytes, so the events of more creators are sent without them
+MAX_EVENT_CREATORS = 100
+
+# put to the subscribers queues when the events may be lost (see PostgresBroadcaster), their streams end
+END_OF_EVENTS = None
+
+
+class Broadcaster:
+    """
+    In-process broadcaster, the subscribers may be in different event loops (the events are put to their queues
+    in their loops). A subscriber queue is bounded, if the subscriber does not keep up its oldest events are dropped
+    """
+
+    def __init__(self, queue_size: int) -> None:
+
+        self.queue_size = queue_size
+
+        self._subscribers: set[tuple[AbstractEventLoop, Queue]] = set()
+
+    @property
+    def connected(self) -> bool:
+        """
+        False if the published events are not delivered now, so the subscribers must poll
+        """
+        return True
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    async def publish(self, event: dict) -> None:
+        self._fan_out(event)
+
+    def _fan_out(self, event: dict | None) -> None:
+        for loop, queue in list(self._subscribers):
+            loop.call_soon_threadsafe(self._put, queue, event)
+
+    def _end_subscriptions(self) -> None:
+        self._fan_out(END_OF_EVENTS)
+
+    @staticmethod
+    def _put(queue: Queue, event: dict | None) -> None:
+
+        if queue.full():
+            try:
+                queue.get_nowait()
+            except QueueEmpty:
+                pass
+
+        queue.put_nowait(event)
+
+    @asynccontextmanager
+    async def subscribe(self) -> AsyncIterator[Queue]:
+        """
+        The queue of the events published while the context is open, END_OF_EVENTS after the last one
+        """
+
+        subscriber = (get_running_loop(), Queue(self.queue_size))
+
+        self._subscribers.add(subscriber)
+
+        try:
+            yield subscriber[1]
+        finally:
+            self._subscribers.discard(subscriber)
+
+    def __len__(self) -> int:
+        return len(self._subscribers)
+
+
+class PostgresBroadcaster(Broadcaster):
+    """
+    The events are published by NOTIFY, so every worker (its LISTEN connection) gets them, the publishing one too.
+
+    The LISTEN connection is kept by a task: it is checked every check_interval seconds (a dropped connection
+    may not be noticed otherwise), when it is lost the subscriptions are ended (the notifications may be lost
+    until it is back, so the clients must poll) and it is reconnected with an exponential backoff
+    """
+
+    def __init__(
+            self,
+            queue_size: int,
+            database_url: str,
+            channel: str = REVIEW_EVENTS_CHANNEL,
+            check_interval: float = 30,
+            reconnect_delays: tuple[float, float] = (0.5, 30),
+    ) -> None:
+
+        super().__init__(queue_size)
+
+        # asyncpg takes a libpq url, without the sqlalchemy driver
+        self.database_url = make_url(database_url).set(drivername='postgresql').render_as_string(hide_password=False)
+        self.channel = channel
+        self.check_interval = check_interval
+        self.reconnect_delays = reconnect_delays
+
+        self._connection: asyncpg.Connection | None = None
+        # asyncpg does not allow concurrent queries on a connection
+        self._lock = Lock()
+        self._task: Task | None = None
+
+    @property
+    def connected(self) -> bool:
+        return self._connection is not None and not self._connection.is_closed()
+
+    async def start(self, timeout: float = 10) -> None:
+        """
+        Start keeping the connection, wait for it at most timeout seconds (else it is connected later)
+        """
+
+        connected = Event()
+
+        self._task = create_task(self._keep_connection(connected))
+
+        with suppress(TimeoutError):
+            await wait_for(connected.wait(), timeout)
+
+    async def stop(self) -> None:
+
+        if self._task is not None:
+            self._task.cancel()
+
+            with suppress(CancelledError):
+                await self._task
+
+            self._task = None
+
+    async def publish(self, event: dict) -> None:
+
+        if not self.connected:
+            logger.error(f'The {self.channel} events are not published, the broadcaster is not connected')
+            return
+
+        async with self._lock:
+            await self._connection.execute('SELECT pg_notify($1, $2)', self.channel, dumps(event).decode())
+
+    def _on_notification(self, _: asyncpg.Connection, __: int, ___: str, payload: str) -> None:
+        self._fan_out(loads(payload))
+
+    async def _connect(self) -> asyncpg.Connection:
+
+        delay, max_delay = self.reconnect_delays
+
+        while True:
+
+            try:
+                connection = await asyncpg.connect(self.database_url, timeout=10)
+                await connection.add_listener(self.channel, self._on_notification)
+                return connection
+
+            except (OSError, TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError) as error:
+                logger.error(f'The {self.channel} broadcaster is not connected ({error!r}), retry in {delay}s')
+
+            await sleep(delay)
+
+            delay = min(delay * 2, max_delay)
+
+    async def _keep_connection(self, connected: Event) -> None:
+
+        while True:
+
+            connection = await self._connect()
+
+            lost = Event()
+            connection.add_termination_listener(lambda _: lost.set())
+
+            self._connection = connection
+            connected.set()
+
+            try:
+                while not lost.is_set():
+
+                    with suppress(TimeoutError):
+                        await wait_for(lost.wait(), self.check_interval)
+                        continue
+
+                    async with self._lock:
+                        await connection.fetchval('SELECT 1', timeout=self.check_interval)
+
+            except (OSError, TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError) as error:
+                logger.error(f'The {self.channel} broadcaster connection check failed ({error!r})')
+
+            finally:
+                self._connection = None
+                connection.terminate()
+
+                # the notifications may be lost until the connection is back
+                self._end_subscriptions()
+
+            logger.error(f'The {self.channel} broadcaster connection is lost, reconnecting')
+
+
+def make_broadcaster() -> Broadcaster:
+
+    if SETTINGS.BROADCAST_BACKEND == 'postgres':
+        return PostgresBroadcaster(SETTINGS.BROADCAST_QUEUE_SIZE, DATABASE_URL)
+
+    return Broadcaster(SETTINGS.BROADCAST_QUEUE_SIZE)
+
+
+broadcaster = make_broadcaster()
+
+
+async def publish_review_available(reason: str, creators_ids: set[int]) -> None:
+    """
+    Notify the reviewers that the p2p requests of the creators can be reviewed (reason: created or released),
+    without the creators if there are too many of them (then the event is for every reviewer)
+    """
+
+    await broadcaster.publish({
+        'reason': reason,
+        'creators_ids': sorted(creators_ids) if len(creators_ids) <= MAX_EVENT_CREATORS else None,
+    })
+
+
+def format_sse(event: str, data: dict) -> str:
+    return f'event: {event}\ndata: {dumps(data).decode()}\n\n'
@@ -0,0 +1,155 @@
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from typing import Any, Hashable
+
+from core.config import get_settings
+
+
+SETTINGS = get_settings()
+
+
+class TTLCache:
+    """
+    Thread safe in-process LRU cache, every value lives no longer than ttl seconds.
+    Counts hits and misses. It is per process, so with several workers a value can be stale up to ttl seconds
+    """
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+
+        self.max_size = max_size
+        self.ttl = ttl
+
+        self.hits = 0
+        self.misses = 0
+
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+
+        with self._lock:
+
+            item = self._data.get(key)
+
+            if item is None or item[0] <= monotonic():
+
+                if item is not None:
+                    del self._data[key]
+
+                self.misses += 1
+
+                return default
+
+            self._data.move_to_end(key)
+
+            self.hits += 1
+
+            return item[1]
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None) -> None:
+
+        expires_at = monotonic() + (self.ttl if ttl is None else ttl)
+
+        with self._lock:
+
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    @property
+    def hit_ratio(self) -> float:
+        requests_number = self.hits + self.misses
+        return self.hits / requests_number if requests_number else 0.0
+
+    @property
+    def stats(self) -> dict[str, int | float]:
+        return {'size': len(self), 'hits': self.hits, 'misses': self.misses, 'hit_ratio': self.hit_ratio}
+
+
+class TokenDenyList(TTLCache):
+    """
+    TTLCache of revocation times which never evicts the values before their ttl (an evicted revocation would make
+    the revoked tokens valid again). A revocation which does not fit max_size is not kept, instead the tokens
+    issued before it are not trusted (is_complete) until they all expire, they are checked by the database
+    """
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+
+        super().__init__(max_size, ttl)
+
+        self.overflows = 0
+
+        # the time of the last not kept revocation and the monotonic time its tokens expire
+        self._overflowed_at = 0.0
+        self._overflow_expires_at = 0.0
+
+    def set(self, key: Hashable, value: float, ttl: float | None = None) -> None:
+
+        now = monotonic()
+
+        with self._lock:
+
+            if len(self._data) >= self.max_size and key not in self._data:
+                self._data = OrderedDict((k, item) for k, item in self._data.items() if item[0] > now)
+
+            if len(self._data) >= self.max_size and key not in self._data:
+                self.overflows += 1
+                self._overflowed_at = max(self._overflowed_at, value)
+                self._overflow_expires_at = now + (self.ttl if ttl is None else ttl)
+                return
+
+            self._data[key] = (now + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+
+    def clear(self) -> None:
+
+        super().clear()
+
+        self._overflowed_at = 0.0
+        self._overflow_expires_at = 0.0
+
+    def is_complete(self, issued_at: float) -> bool:
+        """
+        False if a revocation of a token issued at issued_at may be not kept
+        """
+        return self._overflow_expires_at <= monotonic() or issued_at > self._overflowed_at
+
+    @property
+    def stats(self) -> dict[str, int | float]:
+        return super().stats | {'overflows': self.overflows}
+
+
+# username -> detached models.User, filled by the login_manager user loader, crud invalidates it on user changes
+# only in its process, so the other workers see them in USER_CACHE_TTL_SECONDS (see core.config.set_workers_defaults)
+user_cache = TTLCache(SETTINGS.USER_CACHE_MAX_SIZE, SETTINGS.USER_CACHE_TTL_SECONDS)
+
+# user id -> time of the revocation of all the user stateless access tokens issued before it (see STATELESS_AUTH).
+# Values live as long as the tokens, so the deny-list stays small; it is per process, so STATELESS_AUTH needs
+# one worker (see core.config.set_workers_defaults)
+token_deny_list = TokenDenyList(
+    SETTINGS.TOKEN_DENY_LIST_MAX_SIZE, SETTINGS.STATELESS_ACCESS_TOKEN_EXPIRE_MINUTES * 60
+)
+
+# sha256 digest of an access token -> its verified payload, it lives until the token exp (see LoginManager._get_payload)
+token_payload_cache = TTLCache(SETTINGS.TOKEN_PAYLOAD_CACHE_MAX_SIZE, SETTINGS.ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+
+# all the caches by name, for the stats
+CACHES: dict[str, TTLCache] = {
+    'user': user_cache,
+    'token_deny_list': token_deny_list,
+    'token_payload': token_payload_cache,
+}
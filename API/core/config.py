@@ -1,6 +1,7 @@
-from os import environ
+from os import cpu_count, environ
 from functools import cache
 from pathlib import Path
+from typing import Literal
 
 from dotenv import load_dotenv
 from pydantic import PostgresDsn, BaseModel, ConfigDict, ValidationError
@@ -13,6 +14,7 @@ OAUTH2_SCHEME_SCOPES = {
     'me': 'can see the logged in user profile',
     'register': 'can register new users',
     'p2p_request': 'can interact with p2p_request',
+    'admin': 'can manage the data of all users',
 }
 
 
@@ -25,6 +27,81 @@ class BaseSettings(BaseModel):
     TOKEN_URL: str
     DEBUG: bool
     DATABASE_URL_TEST: PostgresDsn | None = None
+    ASYNC_DATABASE: bool = False  # True - asyncpg engine and AsyncSession in routers, False - psycopg2 and Session
+    # True - the access token carries the user data and scopes ids, authorization does not query the database
+    STATELESS_AUTH: bool = False
+    STATELESS_ACCESS_TOKEN_EXPIRE_MINUTES: float = 15  # stateless tokens are revoked only in-process, keep it short
+    TOKEN_DENY_LIST_MAX_SIZE: int = 100000
+    TOKEN_PAYLOAD_CACHE_MAX_SIZE: int = 10000  # verified access tokens payloads, they live until the tokens expire
+    DEFAULT_USER_SCOPES: list[str] = ['me', 'p2p_request']  # scopes of the users created in bulk
+    USERS_BULK_CREATE_BATCH_SIZE: int = 500  # users inserted by one statement
+    P2P_REQUESTS_BULK_CREATE_BATCH_SIZE: int = 1000  # p2p requests inserted by one statement
+    PAGE_DEFAULT_SIZE: int = 50  # items of a listing page if the limit is not set
+    PAGE_MAX_SIZE: int = 500
+    EXPORT_BATCH_SIZE: int = 1000  # rows fetched from the server-side cursor and sent as one chunk by the exports
+    USER_CACHE_MAX_SIZE: int = 1024
+    # a change of a user is seen by the other workers (and after utils.py) only when its cached copy expires,
+    # so it is the window in which they authorize a deactivated user, None - 60 with one worker, else 5
+    USER_CACHE_TTL_SECONDS: float | None = None
+    # per worker, 0 - hash passwords in the threadpool, None - 2 with one worker, else 0 (the workers use the CPUs)
+    PASSWORD_HASHING_PROCESSES: int | None = None
+    # new passwords are hashed with the first scheme, the others are only verified (and rehashed on login)
+    PASSWORD_HASHING_SCHEMES: list[str] = ['bcrypt']
+    # the work factors, hashes with other work factors are rehashed on login too
+    PASSWORD_BCRYPT_ROUNDS: int = 12
+    PASSWORD_ARGON2_TIME_COST: int = 2
+    PASSWORD_ARGON2_MEMORY_COST: int = 102400  # KiB
+    # with DEBUG, a statement executed this number of times by one request is logged as a possible N+1
+    N_PLUS_ONE_THRESHOLD: int = 10
+    LOG_FORMAT: Literal['text', 'json'] = 'text'
+    LOG_INFO_SAMPLE_RATE: float = 1.0  # the share of the INFO records logged, warnings and errors are always logged
+    # the records waiting for the logging thread, the new ones are dropped if it is full (the disk stalls)
+    LOG_QUEUE_MAX_SIZE: int = 10000
+    # the production runner (server.py)
+    WEB_WORKERS: int = 0  # processes, 0 - one per CPU
+    WEB_HOST: str = '0.0.0.0'
+    WEB_PORT: int = 8000
+    WEB_LOOP: Literal['auto', 'asyncio', 'uvloop'] = 'uvloop'
+    WEB_HTTP: Literal['auto', 'h11', 'httptools'] = 'httptools'
+    WEB_THREADPOOL_SIZE: int = 40  # threads of every worker for the sync routes, dependencies and sessions
+    # seconds, more than the nginx upstream keepalive_timeout, so nginx does not reuse the connections closed by us
+    WEB_KEEP_ALIVE_TIMEOUT: int = 75
+    WEB_GRACEFUL_TIMEOUT: int = 30  # seconds the workers have to finish the requests on shutdown
+    WEB_FORWARDED_ALLOW_IPS: str = '127.0.0.1'  # the proxies trusted with X-Forwarded-For (the nginx address)
+    # the clients of /metrics and /caches (Prometheus scrapes the workers directly, nginx does not pass them)
+    INTERNAL_NETWORKS: list[str] = ['127.0.0.0/8', '10.0.0.0/8', '172.16.0.0/12', '192.168.0.0/16', '::1/128']
+    REVIEW_QUEUE_DEPTH_TTL_SECONDS: float = 5  # the pending p2p requests are counted once in it, not on every scrape
+    # the connections of all the workers must fit into the postgres max_connections
+    DATABASE_MAX_CONNECTIONS: int = 100
+    DATABASE_RESERVED_CONNECTIONS: int = 10  # for the migrations, utils.py, psql and the superuser reserved ones
+    # per worker and for the engine of the routers, None - from the connections budget
+    DATABASE_POOL_SIZE: int | None = None
+    DATABASE_MAX_OVERFLOW: int | None = None
+    # the response encodings in the order of preference, br needs the brotli package, [] - no compression
+    COMPRESSION_ENCODINGS: list[str] = ['br', 'gzip']
+    COMPRESSION_MINIMUM_SIZE: int = 1024  # bytes, the smaller responses are not compressed
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 4
+    RATE_LIMIT_ENABLED: bool = True
+    # memory - the buckets of every worker, postgres - shared by the workers (one upsert per limited request)
+    RATE_LIMIT_BACKEND: Literal['memory', 'postgres'] = 'memory'
+    # limit name -> (requests per minute, burst), the buckets are per IP address (_ip) or per username (_username)
+    RATE_LIMITS: dict[str, tuple[float, int]] = {
+        'login_ip': (30, 10),
+        'login_username': (10, 5),
+        'write_ip': (60, 20),
+        'write_username': (30, 10),
+    }
+    RATE_LIMIT_MAX_KEYS: int = 100000  # the buckets kept in memory, the least recently used are evicted
+    # the postgres buckets taken by a worker between the deletions of the refilled ones (they are full again)
+    RATE_LIMIT_CLEANUP_INTERVAL: int = 1000
+    # the review events (GET /p2p_request/review/events), memory - only to the subscribers of the publishing worker
+    # (so only for one worker), postgres - to the subscribers of every worker (LISTEN/NOTIFY, one more connection
+    # per worker), auto - postgres if there are several workers
+    BROADCAST_BACKEND: Literal['auto', 'memory', 'postgres'] = 'auto'
+    BROADCAST_QUEUE_SIZE: int = 100  # the events waiting to be sent to a subscriber, the oldest are dropped over it
+    SSE_HEARTBEAT_SECONDS: float = 15  # a comment is sent if there are no events, so the proxies keep the connection
+    SSE_RETRY_SECONDS: int = 5  # the clients reconnect in it if the events are not available now
     IS_TEST: bool = False  # needed only for automated testing purposes
 
 
@@ -40,25 +117,35 @@ class Settings(BaseSettings):
     ORIGINS: list[str]
     BASE_DIR: Path = Path(__file__).resolve().parent.parent
     LOGS_DIR: Path = BASE_DIR / 'logs'
+    STATIC_DIR: Path = BASE_DIR / 'static'  # the docs assets, see core/docs.py
     LOGGING: dict = {
         'version': 1,
         'disable_existing_loggers': True,
         'formatters': {
-            'main': {
+            'text': {
                 'format': '[{levelname}] [{asctime}] path - "{pathname}" function - "{funcName}" message - "{message}"',
                 'style': '{',
             },
+            'json': {
+                '()': 'core.logging_utils.JSONFormatter',
+            },
+        },
+        'filters': {
+            'info_sampling': {
+                '()': 'core.logging_utils.InfoSamplingFilter',
+                'rate': 1.0,
+            },
         },
         'handlers': {
             'console': {
                 'level': 'INFO',
                 'class': 'logging.StreamHandler',
-                'formatter': 'main',
+                'formatter': 'text',
             },
             'file': {
                 'level': 'INFO',
                 'class': 'logging.handlers.RotatingFileHandler',
-                'formatter': 'main',
+                'formatter': 'text',
                 'filename': LOGS_DIR / 'info.log',
                 'maxBytes': 1024 * 1024 * 100,  # 100 Mb
                 'encoding': 'utf-8',
@@ -67,6 +154,7 @@ class Settings(BaseSettings):
         'loggers': {
             'main': {
                 'handlers': [],
+                'filters': ['info_sampling'],
                 'level': 'INFO',
             },
         },
@@ -76,6 +164,82 @@ class Settings(BaseSettings):
     OAUTH2_SCHEME_SCOPES: dict = OAUTH2_SCHEME_SCOPES
 
 
+# the pool of the engine not used by the routers (see ASYNC_DATABASE), it is used only on startup and by utils.py
+AUXILIARY_POOL_SIZE = 1
+AUXILIARY_MAX_OVERFLOW = 1
+
+
+def set_workers_defaults(settings: Settings) -> None:
+    """
+    Sets the workers number (if it is 0) and the settings depending on it (if they are auto).
+    Raises ValueError if the set ones do not work with several workers
+    """
+
+    if not settings.WEB_WORKERS:
+        # the password hashing processes of every worker are CPU-bound too
+        hashing_processes = settings.PASSWORD_HASHING_PROCESSES or 0
+        settings.WEB_WORKERS = max((cpu_count() or 1) // (1 + hashing_processes), 1)
+
+    if settings.PASSWORD_HASHING_PROCESSES is None:
+        settings.PASSWORD_HASHING_PROCESSES = 2 if settings.WEB_WORKERS == 1 else 0
+
+    # the other workers do not know about the changes, their copies must expire soon
+    if settings.USER_CACHE_TTL_SECONDS is None:
+        settings.USER_CACHE_TTL_SECONDS = 60 if settings.WEB_WORKERS == 1 else 5
+
+    if settings.BROADCAST_BACKEND == 'auto':
+        settings.BROADCAST_BACKEND = 'postgres' if settings.WEB_WORKERS > 1 else 'memory'
+
+    # the tokens of a changed user are revoked only in the worker which changed it
+    if settings.STATELESS_AUTH and settings.WEB_WORKERS > 1:
+        raise ValueError(
+            f'STATELESS_AUTH revokes the access tokens only in the worker process which changed the user, '
+            f'so the other {settings.WEB_WORKERS - 1} workers would accept them, set WEB_WORKERS to 1'
+        )
+
+    if settings.BROADCAST_BACKEND == 'memory' and settings.WEB_WORKERS > 1:
+        raise ValueError(
+            f'With the memory BROADCAST_BACKEND the review events of a worker are not sent to the subscribers '
+            f'of the other {settings.WEB_WORKERS - 1} workers, set it to postgres or WEB_WORKERS to 1'
+        )
+
+
+def set_database_pool_limits(settings: Settings) -> None:
+    """
+    Sets the routers engine pool limits of every worker (if they are not set) so that the connections of all
+    the workers fit into DATABASE_MAX_CONNECTIONS - DATABASE_RESERVED_CONNECTIONS.
+    Raises ValueError if the set limits do not fit
+    """
+
+    connections = settings.DATABASE_MAX_CONNECTIONS - settings.DATABASE_RESERVED_CONNECTIONS
+    # the auxiliary engine pool and the LISTEN connection of the postgres broadcaster (see core/broadcast.py)
+    auxiliary_connections = (
+        AUXILIARY_POOL_SIZE + AUXILIARY_MAX_OVERFLOW + (settings.BROADCAST_BACKEND == 'postgres')
+    )
+    worker_connections = connections // settings.WEB_WORKERS - auxiliary_connections
+
+    # the sync routes can not use more connections than threads
+    if not settings.ASYNC_DATABASE:
+        worker_connections = min(worker_connections, settings.WEB_THREADPOOL_SIZE)
+
+    if settings.DATABASE_POOL_SIZE is None:
+        settings.DATABASE_POOL_SIZE = max(worker_connections // 2, 1)
+
+    if settings.DATABASE_MAX_OVERFLOW is None:
+        settings.DATABASE_MAX_OVERFLOW = max(worker_connections - settings.DATABASE_POOL_SIZE, 0)
+
+    workers_connections = settings.WEB_WORKERS * (
+        settings.DATABASE_POOL_SIZE + settings.DATABASE_MAX_OVERFLOW + auxiliary_connections
+    )
+
+    if workers_connections > connections:
+        raise ValueError(
+            f'{settings.WEB_WORKERS} workers can open {workers_connections} database connections, but only '
+            f'{connections} are available, decrease WEB_WORKERS, DATABASE_POOL_SIZE or DATABASE_MAX_OVERFLOW '
+            f'or increase DATABASE_MAX_CONNECTIONS'
+        )
+
+
 @cache
 def get_settings() -> Settings:
 
@@ -91,6 +255,13 @@ def get_settings() -> Settings:
     settings = Settings(ORIGINS=origins, OAUTH2_SCHEME=oauth2_scheme, **raw_settings.model_dump())
 
     settings.LOGGING['loggers']['main']['handlers'] = ['console'] if settings.DEBUG else ['file']
+    settings.LOGGING['filters']['info_sampling']['rate'] = settings.LOG_INFO_SAMPLE_RATE
+
+    for handler in settings.LOGGING['handlers'].values():
+        handler['formatter'] = settings.LOG_FORMAT
+
+    set_workers_defaults(settings)
+    set_database_pool_limits(settings)
 
     if settings.IS_TEST and not settings.DATABASE_URL_TEST:
         raise ValidationError('To run tests, you need to set the DATABASE_URL_TEST environment variable')
@@ -0,0 +1,147 @@
+"""
+The OpenAPI document and the docs pages (rapidoc, swagger and redoc) built once (on startup or on the first request) with their
+precompressed variants. The rapidoc script is served from STATIC_DIR if it is downloaded there
+(python utils.py download_docs_assets, the docker image downloads it on build), else the page loads it from unpkg
+"""
+from gzip import compress
+from urllib.request import urlopen
+
+from fastapi import FastAPI, Request
+from fastapi.openapi.docs import get_redoc_html, get_swagger_ui_html, get_swagger_ui_oauth2_redirect_html
+from fastapi.responses import Response
+from orjson import dumps
+
+from core.config import get_settings
+from core.get_logger import get_logger
+from core.middlewares import choose_encoding, make_etag
+from core.responses import make_not_modified_response
+
+try:
+    import brotli
+except ImportError:
+    # optional, without it only the gzip variants are made
+    brotli = None
+
+
+SETTINGS = get_settings()
+
+logger = get_logger('main')
+
+SWAGGER_OAUTH2_REDIRECT_URL = '/docs/oauth2-redirect'
+
+RAPIDOC_FILENAME = 'rapidoc-min.js'
+RAPIDOC_URL = f'https://unpkg.com/rapidoc@9.3.4/dist/{RAPIDOC_FILENAME}'
+
+# the documents change only with a deploy, so the clients revalidate them (cheap with ETag),
+# the static assets urls have their version, so they are cached for a year
+DOCUMENT_CACHE_CONTROL = 'no-cache'
+STATIC_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+RAPIDOC_HTML = """<!doctype html>
+<html>
+    <head>
+        <meta charset="utf-8">
+        <script type="module" src="{script_url}"></script>
+    </head>
+    <body>
+        <rapi-doc spec-url="{openapi_url}"></rapi-doc>
+    </body>
+</html>
+"""
+
+
+class StaticAsset:
+    """
+    A body with its compressed variants (the best compression, they are made once) and their ETags
+    """
+
+    def __init__(self, body: bytes, media_type: str, cache_control: str) -> None:
+
+        self.media_type = media_type
+        self.cache_control = cache_control
+
+        self.variants = {'identity': body, 'gzip': compress(body, compresslevel=9, mtime=0)}
+
+        if brotli is not None:
+            self.variants['br'] = brotli.compress(body, quality=11)
+
+        self.etags = {encoding: make_etag(variant) for encoding, variant in self.variants.items()}
+
+    @property
+    def version(self) -> str:
+        return self.etags['identity'][1:9]
+
+    def get_response(self, request: Request) -> Response:
+        """
+        The variant accepted by the client, or 304 if the client already has it (If-None-Match)
+        """
+
+        encoding = choose_encoding(request.headers.get('accept-encoding', ''), self.variants) or 'identity'
+
+        headers = {'Cache-Control': self.cache_control, 'Vary': 'Accept-Encoding'}
+
+        if not_modified_response := make_not_modified_response(request, self.etags[encoding], headers):
+            return not_modified_response
+
+        headers['ETag'] = self.etags[encoding]
+
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+
+        return Response(self.variants[encoding], media_type=self.media_type, headers=headers)
+
+
+# the name of an asset -> the asset, see get_assets
+_assets: dict[str, StaticAsset] = {}
+
+
+def download_rapidoc() -> None:
+    SETTINGS.STATIC_DIR.mkdir(exist_ok=True)
+    with urlopen(RAPIDOC_URL, timeout=60) as response:
+        (SETTINGS.STATIC_DIR / RAPIDOC_FILENAME).write_bytes(response.read())
+
+
+def get_assets(app: FastAPI) -> dict[str, StaticAsset]:
+    """
+    The assets by name: openapi, the pages (rapidoc, docs - swagger, its oauth2 redirect page, redoc)
+    and the static files (static/<file name>)
+    """
+
+    if _assets:
+        return _assets
+
+    assets = {'openapi': StaticAsset(dumps(app.openapi()), 'application/json', DOCUMENT_CACHE_CONTROL)}
+
+    if (rapidoc_path := SETTINGS.STATIC_DIR / RAPIDOC_FILENAME).exists():
+        script = assets[f'static/{RAPIDOC_FILENAME}'] = StaticAsset(
+            rapidoc_path.read_bytes(), 'text/javascript; charset=utf-8', STATIC_CACHE_CONTROL
+        )
+        script_url = f'/static/{RAPIDOC_FILENAME}?v={script.version}'
+
+    else:
+        logger.warning(f'{rapidoc_path} is not found, the docs page loads rapidoc from {RAPIDOC_URL}')
+        script_url = RAPIDOC_URL
+
+    assets['rapidoc'] = StaticAsset(
+        RAPIDOC_HTML.format(script_url=script_url, openapi_url=SETTINGS.OPENAPI_URL).encode(),
+        'text/html; charset=utf-8',
+        DOCUMENT_CACHE_CONTROL,
+    )
+
+    # the same pages FastAPI serves by default (their scripts are loaded from jsdelivr)
+    pages = {
+        'docs': get_swagger_ui_html(
+            openapi_url=SETTINGS.OPENAPI_URL,
+            title=f'{app.title} - Swagger UI',
+            oauth2_redirect_url=SWAGGER_OAUTH2_REDIRECT_URL,
+        ),
+        'docs/oauth2-redirect': get_swagger_ui_oauth2_redirect_html(),
+        'redoc': get_redoc_html(openapi_url=SETTINGS.OPENAPI_URL, title=f'{app.title} - ReDoc'),
+    }
+
+    for name, page in pages.items():
+        assets[name] = StaticAsset(page.body, 'text/html; charset=utf-8', DOCUMENT_CACHE_CONTROL)
+
+    _assets.update(assets)
+
+    return _assets
@@ -0,0 +1,80 @@
+from csv import writer
+from datetime import datetime
+from enum import Enum
+from io import StringIO
+from typing import Any, AsyncIterable, AsyncIterator, Iterable, Iterator, Mapping, Sequence
+
+from orjson import dumps
+
+
+class ExportFormat(str, Enum):
+    NDJSON = 'ndjson'
+    CSV = 'csv'
+
+
+EXPORT_MEDIA_TYPES = {
+    ExportFormat.NDJSON: 'application/x-ndjson',
+    ExportFormat.CSV: 'text/csv',
+}
+
+
+def _to_export_value(value: Any) -> Any:
+
+    if isinstance(value, datetime):
+        return value.isoformat()
+
+    if isinstance(value, Enum):
+        return value.value
+
+    return value
+
+
+def format_rows(rows: Sequence[Mapping[str, Any]], export_format: ExportFormat) -> str:
+    """
+    One chunk of an export: the rows as ndjson lines or csv rows (without the header)
+    """
+
+    if export_format == ExportFormat.NDJSON:
+        # orjson serializes the dates and the enums like _to_export_value
+        return b''.join(dumps(dict(row)) + b'\n' for row in rows).decode()
+
+    buffer = StringIO()
+
+    writer(buffer).writerows([_to_export_value(value) for value in row.values()] for row in rows)
+
+    return buffer.getvalue()
+
+
+def format_header(columns: Sequence[str], export_format: ExportFormat) -> str:
+
+    if export_format == ExportFormat.NDJSON:
+        return ''
+
+    buffer = StringIO()
+
+    writer(buffer).writerow(columns)
+
+    return buffer.getvalue()
+
+
+def iterate_export(
+        partitions: Iterable[Sequence[Mapping[str, Any]]], columns: Sequence[str], export_format: ExportFormat
+) -> Iterator[str]:
+    """
+    The export chunks, one per rows partition (see BaseCrud.stream)
+    """
+
+    yield format_header(columns, export_format)
+
+    for partition in partitions:
+        yield format_rows(partition, export_format)
+
+
+async def async_iterate_export(
+        partitions: AsyncIterable[Sequence[Mapping[str, Any]]], columns: Sequence[str], export_format: ExportFormat
+) -> AsyncIterator[str]:
+
+    yield format_header(columns, export_format)
+
+    async for partition in partitions:
+        yield format_rows(partition, export_format)
@@ -1,13 +1,26 @@
+from atexit import register
 from logging import getLogger
 from logging.config import dictConfig
+from queue import Queue
 
 from core.config import get_settings
+from core.logging_utils import move_handlers_to_listener
 
 
 SETTINGS = get_settings()
 
+
+# the file handler does not create the directory (in docker it is a volume)
+SETTINGS.LOGS_DIR.mkdir(exist_ok=True)
+
 dictConfig(SETTINGS.LOGGING)
 
+listener = move_handlers_to_listener(list(SETTINGS.LOGGING['loggers']), Queue(SETTINGS.LOG_QUEUE_MAX_SIZE))
+listener.start()
+
+# writes the records left in the queue
+register(listener.stop)
+
 
 def get_logger(name):
     return getLogger(name)
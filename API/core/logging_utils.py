@@ -0,0 +1,110 @@
+from copy import copy
+from datetime import datetime, timezone
+from json import dumps
+from logging import Filter, Formatter, Handler, INFO, LogRecord, getLogger
+from logging.handlers import QueueHandler, QueueListener
+from queue import Full, Queue
+from random import random
+
+
+# the attributes of every record, the others are passed by extra
+_RECORD_ATTRIBUTES = frozenset(vars(LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+
+class JSONFormatter(Formatter):
+    """
+    A record as one json line, with the fields passed by extra (like the ones of QueryStatsMiddleware)
+    """
+
+    def format(self, record: LogRecord) -> str:
+
+        data = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'path': record.pathname,
+            'function': record.funcName,
+            'message': record.getMessage(),
+        }
+
+        data |= {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES}
+
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+
+        if record.exc_text:
+            data['exception'] = record.exc_text
+
+        return dumps(data, default=str, ensure_ascii=False)
+
+
+class InfoSamplingFilter(Filter):
+    """
+    Passes only the rate share of the INFO (and lower) records, for the high-volume events like the requests logs
+    """
+
+    def __init__(self, rate: float = 1.0) -> None:
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: LogRecord) -> bool:
+        return record.levelno > INFO or self.rate >= 1 or random() < self.rate
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Puts the records into a bounded queue for QueueListener, the logging code never waits for the handlers I/O.
+    If the queue is full (the handlers are stuck), the records are dropped and counted
+    """
+
+    def __init__(self, queue: Queue) -> None:
+        super().__init__(queue)
+        self.dropped_records = 0
+
+    def prepare(self, record: LogRecord) -> LogRecord:
+        """
+        Unlike QueueHandler.prepare does not format the record, the handlers formatters get it as it is,
+        only with the arguments merged and the traceback rendered (they can not be pickled or shared between threads)
+        """
+
+        record = copy(record)
+
+        record.msg = record.getMessage()
+        record.args = None
+
+        if record.exc_info:
+            record.exc_text = record.exc_text or Formatter().formatException(record.exc_info)
+            record.exc_info = None
+
+        return record
+
+    def enqueue(self, record: LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+
+        except Full:
+            self.dropped_records += 1
+
+
+def move_handlers_to_listener(logger_names: list[str], queue: Queue) -> QueueListener:
+    """
+    Replaces the handlers of the loggers by one DroppingQueueHandler, the handlers are run by the returned listener
+    in its thread
+    """
+
+    handlers: list[Handler] = []
+
+    queue_handler = DroppingQueueHandler(queue)
+
+    for logger_name in logger_names:
+
+        logger = getLogger(logger_name)
+
+        handlers += [i for i in logger.handlers if i not in handlers]
+
+        for handler in logger.handlers[:]:
+            logger.removeHandler(handler)
+
+        logger.addHandler(queue_handler)
+
+    return QueueListener(queue, *handlers, respect_handler_level=True)
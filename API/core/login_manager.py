@@ -1,13 +1,115 @@
 from datetime import timedelta
+from hashlib import sha256
+from time import time
 
-from fastapi_login import LoginManager
+from fastapi import Depends, Request
+from fastapi.security import SecurityScopes
+from fastapi_login import LoginManager as BaseLoginManager
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from core import schemas
 from core.config import get_settings
+from core.cache import token_deny_list, token_payload_cache
+from sql import models
+from sql.crud import scope_registry
+from sql.database import get_route_db
 
 
 SETTINGS = get_settings()
 
 
+class LoginManager(BaseLoginManager):
+    """
+    Passes the request database session to the user loader, so the user loader and the route share one session
+    (and one pooled connection) per request. The user loader must be async: async def loader(identifier, db).
+
+    With STATELESS_AUTH the user is built from the access token claims, without the user loader.
+    Verified tokens payloads are cached until the tokens expire, so a client repeating its token skips the signature check
+    """
+
+    async def __call__(
+            self,
+            request: Request,
+            security_scopes: SecurityScopes = None,
+            db: Session | AsyncSession = Depends(get_route_db),
+    ):
+
+        payload = self._get_payload(await self._get_token(request))
+
+        if not self._has_scopes(payload, security_scopes):
+            raise self.not_authenticated_exception
+
+        if (user_identifier := payload.get('sub')) is None:
+            raise self.not_authenticated_exception
+
+        # tokens issued before STATELESS_AUTH was turned on do not have the user claims, the user of a token
+        # which revocation may be not kept by the deny-list (it is full) is loaded from the database
+        if SETTINGS.STATELESS_AUTH and 'uid' in payload and token_deny_list.is_complete(payload['iat']):
+            return self._get_token_user(payload)
+
+        if (user := await self._user_callback(user_identifier, db)) is None:
+            raise self.not_authenticated_exception
+
+        return user
+
+    def _get_payload(self, token: str) -> dict:
+
+        # the digest, so the cache does not keep the tokens themselves
+        token_digest = sha256(token.encode()).digest()
+
+        if (payload := token_payload_cache.get(token_digest)) is not None:
+            return payload
+
+        payload = super()._get_payload(token)
+
+        # pyjwt rejects expired tokens, exp is set by create_access_token
+        if (ttl := payload.get('exp', 0) - time()) > 0:
+            token_payload_cache.set(token_digest, payload, ttl=ttl)
+
+        return payload
+
+    def _get_token_user(self, payload: dict) -> schemas.User:
+
+        revoked_at = token_deny_list.get(payload['uid'])
+
+        if revoked_at is not None and payload['iat'] <= revoked_at:
+            raise self.not_authenticated_exception
+
+        return schemas.User(
+            id=payload['uid'],
+            username=payload['sub'],
+            discord_id=payload['discord_id'],
+            is_active=payload['active'],
+            available_scopes=[i for i in map(scope_registry.get_by_id, payload['scope_ids']) if i is not None],
+        )
+
+    def create_user_access_token(
+            self, user: models.User, scopes: list[str], user_scopes: list[schemas.Scope]
+    ) -> str:
+        """
+        Create an access token with the requested scopes, with STATELESS_AUTH it carries the user claims too
+        """
+
+        data = {'sub': user.username, 'scopes': scopes}
+
+        if not SETTINGS.STATELESS_AUTH:
+            return self.create_access_token(data=data)
+
+        data |= {
+            'uid': user.id,
+            'discord_id': user.discord_id,
+            'active': user.is_active,
+            'scope_ids': [i.id for i in user_scopes],
+            # not rounded, the deny-list compares it with the revocation time
+            'iat': time(),
+        }
+
+        return self.create_access_token(
+            data=data, expires=timedelta(minutes=SETTINGS.STATELESS_ACCESS_TOKEN_EXPIRE_MINUTES)
+        )
+
+
 login_manager = LoginManager(
     SETTINGS.SECRET_KEY,
     algorithm=SETTINGS.ALGORITHM,
@@ -1,12 +1,19 @@
 from contextlib import asynccontextmanager
 
+from anyio import to_thread
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 from sql import crud
-from sql.database import get_db, get_db_not_dependency
-from . import schemas
+from sql.database import get_db_not_dependency
 from .config import get_settings
+from .passwords import start_password_executor, shutdown_password_executor
+from .middlewares import (
+    CompressionMiddleware, ETagMiddleware, MetricsMiddleware, ProbeNotFoundMiddleware, QueryStatsMiddleware
+)
+from . import docs
+from .broadcast import broadcaster
 from routers import system, users, p2p_request
 
 
@@ -16,16 +23,26 @@ SETTINGS = get_settings()
 @asynccontextmanager
 async def lifespan(_: FastAPI):
 
-    db = get_db_not_dependency()
+    # seeds the scopes and loads the scope_registry
+    crud.ScopeCrud(get_db_not_dependency()).create_many_if_not_exist(SETTINGS.OAUTH2_SCHEME_SCOPES)
+
+    start_password_executor()
+
+    # the threadpool of the sync routes and dependencies and of run_in_threadpool
+    to_thread.current_default_thread_limiter().total_tokens = SETTINGS.WEB_THREADPOOL_SIZE
 
-    all_scopes = [str(i) for i in crud.ScopeCrud(db).get_many()]
+    # the OpenAPI document and the docs page with their compressed variants
+    docs.get_assets(app)
 
-    for scope_name in SETTINGS.OAUTH2_SCHEME_SCOPES:
-        if scope_name not in all_scopes:
-            crud.ScopeCrud(db).create(schemas.ScopeCreate(name=scope_name))
+    # the LISTEN connection of the postgres broadcaster
+    await broadcaster.start()
 
     yield
 
+    await broadcaster.stop()
+
+    shutdown_password_executor()
+
 
 tags_metadata = [
     {
@@ -44,8 +61,13 @@ app = FastAPI(
         'email': 'poni22poni23@yandex.ru',
     },
     openapi_tags=tags_metadata,
-    openapi_url=SETTINGS.OPENAPI_URL,
+    # the OpenAPI document and the docs pages (swagger, redoc) are built once and served by the system router
+    # (see core/docs.py), so FastAPI does not serve them
+    openapi_url=None,
+    docs_url=None,
+    redoc_url=None,
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 app.add_middleware(
@@ -56,6 +78,21 @@ app.add_middleware(
     allow_headers=['*'],
 )
 
+# the ETag is of the not compressed body, only of the read-only listings: /users/me and the docs answer 304
+# themselves before building the body, the others change the state or are not worth caching
+app.add_middleware(ETagMiddleware, paths={
+    '/p2p_request/mine',
+    '/p2p_request/pending',
+    '/p2p_request/all',
+    '/p2p_request/review/mine',
+    '/p2p_request/review/all',
+})
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(QueryStatsMiddleware)
+app.add_middleware(ProbeNotFoundMiddleware)
+# the outermost middleware, so it measures the others too
+app.add_middleware(MetricsMiddleware)
+
 
 app.include_router(users.router)
 app.include_router(p2p_request.router)
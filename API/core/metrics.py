@@ -0,0 +1,228 @@
+"""
+Minimal in-process metrics in the Prometheus text format (https://prometheus.io/docs/instrumenting/exposition_formats/).
+They are per process, so with several workers every worker has its own values
+"""
+from math import inf
+from threading import Lock
+from typing import Callable, Iterable, Iterator
+
+from core.cache import CACHES
+from sql.database import engine, async_engine
+
+
+# the latency buckets (seconds) of the histograms
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _format_value(value: float) -> str:
+    return '+Inf' if value == inf else repr(float(value))
+
+
+class Metric:
+    """
+    A metric with labels, the labels values are passed positionally in the labels_names order
+    """
+
+    type_name: str
+
+    def __init__(self, name: str, documentation: str, labels_names: Iterable[str] = ()) -> None:
+
+        self.name = name
+        self.documentation = documentation
+        self.labels_names = tuple(labels_names)
+
+        self._values: dict[tuple[str, ...], float] = {}
+        self._lock = Lock()
+
+    def _format_labels(self, labels_values: tuple[str, ...], extra_labels: dict[str, str] | None = None) -> str:
+
+        labels = dict(zip(self.labels_names, labels_values)) | (extra_labels or {})
+
+        if not labels:
+            return ''
+
+        return '{' + ','.join(f'{name}="{_escape(str(value))}"' for name, value in labels.items()) + '}'
+
+    def _collect_samples(self) -> Iterator[str]:
+        with self._lock:
+            for labels_values, value in self._values.items():
+                yield f'{self.name}{self._format_labels(labels_values)} {_format_value(value)}'
+
+    def collect(self) -> Iterator[str]:
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} {self.type_name}'
+        yield from self._collect_samples()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(Metric):
+    type_name = 'counter'
+
+    def inc(self, *labels_values: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels_values] = self._values.get(labels_values, 0) + amount
+
+    def set(self, value: float, *labels_values: str) -> None:
+        """
+        For the counts kept by other code (for example, the caches hits), set on a scrape
+        """
+        with self._lock:
+            self._values[labels_values] = value
+
+
+class Gauge(Metric):
+    type_name = 'gauge'
+
+    def set(self, value: float, *labels_values: str) -> None:
+        with self._lock:
+            self._values[labels_values] = value
+
+    def inc(self, *labels_values: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels_values] = self._values.get(labels_values, 0) + amount
+
+    def dec(self, *labels_values: str, amount: float = 1) -> None:
+        self.inc(*labels_values, amount=-amount)
+
+
+class Histogram(Metric):
+    type_name = 'histogram'
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            labels_names: Iterable[str] = (),
+            buckets: Iterable[float] = DEFAULT_BUCKETS,
+    ) -> None:
+
+        super().__init__(name, documentation, labels_names)
+
+        self.buckets = (*sorted(buckets), inf)
+
+        # labels values -> (the buckets counts (not cumulative), the sum)
+        self._observations: dict[tuple[str, ...], tuple[list[int], float]] = {}
+
+    def observe(self, value: float, *labels_values: str) -> None:
+
+        bucket_index = next(i for i, bucket in enumerate(self.buckets) if value <= bucket)
+
+        with self._lock:
+
+            counts, total = self._observations.get(labels_values) or ([0] * len(self.buckets), 0.0)
+
+            counts[bucket_index] += 1
+
+            self._observations[labels_values] = (counts, total + value)
+
+    def _collect_samples(self) -> Iterator[str]:
+        with self._lock:
+            for labels_values, (counts, total) in self._observations.items():
+
+                cumulative_count = 0
+
+                for bucket, count in zip(self.buckets, counts):
+                    cumulative_count += count
+                    labels = self._format_labels(labels_values, {'le': _format_value(bucket)})
+                    yield f'{self.name}_bucket{labels} {cumulative_count}'
+
+                yield f'{self.name}_sum{self._format_labels(labels_values)} {_format_value(total)}'
+                yield f'{self.name}_count{self._format_labels(labels_values)} {cumulative_count}'
+
+    def clear(self) -> None:
+        with self._lock:
+            self._observations.clear()
+
+
+class Registry:
+    """
+    The metrics to render and the collectors, functions that update the metrics which are read only on a scrape
+    """
+
+    def __init__(self) -> None:
+        self._metrics: list[Metric] = []
+        self._collectors: list[Callable[[], None]] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], None]) -> Callable[[], None]:
+        self._collectors.append(collector)
+        return collector
+
+    def render(self) -> str:
+
+        for collector in self._collectors:
+            collector()
+
+        return '\n'.join(line for metric in self._metrics for line in metric.collect()) + '\n'
+
+
+registry = Registry()
+
+HTTP_REQUESTS = registry.register(Counter(
+    'http_requests_total', 'Handled HTTP requests', ('method', 'route', 'status')
+))
+HTTP_REQUEST_DURATION = registry.register(Histogram(
+    'http_request_duration_seconds', 'HTTP requests latency', ('method', 'route')
+))
+HTTP_REQUESTS_IN_PROGRESS = registry.register(Gauge(
+    'http_requests_in_progress', 'HTTP requests being handled', ('method', 'route')
+))
+
+PASSWORD_HASHING_DURATION = registry.register(Histogram(
+    'password_hashing_seconds',
+    'Passwords hashing and verification time of the async code, with the wait for the password executor',
+    ('operation',),
+))
+
+REVIEW_QUEUE_DEPTH = registry.register(Gauge(
+    'p2p_review_queue_depth', 'P2P requests waiting for a review, updated on a scrape'
+))
+
+DB_POOL_SIZE = registry.register(Gauge('db_pool_size', 'Database connections pool size', ('engine',)))
+DB_POOL_CHECKED_OUT = registry.register(Gauge(
+    'db_pool_checked_out', 'Database connections checked out from the pool', ('engine',)
+))
+DB_POOL_OVERFLOW = registry.register(Gauge(
+    'db_pool_overflow', 'Database connections opened over the pool size', ('engine',)
+))
+
+CACHE_SIZE = registry.register(Gauge('cache_size', 'In-process cache entries', ('cache',)))
+CACHE_HITS = registry.register(Counter('cache_hits_total', 'In-process cache hits', ('cache',)))
+CACHE_MISSES = registry.register(Counter('cache_misses_total', 'In-process cache misses', ('cache',)))
+CACHE_HIT_RATIO = registry.register(Gauge('cache_hit_ratio', 'In-process cache hit ratio', ('cache',)))
+
+
+@registry.add_collector
+def collect_database_pools() -> None:
+    for engine_name, pool in (('sync', engine.pool), ('async', async_engine.sync_engine.pool)):
+
+        # NullPool (tests) has not these
+        if not hasattr(pool, 'checkedout'):
+            continue
+
+        DB_POOL_SIZE.set(pool.size(), engine_name)
+        DB_POOL_CHECKED_OUT.set(pool.checkedout(), engine_name)
+        DB_POOL_OVERFLOW.set(max(pool.overflow(), 0), engine_name)
+
+
+@registry.add_collector
+def collect_caches() -> None:
+    for cache_name, cache in CACHES.items():
+
+        stats = cache.stats
+
+        CACHE_SIZE.set(stats['size'], cache_name)
+        CACHE_HIT_RATIO.set(stats['hit_ratio'], cache_name)
+
+        CACHE_HITS.set(stats['hits'], cache_name)
+        CACHE_MISSES.set(stats['misses'], cache_name)
@@ -0,0 +1,402 @@
+from hashlib import blake2b
+from re import IGNORECASE, compile
+from time import perf_counter
+from typing import Container
+from zlib import DEFLATED, MAX_WBITS, Z_FINISH, Z_SYNC_FLUSH, compressobj
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from core.config import get_settings
+from core.get_logger import get_logger
+from core.metrics import HTTP_REQUESTS, HTTP_REQUEST_DURATION, HTTP_REQUESTS_IN_PROGRESS
+from sql.query_stats import QueryStats, current_query_stats
+
+
+try:
+    import brotli
+except ImportError:
+    # optional, without it the responses are compressed only with gzip
+    brotli = None
+
+
+SETTINGS = get_settings()
+
+logger = get_logger('main')
+
+
+def get_route_template(scope: Scope) -> str:
+    """
+    The path template of the route of the request (like the router matches it), the metrics are labeled by it,
+    not by the path, so the labels number does not depend on the requested paths. It is kept in the scope
+    """
+
+    if (route_template := scope.get('route_template')) is not None:
+        return route_template
+
+    scope['route_template'] = route_template = _match_route_template(scope)
+
+    return route_template
+
+
+def _match_route_template(scope: Scope) -> str:
+
+    partial_match_path = None
+
+    for route in scope['app'].router.routes:
+
+        match, _ = route.matches(scope)
+
+        if match == Match.FULL:
+            return route.path
+
+        if match == Match.PARTIAL and partial_match_path is None:
+            partial_match_path = route.path
+
+    return partial_match_path or 'unknown'
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware (without BaseHTTPMiddleware overhead) measuring the HTTP requests per route template:
+    the number by status, the latency (till the response is sent) and the requests in progress
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        labels = (scope['method'], get_route_template(scope))
+        status_code = 500
+
+        async def send_with_status(message: Message) -> None:
+
+            nonlocal status_code
+
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+
+            await send(message)
+
+        HTTP_REQUESTS_IN_PROGRESS.inc(*labels)
+        start_time = perf_counter()
+
+        try:
+            await self.app(scope, receive, send_with_status)
+
+        finally:
+            HTTP_REQUEST_DURATION.observe(perf_counter() - start_time, *labels)
+            HTTP_REQUESTS_IN_PROGRESS.dec(*labels)
+            HTTP_REQUESTS.inc(*labels, str(status_code))
+
+
+class QueryStatsMiddleware:
+    """
+    Counts the database queries of every request and their time (see sql.query_stats), adds them to
+    the Server-Timing header (the queries made till the response start) and logs them with the request.
+    With DEBUG warns about the statements repeated N_PLUS_ONE_THRESHOLD times (possible N+1 queries)
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        query_stats = QueryStats()
+        context_token = current_query_stats.set(query_stats)
+
+        status_code = 500
+        start_time = perf_counter()
+
+        async def send_with_server_timing(message: Message) -> None:
+
+            nonlocal status_code
+
+            if message['type'] == 'http.response.start':
+
+                status_code = message['status']
+
+                MutableHeaders(scope=message).append('Server-Timing', (
+                    f'db;dur={query_stats.duration * 1000:.1f};desc="{query_stats.count} queries", '
+                    f'app;dur={(perf_counter() - start_time) * 1000:.1f}'
+                ))
+
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_server_timing)
+
+        finally:
+            current_query_stats.reset(context_token)
+            self._log(scope, status_code, perf_counter() - start_time, query_stats)
+
+    @staticmethod
+    def _log(scope: Scope, status_code: int, duration: float, query_stats: QueryStats) -> None:
+
+        route_template = get_route_template(scope)
+
+        logger.info(
+            f'{scope["method"]} {route_template} {status_code} {duration * 1000:.1f}ms, '
+            f'{query_stats.count} db queries {query_stats.duration * 1000:.1f}ms',
+            extra={
+                'http_method': scope['method'],
+                'route': route_template,
+                'status_code': status_code,
+                'duration_ms': round(duration * 1000, 3),
+                'db_queries': query_stats.count,
+                'db_duration_ms': round(query_stats.duration * 1000, 3),
+            },
+        )
+
+        if not SETTINGS.DEBUG:
+            return
+
+        for statement, count in query_stats.get_repeated_statements(SETTINGS.N_PLUS_ONE_THRESHOLD):
+            logger.warning(
+                f'Possible N+1 queries: {scope["method"]} {route_template} executed {count} times: {statement}'
+            )
+
+
+def make_etag(body: bytes) -> str:
+    return f'"{blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def etag_matches(etag: str, if_none_match: str) -> bool:
+    """
+    The weak comparison of If-None-Match (RFC 9110), the compressed responses have the weak ETags
+    """
+    return if_none_match.strip() == '*' or etag in {i.strip().removeprefix('W/') for i in if_none_match.split(',')}
+
+
+class ETagMiddleware:
+    """
+    Adds the ETag of the body to the successful GET responses of the paths (not streamed, a set ETag is kept)
+    and answers 304 without the body if the client already has it (If-None-Match), so the body is not compressed
+    and sent again. The route runs anyway, so the routes with a cheap validator (known before the body is built)
+    answer 304 themselves (see core.responses.make_not_modified_response) and are not in the paths
+    """
+
+    def __init__(self, app: ASGIApp, paths: Container[str]) -> None:
+        self.app = app
+        self.paths = paths
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+
+        if scope['type'] != 'http' or scope['method'] not in ('GET', 'HEAD') or scope['path'] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        if_none_match = Headers(scope=scope).get('if-none-match')
+
+        # the start message waits for the first body message, the ETag is known only then
+        start_message: Message | None = None
+
+        async def send_with_etag(message: Message) -> None:
+
+            nonlocal start_message
+
+            if message['type'] == 'http.response.start' and message['status'] == 200:
+                start_message = message
+                return
+
+            if start_message is None:
+                await send(message)
+                return
+
+            response_start_message, start_message = start_message, None
+
+            if message.get('more_body', False):
+                await send(response_start_message)
+                await send(message)
+                return
+
+            headers = MutableHeaders(scope=response_start_message)
+
+            if (etag := headers.get('etag')) is None:
+                headers['ETag'] = etag = make_etag(message.get('body', b''))
+
+            if if_none_match and etag_matches(etag, if_none_match):
+
+                del headers['content-length']
+                del headers['content-type']
+
+                await send({'type': 'http.response.start', 'status': 304, 'headers': headers.raw})
+                await send({'type': 'http.response.body', 'body': b''})
+                return
+
+            await send(response_start_message)
+            await send(message)
+
+        await self.app(scope, receive, send_with_etag)
+
+
+# the content types worth to compress, the others (images, archives) are already compressed
+COMPRESSIBLE_CONTENT_TYPES = (
+    'text/', 'application/json', 'application/x-ndjson', 'application/javascript', 'application/xml', 'image/svg+xml'
+)
+
+
+class _GzipCompressor:
+
+    def __init__(self) -> None:
+        self._compressor = compressobj(SETTINGS.COMPRESSION_GZIP_LEVEL, DEFLATED, MAX_WBITS | 16)
+
+    def compress(self, data: bytes, finish: bool) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(Z_FINISH if finish else Z_SYNC_FLUSH)
+
+
+class _BrotliCompressor:
+
+    def __init__(self) -> None:
+        self._compressor = brotli.Compressor(quality=SETTINGS.COMPRESSION_BROTLI_QUALITY)
+
+    def compress(self, data: bytes, finish: bool) -> bytes:
+        return self._compressor.process(data) + (self._compressor.finish() if finish else self._compressor.flush())
+
+
+COMPRESSORS = {'gzip': _GzipCompressor} | ({'br': _BrotliCompressor} if brotli is not None else {})
+
+
+def choose_encoding(accept_encoding: str, available: Container[str] = COMPRESSORS) -> str | None:
+    """
+    The first of COMPRESSION_ENCODINGS available and accepted by the client (the q values are not compared,
+    only q=0 is respected)
+    """
+
+    accepted = set()
+
+    for coding in accept_encoding.lower().split(','):
+
+        name, _, parameters = coding.partition(';')
+
+        if parameters.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            accepted.add(name.strip())
+
+    return next((i for i in SETTINGS.COMPRESSION_ENCODINGS if i in available and i in accepted), None)
+
+
+class CompressionMiddleware:
+    """
+    Compresses the responses of the compressible content types with brotli (if it is installed) or gzip,
+    the ones smaller than COMPRESSION_MINIMUM_SIZE are sent as they are. The streamed responses are compressed
+    chunk by chunk, every chunk is flushed to the client at once
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+
+        if scope['type'] != 'http' or not (
+                encoding := choose_encoding(Headers(scope=scope).get('accept-encoding', ''))
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        start_message: Message | None = None
+        compressor: _GzipCompressor | _BrotliCompressor | None = None
+
+        async def send_compressed(message: Message) -> None:
+
+            nonlocal start_message, compressor
+
+            if message['type'] == 'http.response.start':
+
+                headers = Headers(raw=message['headers'])
+
+                if 'content-encoding' not in headers and headers.get('content-type', '').startswith(
+                        COMPRESSIBLE_CONTENT_TYPES
+                ):
+                    start_message = message
+                    return
+
+                await send(message)
+                return
+
+            if message['type'] != 'http.response.body':
+                await send(message)
+                return
+
+            body = message.get('body', b'')
+            more_body = message.get('more_body', False)
+
+            if start_message is not None:
+
+                response_start_message, start_message = start_message, None
+
+                headers = MutableHeaders(scope=response_start_message)
+                headers.add_vary_header('Accept-Encoding')
+
+                if not more_body and len(body) < SETTINGS.COMPRESSION_MINIMUM_SIZE:
+                    await send(response_start_message)
+                    await send(message)
+                    return
+
+                compressor = COMPRESSORS[encoding]()
+
+                headers['Content-Encoding'] = encoding
+
+                # the compressed body is another representation, its ETag is weak (like nginx does)
+                if (etag := headers.get('etag')) and not etag.startswith('W/'):
+                    headers['ETag'] = f'W/{etag}'
+
+                del headers['content-length']
+
+                if not more_body:
+                    body = compressor.compress(body, finish=True)
+                    headers['Content-Length'] = str(len(body))
+                    await send(response_start_message)
+                    await send({'type': 'http.response.body', 'body': body})
+                    return
+
+                await send(response_start_message)
+
+            if compressor is None:
+                await send(message)
+                return
+
+            await send({
+                'type': 'http.response.body',
+                'body': compressor.compress(body, finish=not more_body),
+                'more_body': more_body,
+            })
+
+        await self.app(scope, receive, send_compressed)
+
+
+# the paths of the vulnerability scanners probes: the files of other platforms (php, asp, cgi), the version control
+# and the config files
+PROBE_PATH_PATTERN = compile(
+    r'\.(php\d?|aspx?|jsp|cgi|env|git|svn|hg|htaccess|ds_store|bak|old|sql|ini|ya?ml|conf)(/|$)'
+    r'|/(wp-[a-z]+|cgi-bin|phpmyadmin|xmlrpc|actuator|vendor)(/|$)',
+    IGNORECASE,
+)
+
+
+class ProbeNotFoundMiddleware:
+    """
+    Answers the scanners probes (PROBE_PATH_PATTERN) with an empty 404 before the routing,
+    they do not reach the redirect of the unknown paths
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+
+        if scope['type'] == 'http' and PROBE_PATH_PATTERN.search(scope['path']):
+            await send({'type': 'http.response.start', 'status': 404, 'headers': [(b'content-length', b'0')]})
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+
+        await self.app(scope, receive, send)
@@ -0,0 +1,66 @@
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from datetime import datetime
+from json import dumps, loads
+from typing import Any, Type
+
+from fastapi import HTTPException, Query, status
+from pydantic import BaseModel
+
+from core import schemas
+from core.config import get_settings
+from core.responses import SchemaResponse
+
+
+SETTINGS = get_settings()
+
+
+def encode_cursor(key: tuple[datetime, int]) -> str:
+    """
+    The opaque cursor of a keyset pagination key (a date and an id, see BaseCrud.get_page)
+    """
+    return urlsafe_b64encode(dumps([key[0].isoformat(), key[1]]).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """
+    Raises ValueError if the cursor is not made by encode_cursor
+    """
+
+    try:
+        date, object_id = loads(urlsafe_b64decode(cursor))
+        return datetime.fromisoformat(date), int(object_id)
+
+    except (ValueError, TypeError):
+        raise ValueError(f'Invalid cursor {cursor}')
+
+
+class PageParams:
+    """
+    Dependency of the listing routes: the key after which the page starts and its size
+    """
+
+    def __init__(
+            self,
+            cursor: str | None = None,
+            limit: int = Query(SETTINGS.PAGE_DEFAULT_SIZE, ge=1, le=SETTINGS.PAGE_MAX_SIZE),
+    ) -> None:
+
+        try:
+            self.after = decode_cursor(cursor) if cursor else None
+
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Invalid cursor')
+
+        self.limit = limit
+
+
+def make_page(
+        item_schema: Type[BaseModel], objects: list[Any], next_key: tuple[datetime, int] | None
+) -> SchemaResponse:
+    """
+    The page response, the routes returning it declare response_model=schemas.Page[item_schema]
+    """
+    return SchemaResponse(schemas.Page[item_schema](
+        items=[item_schema.model_validate(i) for i in objects],
+        next_cursor=encode_cursor(next_key) if next_key else None,
+    ))
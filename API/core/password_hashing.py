@@ -0,0 +1,36 @@
+"""
+The password hashing functions run by the password executor processes (see core/passwords.py), they import
+this module, so it must not import the database and the other API modules (every process would create
+the engines and their pools)
+"""
+from passlib.context import CryptContext
+
+from core.config import get_settings
+
+
+SETTINGS = get_settings()
+
+# the only password hashing context of the API
+pwd_context = CryptContext(
+    schemes=SETTINGS.PASSWORD_HASHING_SCHEMES,
+    deprecated='auto',
+    bcrypt__rounds=SETTINGS.PASSWORD_BCRYPT_ROUNDS,
+    argon2__time_cost=SETTINGS.PASSWORD_ARGON2_TIME_COST,
+    argon2__memory_cost=SETTINGS.PASSWORD_ARGON2_MEMORY_COST,
+)
+
+
+def get_password_hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def verify_and_update_password(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    """
+    Return whether the password is correct and its new hash,
+    if the old one uses a deprecated scheme or other work factor (else None)
+    """
+    return pwd_context.verify_and_update(plain_password, hashed_password)
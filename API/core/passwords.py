@@ -0,0 +1,64 @@
+from asyncio import get_running_loop
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from time import perf_counter
+from typing import Callable, Any
+
+from starlette.concurrency import run_in_threadpool
+
+from core.config import get_settings
+from core.metrics import PASSWORD_HASHING_DURATION
+# the executor processes import only core.password_hashing
+from core.password_hashing import pwd_context, get_password_hash, verify_password, verify_and_update_password
+
+
+SETTINGS = get_settings()
+
+# hashing is CPU-bound and holds the GIL, so async code runs it here, see start_password_executor
+_password_executor: ProcessPoolExecutor | None = None
+
+
+def start_password_executor(max_workers: int = SETTINGS.PASSWORD_HASHING_PROCESSES) -> None:
+    """
+    Start the process pool for the async functions, with max_workers=0 they use the threadpool
+    """
+
+    global _password_executor
+
+    shutdown_password_executor()
+
+    if max_workers > 0:
+        # fork is not safe in a process with running threads (the event loop, the threadpool)
+        _password_executor = ProcessPoolExecutor(max_workers, mp_context=get_context('spawn'))
+
+
+def shutdown_password_executor() -> None:
+
+    global _password_executor
+
+    if _password_executor is not None:
+        _password_executor.shutdown()
+        _password_executor = None
+
+
+async def _run_in_password_executor(function: Callable, *args) -> Any:
+
+    start_time = perf_counter()
+
+    try:
+
+        if _password_executor is None:
+            return await run_in_threadpool(function, *args)
+
+        return await get_running_loop().run_in_executor(_password_executor, function, *args)
+
+    finally:
+        PASSWORD_HASHING_DURATION.observe(perf_counter() - start_time, function.__name__)
+
+
+async def get_password_hash_async(password: str) -> str:
+    return await _run_in_password_executor(get_password_hash, password)
+
+
+async def verify_and_update_password_async(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    return await _run_in_password_executor(verify_and_update_password, plain_password, hashed_password)
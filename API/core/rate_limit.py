@@ -0,0 +1,143 @@
+"""
+Token bucket rate limiting: every key (like an IP address or a username) has a bucket of burst tokens refilled
+with the rate of the limit, a request takes a token or is rejected with 429 and Retry-After.
+The buckets are kept in the process memory, or in postgres (RATE_LIMIT_BACKEND) to share them between the workers
+"""
+from collections import OrderedDict
+from itertools import count
+from math import ceil
+from threading import Lock
+from time import monotonic
+
+from fastapi import Depends, HTTPException, Request, status
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import get_settings
+from core.metrics import registry, Counter
+from sql import crud
+from sql.database import get_route_db
+
+
+SETTINGS = get_settings()
+
+RATE_LIMITED_REQUESTS = registry.register(Counter(
+    'rate_limited_requests_total', 'Requests rejected by the rate limits', ('limit',)
+))
+
+
+class MemoryTokenBuckets:
+    """
+    Thread safe in-process token buckets, the least recently used are evicted over max_size
+    (an evicted bucket is full again, so the eviction only relaxes the limits)
+    """
+
+    def __init__(self, max_size: int) -> None:
+
+        self.max_size = max_size
+
+        # key -> (tokens, update monotonic time), the tokens are negative like in RateLimitBucketCrud.acquire
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self._lock = Lock()
+
+    def acquire(self, key: str, rate: float, burst: int) -> float:
+        """
+        The same as RateLimitBucketCrud.acquire
+        """
+
+        now = monotonic()
+
+        with self._lock:
+
+            if (bucket := self._buckets.get(key)) is None:
+                tokens = burst - 1
+
+            else:
+                stored_tokens, updated_at = bucket
+                stored_tokens += 1 if stored_tokens < 0 else 0
+                tokens = min(burst, stored_tokens + (now - updated_at) * rate) - 1
+
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+
+            while len(self._buckets) > self.max_size:
+                self._buckets.popitem(last=False)
+
+        return tokens
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+memory_token_buckets = MemoryTokenBuckets(SETTINGS.RATE_LIMIT_MAX_KEYS)
+
+# the postgres buckets taken by the worker, see RATE_LIMIT_CLEANUP_INTERVAL
+postgres_acquires = count(1)
+
+
+async def delete_refilled_buckets(db: Session | AsyncSession) -> int:
+    """
+    Delete the postgres buckets of all the limits refilled up to burst, so the keys of the clients
+    (like the not existing usernames of login_username) do not stay in the table
+    """
+    return await crud.AsyncRateLimitBucketCrud(db).delete_refilled({
+        f'{limit_name}:': burst / (requests_per_minute / 60)
+        for limit_name, (requests_per_minute, burst) in SETTINGS.RATE_LIMITS.items()
+    })
+
+
+async def check_rate_limit(limit_name: str, key: str, db: Session | AsyncSession) -> None:
+    """
+    Take a token of the key bucket of the limit (RATE_LIMITS), raise 429 with Retry-After if there is not one
+    """
+
+    if not SETTINGS.RATE_LIMIT_ENABLED:
+        return
+
+    requests_per_minute, burst = SETTINGS.RATE_LIMITS[limit_name]
+    rate = requests_per_minute / 60
+
+    bucket_key = f'{limit_name}:{key}'
+
+    if SETTINGS.RATE_LIMIT_BACKEND == 'postgres':
+        tokens = await crud.AsyncRateLimitBucketCrud(db).acquire(bucket_key, rate, burst)
+
+        if next(postgres_acquires) % SETTINGS.RATE_LIMIT_CLEANUP_INTERVAL == 0:
+            await delete_refilled_buckets(db)
+    else:
+        tokens = memory_token_buckets.acquire(bucket_key, rate, burst)
+
+    if tokens >= 0:
+        return
+
+    RATE_LIMITED_REQUESTS.inc(limit_name)
+
+    raise HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail='Too many requests',
+        headers={'Retry-After': str(ceil(-tokens / rate))},
+    )
+
+
+def get_client_ip(request: Request) -> str:
+    """
+    Behind nginx it is the X-Forwarded-For address if nginx is trusted (WEB_FORWARDED_ALLOW_IPS, uvicorn replaces
+    the client by it), else every client has the nginx address and so one bucket
+    """
+    return request.client.host if request.client else 'unknown'
+
+
+class RateLimitByIP:
+    """
+    Dependency limiting the requests of every client IP address by the limit of RATE_LIMITS
+    """
+
+    def __init__(self, limit_name: str) -> None:
+        self.limit_name = limit_name
+
+    async def __call__(self, request: Request, db: Session | AsyncSession = Depends(get_route_db)) -> None:
+        await check_rate_limit(self.limit_name, get_client_ip(request), db)
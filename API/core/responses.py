@@ -0,0 +1,43 @@
+from functools import cache
+from typing import Any, Type
+
+from fastapi import Request
+from fastapi.responses import ORJSONResponse, Response
+from pydantic import BaseModel, TypeAdapter
+
+from core.middlewares import etag_matches
+
+
+@cache
+def _get_list_adapter(schema: Type[BaseModel]) -> TypeAdapter:
+    return TypeAdapter(list[schema])
+
+
+class SchemaResponse(ORJSONResponse):
+    """
+    A response of an already validated schema (or a list of schemas of one type) serialized by pydantic straight
+    to json. FastAPI returns a response as it is, so the routes returning it must declare response_model
+    (for the docs), it is not validated and serialized again. Other content is serialized by orjson
+    """
+
+    def render(self, content: Any) -> bytes:
+
+        if isinstance(content, BaseModel):
+            return content.model_dump_json().encode()
+
+        if isinstance(content, list) and content and isinstance(content[0], BaseModel):
+            return _get_list_adapter(type(content[0])).dump_json(content)
+
+        return super().render(content)
+
+
+def make_not_modified_response(request: Request, etag: str, headers: dict[str, str] | None = None) -> Response | None:
+    """
+    304 if the client already has the representation with the ETag (If-None-Match), else None.
+    The routes knowing the ETag before building the body call it first, so 304 costs neither the body nor its ETag
+    """
+
+    if (if_none_match := request.headers.get('if-none-match')) and etag_matches(etag, if_none_match):
+        return Response(status_code=304, headers={'ETag': etag} | (headers or {}))
+
+    return None
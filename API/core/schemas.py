@@ -1,10 +1,14 @@
 from datetime import datetime
+from typing import Generic, TypeVar
 
 from pydantic import BaseModel, ConfigDict
 
 from sql.models_enums import ReviewStateEnum
 
 
+PageItem = TypeVar('PageItem')
+
+
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -45,6 +49,16 @@ class User(UserBase):
     available_scopes: list[Scope] = []
 
 
+class UserBulkCreateConflict(UserBase):
+    row: int  # index of the user in the created list
+    fields: list[str]  # not unique fields
+
+
+class UsersBulkCreateResult(BaseModel):
+    created: list[User]
+    conflicts: list[UserBulkCreateConflict]
+
+
 class UserToScopeBase(BaseModel):
     user_id: int
     scope_id: int
@@ -73,7 +87,14 @@ class P2PRequest(P2PRequestBase):
     model_config = ConfigDict(from_attributes=True)
   
     id: int
+    creator_id: int
     publication_date: datetime
+    review_state: ReviewStateEnum
+
+
+class Page(BaseModel, Generic[PageItem]):
+    items: list[PageItem]
+    next_cursor: str | None  # the cursor of the next page, None on the last page
 
 
 class ErrorResponse(BaseModel):
@@ -96,6 +117,6 @@ class P2PReview(P2PReviewBase):
     reviewer_id: int
     p2p_request_id: int
     creation_date: datetime
-    end_date: datetime
+    end_date: datetime | None  # None until the review is completed
     review_state: ReviewStateEnum
-    link: str
+    link: str | None
@@ -0,0 +1,24 @@
+from csv import DictReader
+from json import loads
+from typing import Iterable
+
+from pydantic import TypeAdapter
+
+from core import schemas
+
+
+USERS_CREATE_ADAPTER = TypeAdapter(list[schemas.UserCreate])
+
+
+def parse_users_json(text: str | bytes) -> list[schemas.UserCreate]:
+    """
+    [{"username": ..., "password": ..., "discord_id": ...}, ...], raises pydantic.ValidationError
+    """
+    return USERS_CREATE_ADAPTER.validate_python(loads(text))
+
+
+def parse_users_csv(lines: Iterable[str]) -> list[schemas.UserCreate]:
+    """
+    Csv with the "username,password,discord_id" header, raises pydantic.ValidationError
+    """
+    return USERS_CREATE_ADAPTER.validate_python(list(DictReader(lines)))
@@ -0,0 +1,46 @@
+"""one review per p2p request
+
+Before the atomic claim (FOR UPDATE SKIP LOCKED) concurrent reviewers could take the same p2p request, so there
+may be several reviews of one request. The unique index needs one: the completed review is kept (the earliest
+of them if there are several), else the earliest review in progress, the others are deleted.
+
+Revision ID: 30354ffc486b
+Revises: 2a21ae496bbc
+Create Date: 2026-10-18 10:36:02.460241
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '30354ffc486b'
+down_revision = '2a21ae496bbc'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(sa.text(
+        """
+        DELETE FROM p2p_reviews
+        WHERE id IN (
+            SELECT id FROM (
+                SELECT
+                    id,
+                    row_number() OVER (
+                        PARTITION BY p2p_request_id
+                        ORDER BY review_state = 'completed' DESC, creation_date, id
+                    ) AS review_number
+                FROM p2p_reviews
+            ) AS numbered_reviews
+            WHERE review_number > 1
+        )
+        """
+    ))
+    op.create_index(op.f('ix_p2p_reviews_p2p_request_id'), 'p2p_reviews', ['p2p_request_id'], unique=True)
+
+
+def downgrade() -> None:
+    # the deleted duplicate reviews are not restored
+    op.drop_index(op.f('ix_p2p_reviews_p2p_request_id'), table_name='p2p_reviews')
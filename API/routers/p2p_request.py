@@ -1,74 +1,332 @@
+from asyncio import wait_for
 from datetime import datetime
 
-from fastapi import APIRouter, Depends, Security
+from typing import AsyncIterator, Type
+
+from fastapi import APIRouter, Depends, HTTPException, Security, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import IntegrityError
 
 from sql import crud, models
-from sql.database import get_db
+from sql.database import get_route_db, get_route_db_not_dependency, async_unit_of_work
 from core import schemas
 from core.login_manager import login_manager
+from core.pagination import PageParams, make_page
+from core.responses import SchemaResponse
+from core.rate_limit import RateLimitByIP, check_rate_limit
+from core.broadcast import broadcaster, publish_review_available, format_sse, END_OF_EVENTS
+from core.config import get_settings
+from core.export import ExportFormat, EXPORT_MEDIA_TYPES, async_iterate_export
 from sql.models_enums import ReviewStateEnum
 
+SETTINGS = get_settings()
+
 router = APIRouter(tags=['p2p_request'])
 
 
-@router.post('/p2p_request/create')
-def create_p2p_request(
+@router.post('/p2p_request/create', dependencies=[Depends(RateLimitByIP('write_ip'))])
+async def create_p2p_request(
         repository_link: str,
         comment: str,
         current_user: models.User = Security(login_manager, scopes=['p2p_request']),
-        db: Session = Depends(get_db)
+        db: Session | AsyncSession = Depends(get_route_db)
 ) -> bool:
+
+    await check_rate_limit('write_username', current_user.username, db)
+
     p2p_request_create = schemas.P2PRequestCreate(
         repository_link=repository_link, comment=comment, creator_id=current_user.id,
     )
 
-    crud.P2PRequestCrud(db).create(p2p_request_create)
+    await crud.AsyncP2PRequestCrud(db).create(p2p_request_create)
+
+    await publish_review_available('created', {current_user.id})
 
     return True
 
 
-@router.get('/p2p_request/review/start')
-def p2p_request_start_review(
+@router.post('/p2p_request/create_many', response_model=list[schemas.P2PRequest])
+async def create_p2p_requests(
+        p2p_requests_create: list[schemas.P2PRequestCreate],
+        _: models.User = Security(login_manager, scopes=['admin']),
+        db: Session | AsyncSession = Depends(get_route_db)
+) -> SchemaResponse:
+    """
+    Create p2p requests of any users in bulk (for example, to import them from another tracker), all or nothing
+    """
+
+    try:
+        p2p_requests = await crud.AsyncP2PRequestCrud(db).create_many(p2p_requests_create)
+
+    except IntegrityError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Not existing creator id')
+
+    if p2p_requests:
+        await publish_review_available('created', {i.creator_id for i in p2p_requests})
+
+    return SchemaResponse([schemas.P2PRequest.model_validate(i) for i in p2p_requests])
+
+
+@router.get('/p2p_request/review/start', response_model=schemas.P2PRequest | schemas.ErrorResponse)
+async def p2p_request_start_review(
         current_user: models.User = Security(login_manager, scopes=['p2p_request']),
-        db: Session = Depends(get_db)
-) -> schemas.P2PRequest | schemas.ErrorResponse:
+        db: Session | AsyncSession = Depends(get_route_db)
+) -> SchemaResponse:
 
     reviewer_id = current_user.id
-    p2p_review_crud = crud.P2PReviewCrud(db)
+    p2p_review_crud = crud.AsyncP2PReviewCrud(db)
 
-    if p2p_review_crud.get(review_state=ReviewStateEnum.PROGRESS.value, reviewer_id=reviewer_id):
-        return schemas.ErrorResponse(context='You already have a review, complete it first')
+    async with async_unit_of_work(db):
 
-    p2p_request = crud.P2PRequestCrud(db).get_oldest_not_user_without_reviews(reviewer_id)
+        if await p2p_review_crud.get(review_state=ReviewStateEnum.PROGRESS.value, reviewer_id=reviewer_id):
+            return SchemaResponse(schemas.ErrorResponse(context='You already have a review, complete it first'))
 
-    if not p2p_request:
-        return schemas.ErrorResponse(context='There are not any pending projects')
+        p2p_request = await crud.AsyncP2PRequestCrud(db).claim_oldest_not_user_without_reviews(reviewer_id)
 
-    p2p_review_crud.create(schemas.P2PReviewCreate(reviewer_id=reviewer_id, p2p_request_id=p2p_request.id))
+    if not p2p_request:
+        return SchemaResponse(schemas.ErrorResponse(context='There are not any pending projects'))
 
-    return schemas.P2PRequest.model_validate(p2p_request)
+    return SchemaResponse(schemas.P2PRequest.model_validate(p2p_request))
 
 
-@router.post('/p2p_request/review/complete')
-def p2p_request_complete_review(
+@router.post('/p2p_request/review/complete', response_model=schemas.P2PReview | schemas.ErrorResponse)
+async def p2p_request_complete_review(
         link: str,
         p2p_request_id: int,
         current_user: models.User = Security(login_manager, scopes=['p2p_request']),
-        db: Session = Depends(get_db)
-) -> schemas.P2PReview | schemas.ErrorResponse:
+        db: Session | AsyncSession = Depends(get_route_db)
+) -> SchemaResponse:
 
     reviewer_id = current_user.id
 
-    review_crud = crud.P2PReviewCrud(db)
+    review_crud = crud.AsyncP2PReviewCrud(db)
+
+    async with async_unit_of_work(db):
+
+        review = await review_crud.get(
+            p2p_request_id=p2p_request_id, review_state=ReviewStateEnum.PROGRESS.value, reviewer_id=reviewer_id
+        )
+
+        if not review:
+            return SchemaResponse(schemas.ErrorResponse(context='Review not found'))
+
+        await review_crud.update(
+            review, link=link, end_date=datetime.now(), review_state=ReviewStateEnum.COMPLETED.value
+        )
+
+    return SchemaResponse(schemas.P2PReview.model_validate(review))
+
+
+@router.post('/p2p_request/review/release', response_model=bool | schemas.ErrorResponse)
+async def p2p_request_release_review(
+        p2p_request_id: int,
+        current_user: models.User = Security(login_manager, scopes=['p2p_request']),
+        db: Session | AsyncSession = Depends(get_route_db)
+) -> SchemaResponse:
+    """
+    Give up the review in progress, the p2p request returns to the review queue
+    """
+
+    review_crud = crud.AsyncP2PReviewCrud(db)
+
+    async with async_unit_of_work(db):
+
+        review = await review_crud.get(
+            p2p_request_id=p2p_request_id, review_state=ReviewStateEnum.PROGRESS.value, reviewer_id=current_user.id
+        )
+
+        if not review:
+            return SchemaResponse(schemas.ErrorResponse(context='Review not found'))
+
+        creator_id = await review_crud.release(review)
+
+    # after the commit, so the notified reviewers can claim the request
+    await publish_review_available('released', {creator_id})
+
+    return SchemaResponse(True)
+
+
+async def iterate_review_events(reviewer_id: int) -> AsyncIterator[str]:
+    """
+    The review_available events of the p2p requests the reviewer can review (not their own ones)
+    and heartbeat comments while there are not any
+    """
+
+    async with broadcaster.subscribe() as queue:
+
+        # the headers are sent with the first chunk, the browsers reconnect in retry milliseconds after the end
+        yield f': connected\nretry: {SETTINGS.SSE_RETRY_SECONDS * 1000}\n\n'
+
+        while True:
+
+            try:
+                event = await wait_for(queue.get(), SETTINGS.SSE_HEARTBEAT_SECONDS)
+
+            except TimeoutError:
+                yield ': heartbeat\n\n'
+                continue
+
+            # the events may be lost (see PostgresBroadcaster), the client reconnects and polls meanwhile
+            if event is END_OF_EVENTS:
+                return
 
-    review = review_crud.get(
-        p2p_request_id=p2p_request_id, review_state=ReviewStateEnum.PROGRESS.value, reviewer_id=reviewer_id
+            if event['creators_ids'] is None or any(i != reviewer_id for i in event['creators_ids']):
+                yield format_sse('review_available', event)
+
+
+@router.get('/p2p_request/review/events', response_class=StreamingResponse)
+async def p2p_request_review_events(
+        current_user: models.User = Security(login_manager, scopes=['p2p_request']),
+):
+    """
+    Server-sent events (text/event-stream) instead of polling /p2p_request/review/start: review_available
+    (data: {"reason": "created" | "released", "creators_ids": [...] | null}) is sent when p2p requests
+    of other users become pending, then /p2p_request/review/start claims one.
+    503 or the end of the stream - the events are not delivered now, poll /p2p_request/review/start meanwhile
+    """
+
+    if not broadcaster.connected:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail='The review events are not available, poll /p2p_request/review/start',
+            headers={'Retry-After': str(SETTINGS.SSE_RETRY_SECONDS)},
+        )
+
+    return StreamingResponse(
+        iterate_review_events(current_user.id),
+        media_type='text/event-stream',
+        # X-Accel-Buffering - nginx sends the events as they come
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+@router.get('/p2p_request/mine', response_model=schemas.Page[schemas.P2PRequest])
+async def get_my_p2p_requests(
+        page: PageParams = Depends(),
+        current_user: models.User = Security(login_manager, scopes=['p2p_request']),
+        db: Session | AsyncSession = Depends(get_route_db)
+) -> SchemaResponse:
+    """
+    The user p2p requests, the newest first
+    """
+
+    p2p_requests, next_key = await crud.AsyncP2PRequestCrud(db).get_page(
+        page.after, page.limit, models.P2PRequest.creator_id == current_user.id, descending=True
+    )
+
+    return make_page(schemas.P2PRequest, p2p_requests, next_key)
+
+
+@router.get('/p2p_request/pending', response_model=schemas.Page[schemas.P2PRequest])
+async def get_pending_p2p_requests(
+        page: PageParams = Depends(),
+        _: models.User = Security(login_manager, scopes=['p2p_request']),
+        db: Session | AsyncSession = Depends(get_route_db)
+) -> SchemaResponse:
+    """
+    The p2p requests waiting for a review, in the review queue order (the oldest first)
+    """
+
+    p2p_requests, next_key = await crud.AsyncP2PRequestCrud(db).get_page(
+        page.after, page.limit, models.P2PRequest.review_state == ReviewStateEnum.PENDING
+    )
+
+    return make_page(schemas.P2PRequest, p2p_requests, next_key)
+
+
+@router.get('/p2p_request/all', response_model=schemas.Page[schemas.P2PRequest])
+async def get_all_p2p_requests(
+        page: PageParams = Depends(),
+        _: models.User = Security(login_manager, scopes=['admin']),
+        db: Session | AsyncSession = Depends(get_route_db)
+) -> SchemaResponse:
+    """
+    All the p2p requests, the newest first
+    """
+
+    p2p_requests, next_key = await crud.AsyncP2PRequestCrud(db).get_page(page.after, page.limit, descending=True)
+
+    return make_page(schemas.P2PRequest, p2p_requests, next_key)
+
+
+@router.get('/p2p_request/review/mine', response_model=schemas.Page[schemas.P2PReview])
+async def get_my_p2p_reviews(
+        page: PageParams = Depends(),
+        current_user: models.User = Security(login_manager, scopes=['p2p_request']),
+        db: Session | AsyncSession = Depends(get_route_db)
+) -> SchemaResponse:
+    """
+    The reviews made by the user, the newest first
+    """
+
+    p2p_reviews, next_key = await crud.AsyncP2PReviewCrud(db).get_page(
+        page.after, page.limit, models.P2PReview.reviewer_id == current_user.id, descending=True
+    )
+
+    return make_page(schemas.P2PReview, p2p_reviews, next_key)
+
+
+@router.get('/p2p_request/review/all', response_model=schemas.Page[schemas.P2PReview])
+async def get_all_p2p_reviews(
+        page: PageParams = Depends(),
+        _: models.User = Security(login_manager, scopes=['admin']),
+        db: Session | AsyncSession = Depends(get_route_db)
+) -> SchemaResponse:
+    """
+    All the reviews, the newest first
+    """
+
+    p2p_reviews, next_key = await crud.AsyncP2PReviewCrud(db).get_page(page.after, page.limit, descending=True)
+
+    return make_page(schemas.P2PReview, p2p_reviews, next_key)
+
+
+def _make_export_response(
+        crud_class: Type[crud.AsyncBaseCrud],
+        export_format: ExportFormat,
+        date_from: datetime | None,
+        date_to: datetime | None,
+        filename: str,
+) -> StreamingResponse:
+
+    async def export_chunks() -> AsyncIterator[str]:
+        # FastAPI closes the dependencies (so the route session) before the response is streamed
+        async with get_route_db_not_dependency() as db:
+            async for chunk in async_iterate_export(
+                    crud_class(db).stream_export(date_from, date_to), crud.P2P_EXPORT_COLUMNS, export_format
+            ):
+                yield chunk
+
+    return StreamingResponse(
+        export_chunks(),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={'Content-Disposition': f'attachment; filename="{filename}.{export_format.value}"'},
     )
 
-    if not review:
-        return schemas.ErrorResponse(context='Review not found')
 
-    review_crud.update(review, link=link, end_date=datetime.now(), review_state=ReviewStateEnum.COMPLETED.value)
+@router.get('/p2p_request/export', response_class=StreamingResponse)
+async def export_p2p_requests(
+        export_format: ExportFormat = ExportFormat.NDJSON,
+        date_from: datetime | None = None,
+        date_to: datetime | None = None,
+        _: models.User = Security(login_manager, scopes=['admin']),
+):
+    """
+    All the p2p requests published in [date_from, date_to) with their creators and reviews (if any), streamed
+    """
+    return _make_export_response(crud.AsyncP2PRequestCrud, export_format, date_from, date_to, 'p2p_requests')
+
 
-    return schemas.P2PReview.model_validate(review)
+@router.get('/p2p_request/review/export', response_class=StreamingResponse)
+async def export_p2p_reviews(
+        export_format: ExportFormat = ExportFormat.NDJSON,
+        date_from: datetime | None = None,
+        date_to: datetime | None = None,
+        _: models.User = Security(login_manager, scopes=['admin']),
+):
+    """
+    All the reviews created in [date_from, date_to) with their reviewers and p2p requests, streamed
+    """
+    return _make_export_response(crud.AsyncP2PReviewCrud, export_format, date_from, date_to, 'p2p_reviews')
@@ -1,31 +1,108 @@
-from fastapi import APIRouter
-from fastapi.responses import RedirectResponse, HTMLResponse
+from ipaddress import ip_address, ip_network
+
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import RedirectResponse, PlainTextResponse, Response
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from core.config import get_settings
+from core.docs import get_assets, SWAGGER_OAUTH2_REDIRECT_URL
+from core.cache import CACHES, TTLCache
+from core.metrics import registry, REVIEW_QUEUE_DEPTH
+from sql import crud, models
+from sql.database import get_route_db
+from sql.models_enums import ReviewStateEnum
 
 
 SETTINGS = get_settings()
 
 router = APIRouter(include_in_schema=False)
 
+INTERNAL_NETWORKS = [ip_network(i) for i in SETTINGS.INTERNAL_NETWORKS]
+
+# the number of the pending p2p requests, counted once in REVIEW_QUEUE_DEPTH_TTL_SECONDS
+review_queue_depth_cache = TTLCache(1, SETTINGS.REVIEW_QUEUE_DEPTH_TTL_SECONDS)
+
+
+def internal_client_only(request: Request) -> None:
+    """
+    Dependency of the service routes: 404 for the clients outside INTERNAL_NETWORKS (behind nginx the client is
+    the X-Forwarded-For address). A client without an address is a unix socket one, so a local one
+    """
+
+    if request.client is None:
+        return
+
+    try:
+        client_address = ip_address(request.client.host)
+    except ValueError:
+        client_address = None
+
+    if client_address is None or not any(client_address in network for network in INTERNAL_NETWORKS):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+
+
+@router.get(SETTINGS.OPENAPI_URL)
+async def openapi(request: Request) -> Response:
+    return get_assets(request.app)['openapi'].get_response(request)
+
+
+@router.get('/rapidoc')
+async def rapidoc(request: Request) -> Response:
+    return get_assets(request.app)['rapidoc'].get_response(request)
+
+
+@router.get('/docs')
+async def swagger(request: Request) -> Response:
+    return get_assets(request.app)['docs'].get_response(request)
+
+
+@router.get(SWAGGER_OAUTH2_REDIRECT_URL)
+async def swagger_oauth2_redirect(request: Request) -> Response:
+    return get_assets(request.app)['docs/oauth2-redirect'].get_response(request)
 
-@router.get('/rapidoc', response_class=HTMLResponse)
-async def rapidoc():
-    return f"""
-        <!doctype html>
-        <html>
-            <head>
-                <meta charset="utf-8">
-                <script 
-                    type="module" 
-                    src="https://unpkg.com/rapidoc/dist/rapidoc-min.js"
-                ></script>
-            </head>
-            <body>
-                <rapi-doc spec-url="{SETTINGS.OPENAPI_URL}"></rapi-doc>
-            </body> 
-        </html>
+
+@router.get('/redoc')
+async def redoc(request: Request) -> Response:
+    return get_assets(request.app)['redoc'].get_response(request)
+
+
+@router.get('/static/{name}')
+async def static_asset(name: str, request: Request) -> Response:
+    """
+    The docs page assets (from STATIC_DIR), the urls have the version (?v=) and the responses are cached for a year
+    """
+
+    if not (asset := get_assets(request.app).get(f'static/{name}')):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+
+    return asset.get_response(request)
+
+
+@router.get('/caches', dependencies=[Depends(internal_client_only)])
+async def caches_stats() -> dict[str, dict[str, int | float]]:
     """
+    Sizes, hits, misses and hit ratios of the in-process caches (of this worker)
+    """
+    return {name: cache.stats for name, cache in CACHES.items()}
+
+
+@router.get('/metrics', response_class=PlainTextResponse, dependencies=[Depends(internal_client_only)])
+async def metrics(db: Session | AsyncSession = Depends(get_route_db)) -> str:
+    """
+    The metrics of this worker in the Prometheus text format
+    """
+
+    if (review_queue_depth := review_queue_depth_cache.get('pending')) is None:
+        # counted by the pending queue partial index
+        review_queue_depth = await crud.AsyncP2PRequestCrud(db).count(
+            models.P2PRequest.review_state == ReviewStateEnum.PENDING
+        )
+        review_queue_depth_cache.set('pending', review_queue_depth)
+
+    REVIEW_QUEUE_DEPTH.set(review_queue_depth)
+
+    return PlainTextResponse(registry.render(), media_type='text/plain; version=0.0.4; charset=utf-8')
 
 
 @router.get('/{_:path}')
@@ -1,18 +1,27 @@
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException, Security, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Security, status, UploadFile
+from fastapi.exceptions import RequestValidationError
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
+from orjson import dumps
+from pydantic import ValidationError
 from starlette.responses import Response
-from passlib.context import CryptContext
 from fastapi_login.exceptions import InvalidCredentialsException
 
 from sql import crud, models
-from sql.database import get_db, get_db_not_dependency
+from sql.database import get_route_db
 from core import schemas
 from core.config import get_settings
 from core.login_manager import login_manager
+from core.cache import user_cache
+from core.passwords import verify_and_update_password_async
+from core.users_file import parse_users_csv
+from core.middlewares import make_etag
+from core.responses import SchemaResponse, make_not_modified_response
+from core.rate_limit import RateLimitByIP, check_rate_limit
 
 
 SETTINGS = get_settings()
@@ -20,78 +29,155 @@ SETTINGS = get_settings()
 router = APIRouter(tags=['users'])
 
 
-pwd_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
-
+@login_manager.user_loader()
+async def get_user(username: str, db: Session | AsyncSession) -> models.User | None:
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    if user := user_cache.get(username):
+        return user
 
+    if user := await crud.AsyncUserCrud(db).get(username=username):
+        # the cached user is shared between requests, so it must not be bound to a session
+        db.expunge(user)
+        user_cache.set(username, user)
 
-@login_manager.user_loader()
-def get_user(username: str, db: Session = get_db_not_dependency()) -> models.User | None:
-    return crud.UserCrud(db).get(username=username)
+    return user
 
 
-@router.post(f'/{SETTINGS.TOKEN_URL}', response_model=schemas.Token)
-def login(
-        response: Response, form_data: Annotated[OAuth2PasswordRequestForm, Depends()], db: Session = Depends(get_db)
+@router.post(
+    f'/{SETTINGS.TOKEN_URL}', response_model=schemas.Token, dependencies=[Depends(RateLimitByIP('login_ip'))]
+)
+async def login(
+        response: Response,
+        form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
+        db: Session | AsyncSession = Depends(get_route_db),
 ):
 
-    user = get_user(form_data.username, db)
+    # before the password verification, every attempt costs a hashing
+    await check_rate_limit('login_username', form_data.username, db)
+
+    user = await crud.AsyncUserCrud(db).get(username=form_data.username)
 
     if not user:
         raise InvalidCredentialsException
 
-    if not verify_password(form_data.password, user.hashed_password):
+    is_password_correct, new_hashed_password = await verify_and_update_password_async(
+        form_data.password, user.hashed_password
+    )
+
+    if not is_password_correct:
         raise InvalidCredentialsException
 
-    user_scopes = [i.name for i in crud.UserToScopeCrud(db).get_user_scopes(user)]
+    # the hashing settings were changed, the password is known only now, so the hash is updated on login
+    if new_hashed_password:
+        await crud.AsyncUserCrud(db).update(user, hashed_password=new_hashed_password)
+
+    user_scopes = await crud.AsyncUserToScopeCrud(db).get_user_scopes(user)
+    user_scopes_names = [i.name for i in user_scopes]
 
-    if not all([(scope in SETTINGS.OAUTH2_SCHEME_SCOPES) and (scope in user_scopes) for scope in form_data.scopes]):
+    if not all([
+        (scope in SETTINGS.OAUTH2_SCHEME_SCOPES) and (scope in user_scopes_names) for scope in form_data.scopes
+    ]):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail='Incorrect scope(s)',
             headers={'WWW-Authenticate': 'Bearer'},
         )
 
-    access_token = login_manager.create_access_token(data={'sub': user.username, 'scopes': form_data.scopes})
+    access_token = login_manager.create_user_access_token(user, form_data.scopes, user_scopes)
 
     login_manager.set_cookie(response, access_token)
 
     return {'access_token': access_token, 'token_type': 'bearer'}
 
 
-@router.get('/users/me')
-def get_user_me_data(
-        current_user: models.User = Security(login_manager, scopes=['me']), db: Session = Depends(get_db)
-) -> schemas.User:
+def _make_user_etag(user: models.User | schemas.User, scopes: list[schemas.Scope]) -> str:
+    """
+    The ETag of the user data, from the user row and the scopes, without building the response
+    """
+    return make_etag(dumps([user.id, user.username, user.discord_id, user.is_active, [i.id for i in scopes]]))
+
+
+@router.get('/users/me', response_model=schemas.User)
+async def get_user_me_data(
+        request: Request,
+        current_user: models.User | schemas.User = Security(login_manager, scopes=['me']),
+        db: Session | AsyncSession = Depends(get_route_db),
+) -> SchemaResponse | Response:
 
     if not current_user.is_active:
-        return InvalidCredentialsException
+        raise InvalidCredentialsException
+
+    # stateless auth (STATELESS_AUTH), the user and the scopes are from the access token
+    if isinstance(current_user, schemas.User):
+        scopes = current_user.available_scopes
+    else:
+        scopes = await crud.AsyncUserToScopeCrud(db).get_user_scopes(current_user)
 
-    current_user = schemas.User.model_validate(current_user)
+    etag = _make_user_etag(current_user, scopes)
 
-    current_user.available_scopes = crud.UserToScopeCrud(db).get_user_scopes(current_user)
+    if not_modified_response := make_not_modified_response(request, etag):
+        return not_modified_response
 
-    return current_user
+    if not isinstance(current_user, schemas.User):
+        current_user = schemas.User.model_validate(current_user)
+        current_user.available_scopes = scopes
 
+    return SchemaResponse(current_user, headers={'ETag': etag})
 
-@router.post('/create_user', response_model=schemas.User)
-def create_user(
+
+@router.post('/create_user', response_model=schemas.User, dependencies=[Depends(RateLimitByIP('write_ip'))])
+async def create_user(
         username: str,
         password: str,
         discord_id: int,
-        db: Session = Depends(get_db),
-        _: models.User = Security(login_manager, scopes=['register']),
+        db: Session | AsyncSession = Depends(get_route_db),
+        current_user: models.User | schemas.User = Security(login_manager, scopes=['register']),
 ):
+
+    await check_rate_limit('write_username', current_user.username, db)
+
     try:
 
         user_create_schema = schemas.UserCreate(username=username, password=password, discord_id=discord_id)
 
-        return schemas.User.model_validate(crud.UserCrud(db).create(user_create_schema))
+        return SchemaResponse(schemas.User.model_validate(await crud.AsyncUserCrud(db).create(user_create_schema)))
 
     except IntegrityError:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail='Not unique username or discord id',
         )
+
+
+@router.post('/create_users', response_model=schemas.UsersBulkCreateResult)
+async def create_users(
+        users_create: list[schemas.UserCreate],
+        db: Session | AsyncSession = Depends(get_route_db),
+        _: models.User = Security(login_manager, scopes=['register']),
+) -> SchemaResponse:
+    """
+    Create the users with the default scopes (DEFAULT_USER_SCOPES), the conflicting users are reported and skipped
+    """
+    return SchemaResponse(await crud.AsyncUserCrud(db).create_many(users_create))
+
+
+@router.post('/create_users/csv', response_model=schemas.UsersBulkCreateResult)
+async def create_users_from_csv(
+        file: UploadFile,
+        db: Session | AsyncSession = Depends(get_route_db),
+        _: models.User = Security(login_manager, scopes=['register']),
+) -> SchemaResponse:
+    """
+    The same as /create_users, the users are from a csv file with the "username,password,discord_id" header
+    """
+
+    try:
+        users_create = parse_users_csv((await file.read()).decode('utf-8-sig').splitlines())
+
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='The file must be utf-8')
+
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
+
+    return SchemaResponse(await crud.AsyncUserCrud(db).create_many(users_create))
@@ -0,0 +1,30 @@
+"""
+The production runner, configured by the WEB_* settings (see core/config.py). Run from the API directory:
+python server.py
+"""
+from uvicorn import run
+
+from core.config import get_settings
+
+
+SETTINGS = get_settings()
+
+
+def main() -> None:
+    run(
+        'core.main:app',
+        host=SETTINGS.WEB_HOST,
+        port=SETTINGS.WEB_PORT,
+        workers=SETTINGS.WEB_WORKERS,
+        loop=SETTINGS.WEB_LOOP,
+        http=SETTINGS.WEB_HTTP,
+        timeout_keep_alive=SETTINGS.WEB_KEEP_ALIVE_TIMEOUT,
+        timeout_graceful_shutdown=SETTINGS.WEB_GRACEFUL_TIMEOUT,
+        forwarded_allow_ips=SETTINGS.WEB_FORWARDED_ALLOW_IPS,
+        # QueryStatsMiddleware logs the requests
+        access_log=False,
+    )
+
+
+if __name__ == '__main__':
+    main()
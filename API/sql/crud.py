@@ -1,19 +1,52 @@
-from .database import Base
-from typing import Type, Any
+from .database import Base, SessionLocal, UNIT_OF_WORK_KEY
+from datetime import datetime
+from typing import Type, Any, Callable, Iterable, Iterator, AsyncIterator
 from abc import ABC
+from asyncio import gather
+from itertools import islice
+from threading import Lock
+from time import time
 
-from sqlalchemy.orm import Session, Query
-from passlib.context import CryptContext
+from sqlalchemy import insert, select, update, delete, literal, and_, or_, tuple_, func, case, ColumnElement, Select, RowMapping
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session, Query, aliased
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool, iterate_in_threadpool
 
 from core import schemas
+from core.config import get_settings
+from core.cache import user_cache, token_deny_list
+from core.passwords import get_password_hash, get_password_hash_async
 from . import models
+from .models_enums import ReviewStateEnum
 
 
+SETTINGS = get_settings()
+
 class BaseCrud(ABC):
+
+    # the names of the (unique together) columns of the keyset pagination (get_page)
+    keyset_columns_names: tuple[str, ...]
+
     def __init__(self, model: Type[Base], db: Session) -> None:
         self.model = model
         self.db = db
 
+    @property
+    def in_unit_of_work(self) -> bool:
+        return self.db.info.get(UNIT_OF_WORK_KEY, False)
+
+    def _commit(self) -> None:
+        """
+        Commit, in a unit of work (see sql.database.unit_of_work) only flush, the unit of work commits
+        """
+
+        if self.in_unit_of_work:
+            self.db.flush()
+        else:
+            self.db.commit()
+
     def _get_query(self) -> Query:
         return self.db.query(self.model)
 
@@ -28,14 +61,15 @@ class BaseCrud(ABC):
         for object_to_refresh in self._get_as_list(objects_to_refresh):
             self.db.refresh(object_to_refresh)
 
-    def add_to_db_and_refresh(self, object_to_add: Type[Base]) -> None:
-        self.db.add(object_to_add)
-        self.db.commit()
-        self.refresh(object_to_add)
-
     def create(self, schema: Type[schemas.BaseModel]) -> Type[Base]:
-        db_object = self.model(**schema.model_dump())
-        self.add_to_db_and_refresh(db_object)
+        """
+        Insert the object, the server defaults (ids, dates) are returned by the same statement (RETURNING)
+        """
+
+        db_object = self.db.scalars(insert(self.model).values(**schema.model_dump()).returning(self.model)).one()
+
+        self._commit()
+
         return db_object
 
     def get(self, **kwargs) -> Type[Base]:
@@ -44,57 +78,719 @@ class BaseCrud(ABC):
     def get_many(self, **kwargs) -> list[Type[Base]]:
         return self._get_query_filtered(**kwargs).all()
 
+    def count(self, *criteria: ColumnElement[bool]) -> int:
+        return self.db.scalar(select(func.count()).select_from(self.model).filter(*criteria))
+
+    def get_page(
+            self, after: tuple | None, limit: int, *criteria: ColumnElement[bool], descending: bool = False
+    ) -> tuple[list[Type[Base]], tuple | None]:
+        """
+        Keyset pagination: the objects matching the criteria, ordered by the keyset columns, that are after
+        the after key, and the key of the last object if there is a next page. A page is one index range scan,
+        so its cost does not depend on its position (unlike OFFSET), the keyset must have a matching index
+        """
+
+        keyset_columns = [getattr(self.model, i) for i in self.keyset_columns_names]
+
+        statement = select(self.model).filter(*criteria)
+
+        if after is not None:
+            keyset = tuple_(*keyset_columns)
+            statement = statement.filter(keyset < tuple_(*after) if descending else keyset > tuple_(*after))
+
+        statement = statement.order_by(*[i.desc() if descending else i for i in keyset_columns]).limit(limit + 1)
+
+        objects = self.db.scalars(statement).all()
+
+        if len(objects) <= limit:
+            return list(objects), None
+
+        return list(objects[:limit]), tuple(getattr(objects[limit - 1], i) for i in self.keyset_columns_names)
+
+    def stream(self, statement: Select) -> Iterator[list[RowMapping]]:
+        """
+        The statement rows in partitions of EXPORT_BATCH_SIZE rows, fetched from a server-side cursor,
+        so the memory does not depend on the rows number
+        """
+        yield from self.db.execute(
+            statement.execution_options(yield_per=SETTINGS.EXPORT_BATCH_SIZE)
+        ).mappings().partitions()
+
+    def stream_export(self, date_from: datetime | None, date_to: datetime | None) -> Iterator[list[RowMapping]]:
+        """
+        For the cruds with the exports (get_export_statement)
+        """
+        return self.stream(self.get_export_statement(date_from, date_to))
+
     def update(self, objects_to_update: Type[Base] | list[Type[Base]], **kwargs) -> None:
+        """
+        Update all the objects with one UPDATE statement, the objects of the session are synchronized by it,
+        the values of the objects out of the session (for example, cached ones) are set here
+        """
 
         objects_to_update = self._get_as_list(objects_to_update)
 
+        self.db.execute(update(self.model).where(self.model.id.in_([i.id for i in objects_to_update])).values(**kwargs))
+
         for object_to_update in objects_to_update:
-            for key, value in kwargs.items():
-                setattr(object_to_update, key, value)
+            if object_to_update not in self.db:
+                for key, value in kwargs.items():
+                    setattr(object_to_update, key, value)
 
-        self.db.commit()
-        self.refresh(objects_to_update)
+        self._commit()
 
 
 class UserCrud(BaseCrud):
     def __init__(self, db: Session) -> None:
-        self.pwd_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
         super().__init__(models.User, db)
 
-    def get_password_hash(self, password: str) -> str:
-        return self.pwd_context.hash(password)
+    @staticmethod
+    def get_password_hash(password: str) -> str:
+        return get_password_hash(password)
+
+    def create_with_hashed_password(self, user_create: schemas.UserCreate, hashed_password: str) -> Type[Base]:
 
-    def create(self, user_create: schemas.UserCreate) -> Type[Base]:
-        hashed_password = self.get_password_hash(user_create.password)
-        user_create_db = schemas.UserCreateDB(
+        user_cache.delete(user_create.username)
+
+        return super().create(schemas.UserCreateDB(
             hashed_password=hashed_password, username=user_create.username, discord_id=user_create.discord_id
+        ))
+
+    def create(self, user_create: schemas.UserCreate) -> Type[Base]:
+        return self.create_with_hashed_password(user_create, self.get_password_hash(user_create.password))
+
+    def _get_taken_usernames_and_discord_ids(
+            self, users_create: list[schemas.UserBase]
+    ) -> tuple[set[str], set[int]]:
+
+        taken = self.db.execute(select(self.model.username, self.model.discord_id).filter(or_(
+            self.model.username.in_([i.username for i in users_create]),
+            self.model.discord_id.in_([i.discord_id for i in users_create]),
+        ))).all()
+
+        return {i.username for i in taken}, {i.discord_id for i in taken}
+
+    def split_conflicting(
+            self, users_create: list[schemas.UserCreate]
+    ) -> tuple[list[tuple[int, schemas.UserCreate]], list[schemas.UserBulkCreateConflict]]:
+        """
+        Split the users into the ones that can be created (with their indexes) and the conflicts:
+        the users with a username or a discord id of an existing user or of a previous user of the list
+        """
+
+        taken_usernames, taken_discord_ids = self._get_taken_usernames_and_discord_ids(users_create)
+
+        users_to_create, conflicts = [], []
+
+        for row, user_create in enumerate(users_create):
+
+            fields = [
+                field for field, value, taken in (
+                    ('username', user_create.username, taken_usernames),
+                    ('discord_id', user_create.discord_id, taken_discord_ids),
+                )
+                if value in taken
+            ]
+
+            if fields:
+                conflicts.append(schemas.UserBulkCreateConflict(
+                    row=row, fields=fields, **user_create.model_dump(exclude={'password'})
+                ))
+                continue
+
+            users_to_create.append((row, user_create))
+
+            taken_usernames.add(user_create.username)
+            taken_discord_ids.add(user_create.discord_id)
+
+        return users_to_create, conflicts
+
+    def create_many_with_hashed_passwords(
+            self,
+            users_to_create: list[tuple[int, schemas.UserCreate]],
+            hashed_passwords: list[str],
+            scopes_names: Iterable[str] = SETTINGS.DEFAULT_USER_SCOPES,
+    ) -> schemas.UsersBulkCreateResult:
+        """
+        Create the users (split_conflicting result) with the scopes, one multi-row insert and one commit per
+        USERS_BULK_CREATE_BATCH_SIZE users. Users that conflict with concurrently created ones are skipped and reported
+        """
+
+        scopes = [scope_registry.get_by_name(name) for name in scopes_names]
+
+        if None in scopes:
+            raise ValueError(f'Unknown scope in {scopes_names}')
+
+        result = schemas.UsersBulkCreateResult(created=[], conflicts=[])
+
+        batch_size = SETTINGS.USERS_BULK_CREATE_BATCH_SIZE
+
+        for start in range(0, len(users_to_create), batch_size):
+
+            batch = users_to_create[start:start + batch_size]
+
+            created_users = self.db.execute(
+                postgresql.insert(self.model)
+                .values([
+                    {'username': user_create.username, 'discord_id': user_create.discord_id, 'hashed_password': i}
+                    for (_, user_create), i in zip(batch, hashed_passwords[start:start + batch_size])
+                ])
+                .on_conflict_do_nothing()
+                .returning(self.model.id, self.model.username, self.model.discord_id, self.model.is_active)
+            ).all()
+
+            if created_users and scopes:
+                self.db.execute(postgresql.insert(models.UserToScope).values([
+                    {'user_id': user.id, 'scope_id': scope.id} for user in created_users for scope in scopes
+                ]).on_conflict_do_nothing())
+
+            self._commit()
+
+            created_users = {i.username: i for i in created_users}
+
+            not_created = [user_create for _, user_create in batch if user_create.username not in created_users]
+            taken_usernames, taken_discord_ids = (
+                self._get_taken_usernames_and_discord_ids(not_created) if not_created else (set(), set())
+            )
+
+            for row, user_create in batch:
+
+                user_cache.delete(user_create.username)
+
+                if user := created_users.get(user_create.username):
+                    result.created.append(schemas.User(
+                        id=user.id,
+                        username=user.username,
+                        discord_id=user.discord_id,
+                        is_active=user.is_active,
+                        available_scopes=scopes,
+                    ))
+
+                else:
+                    result.conflicts.append(schemas.UserBulkCreateConflict(
+                        row=row,
+                        fields=[
+                            field for field, taken in (
+                                ('username', user_create.username in taken_usernames),
+                                ('discord_id', user_create.discord_id in taken_discord_ids),
+                            )
+                            if taken
+                        ],
+                        **user_create.model_dump(exclude={'password'}),
+                    ))
+
+        return result
+
+    def create_many(
+            self, users_create: list[schemas.UserCreate], scopes_names: Iterable[str] = SETTINGS.DEFAULT_USER_SCOPES
+    ) -> schemas.UsersBulkCreateResult:
+        """
+        Create the users in bulk, the conflicting users are reported, they do not abort the creation of the others
+        """
+
+        users_to_create, conflicts = self.split_conflicting(users_create)
+
+        result = self.create_many_with_hashed_passwords(
+            users_to_create, [self.get_password_hash(i.password) for _, i in users_to_create], scopes_names
         )
-        return super().create(user_create_db)
+
+        result.conflicts = sorted(conflicts + result.conflicts, key=lambda i: i.row)
+
+        return result
+
+    def update(self, objects_to_update: models.User | list[models.User], **kwargs) -> None:
+
+        objects_to_update = self._get_as_list(objects_to_update)
+
+        # the old usernames, the update can change them
+        for user in objects_to_update:
+            user_cache.delete(user.username)
+
+        super().update(objects_to_update, **kwargs)
+
+        # stateless access tokens carry these fields, so the old tokens are revoked
+        revoke_tokens = bool(kwargs.keys() & {'username', 'discord_id', 'is_active'})
+
+        for user in objects_to_update:
+
+            user_cache.delete(user.username)
+
+            if revoke_tokens:
+                token_deny_list.set(user.id, time())
 
 
 class ScopeCrud(BaseCrud):
+    """
+    Refreshes the scope_registry after every change of the scopes
+    """
+
     def __init__(self, db: Session) -> None:
         super().__init__(models.Scope, db)
 
+    def create(self, schema: schemas.ScopeCreate) -> models.Scope:
+        db_object = super().create(schema)
+        scope_registry.refresh(self.db)
+        return db_object
+
+    def create_many_if_not_exist(self, names: Iterable[str]) -> None:
+        """
+        Create all not existing scopes with one upsert
+        """
+
+        if names := [{'name': name} for name in names]:
+
+            self.db.execute(postgresql.insert(self.model).values(names).on_conflict_do_nothing(index_elements=['name']))
+            self._commit()
+
+        scope_registry.refresh(self.db)
+
+    def update(self, objects_to_update: models.Scope | list[models.Scope], **kwargs) -> None:
+        super().update(objects_to_update, **kwargs)
+        scope_registry.refresh(self.db)
+
+
+class ScopeRegistry:
+    """
+    In-memory scopes (id <-> name), there are only a few of them and they are rarely changed.
+    The scopes table is read on the first lookup (or by refresh, lifespan does it on startup) and after that only
+    by refresh, which must be called after scopes changes (ScopeCrud does it)
+    """
+
+    def __init__(self) -> None:
+        self._scopes: tuple[dict[int, schemas.Scope], dict[str, schemas.Scope]] | None = None
+        self._lock = Lock()
+
+    def refresh(self, db: Session) -> None:
+
+        scopes = [schemas.Scope.model_validate(i) for i in db.scalars(select(models.Scope).order_by(models.Scope.id))]
+
+        with self._lock:
+            self._scopes = ({i.id: i for i in scopes}, {i.name: i for i in scopes})
+
+    def _get_scopes(self) -> tuple[dict[int, schemas.Scope], dict[str, schemas.Scope]]:
+
+        if self._scopes is None:
+            with SessionLocal() as db:
+                self.refresh(db)
+
+        return self._scopes
+
+    def get_by_id(self, scope_id: int) -> schemas.Scope | None:
+        return self._get_scopes()[0].get(scope_id)
+
+    def get_by_name(self, name: str) -> schemas.Scope | None:
+        return self._get_scopes()[1].get(name)
+
+    def get_all(self) -> list[schemas.Scope]:
+        return list(self._get_scopes()[0].values())
+
+
+scope_registry = ScopeRegistry()
+
 
 class UserToScopeCrud(BaseCrud):
     def __init__(self, db: Session) -> None:
         super().__init__(models.UserToScope, db)
 
-    def get_user_scopes(self, user: schemas.User) -> list[models.Scope]:
-        return self.db.query(models.Scope).join(self.model).filter(self.model.user_id == user.id).all()
+    def get_user_scopes(self, user: schemas.User) -> list[schemas.Scope]:
+
+        scopes_ids = self.db.scalars(
+            select(self.model.scope_id).filter(self.model.user_id == user.id).order_by(self.model.scope_id)
+        )
+
+        return [scope_registry.get_by_id(i) for i in scopes_ids]
+
+
+def _get_p2p_export_statement(only_reviewed: bool) -> Select:
+    """
+    P2P requests with their creators and reviews with their reviewers, flat, for the exports
+    """
+
+    creator = aliased(models.User, name='creator')
+    reviewer = aliased(models.User, name='reviewer')
+    p2p_request = models.P2PRequest
+    p2p_review = models.P2PReview
+
+    statement = select(
+        p2p_request.id.label('p2p_request_id'),
+        p2p_request.repository_link,
+        p2p_request.comment,
+        p2p_request.publication_date,
+        p2p_request.review_state,
+        p2p_request.creator_id,
+        creator.username.label('creator_username'),
+        creator.discord_id.label('creator_discord_id'),
+        p2p_review.id.label('p2p_review_id'),
+        p2p_review.reviewer_id,
+        reviewer.username.label('reviewer_username'),
+        reviewer.discord_id.label('reviewer_discord_id'),
+        p2p_review.link.label('review_link'),
+        p2p_review.creation_date.label('review_creation_date'),
+        p2p_review.end_date.label('review_end_date'),
+    ).join(creator, creator.id == p2p_request.creator_id)
+
+    return statement.join(
+        p2p_review, p2p_review.p2p_request_id == p2p_request.id, isouter=not only_reviewed
+    ).join(
+        reviewer, reviewer.id == p2p_review.reviewer_id, isouter=not only_reviewed
+    )
+
+
+# the columns of the p2p requests and reviews exports
+P2P_EXPORT_COLUMNS: tuple[str, ...] = tuple(_get_p2p_export_statement(False).selected_columns.keys())
+
+
+def _filter_by_dates(statement: Select, column, date_from: datetime | None, date_to: datetime | None) -> Select:
+
+    if date_from is not None:
+        statement = statement.filter(column >= date_from)
+
+    if date_to is not None:
+        statement = statement.filter(column < date_to)
+
+    return statement
 
 
 class P2PReviewCrud(BaseCrud):
+    """
+    Keeps P2PRequest.review_state in sync with the reviews, the changes are committed together
+    """
+
+    keyset_columns_names = ('creation_date', 'id')
+
     def __init__(self, db: Session) -> None:
         super().__init__(models.P2PReview, db)
 
+    def _set_p2p_requests_review_state(self, p2p_requests_ids: list[int], review_state: ReviewStateEnum) -> None:
+        self.db.execute(
+            update(models.P2PRequest).where(models.P2PRequest.id.in_(p2p_requests_ids)).values(review_state=review_state)
+        )
+
+    def get_export_statement(self, date_from: datetime | None, date_to: datetime | None) -> Select:
+        """
+        The reviews created in [date_from, date_to) with their p2p requests (P2P_EXPORT_COLUMNS)
+        """
+
+        statement = _filter_by_dates(
+            _get_p2p_export_statement(only_reviewed=True), self.model.creation_date, date_from, date_to
+        )
+
+        return statement.order_by(self.model.creation_date, self.model.id)
+
+    def create(self, p2p_review_create: schemas.P2PReviewCreate) -> models.P2PReview:
+        self._set_p2p_requests_review_state([p2p_review_create.p2p_request_id], ReviewStateEnum.PROGRESS)
+        return super().create(p2p_review_create)
+
+    def update(self, objects_to_update: models.P2PReview | list[models.P2PReview], **kwargs) -> None:
+
+        if review_state := kwargs.get('review_state'):
+            self._set_p2p_requests_review_state(
+                [i.p2p_request_id for i in self._get_as_list(objects_to_update)], ReviewStateEnum(review_state)
+            )
+
+        super().update(objects_to_update, **kwargs)
+
+    def release(self, p2p_review: models.P2PReview) -> int:
+        """
+        Delete the review in progress and return its p2p request to the review queue, return the request creator id
+        """
+
+        creator_id = self.db.scalar(
+            update(models.P2PRequest)
+            .where(models.P2PRequest.id == p2p_review.p2p_request_id)
+            .values(review_state=ReviewStateEnum.PENDING)
+            .returning(models.P2PRequest.creator_id)
+        )
+        self.db.execute(delete(self.model).where(self.model.id == p2p_review.id))
+        self._commit()
+
+        return creator_id
+
 
 class P2PRequestCrud(BaseCrud):
+    keyset_columns_names = ('publication_date', 'id')
+
     def __init__(self, db: Session) -> None:
         super().__init__(models.P2PRequest, db)
 
-    def get_oldest_not_user_without_reviews(self, reviewer_id: int) -> models.P2PRequest | None:
-        return self._get_query().filter(
-            ~self.model.p2p_reviews.any(), self.model.creator_id != reviewer_id
-        ).order_by(self.model.publication_date).first()
+    def get_export_statement(self, date_from: datetime | None, date_to: datetime | None) -> Select:
+        """
+        The p2p requests published in [date_from, date_to) with their reviews if any (P2P_EXPORT_COLUMNS)
+        """
+
+        statement = _filter_by_dates(
+            _get_p2p_export_statement(only_reviewed=False), self.model.publication_date, date_from, date_to
+        )
+
+        return statement.order_by(self.model.publication_date, self.model.id)
+
+    def create_many(self, p2p_requests_create: Iterable[schemas.P2PRequestCreate]) -> list[schemas.P2PRequest]:
+        """
+        Create the p2p requests with one multi-row insert per P2P_REQUESTS_BULK_CREATE_BATCH_SIZE requests,
+        all of them in one transaction (all or nothing)
+        """
+
+        statement = insert(self.model).returning(
+            self.model.id, self.model.publication_date, self.model.review_state, sort_by_parameter_order=True
+        )
+
+        p2p_requests_create = iter(p2p_requests_create)
+        p2p_requests = []
+
+        while batch := list(islice(p2p_requests_create, SETTINGS.P2P_REQUESTS_BULK_CREATE_BATCH_SIZE)):
+
+            created = self.db.execute(statement, [i.model_dump() for i in batch])
+
+            p2p_requests.extend(
+                schemas.P2PRequest(
+                    id=i.id,
+                    publication_date=i.publication_date,
+                    review_state=i.review_state,
+                    **p2p_request_create.model_dump(),
+                )
+                for i, p2p_request_create in zip(created, batch)
+            )
+
+        self._commit()
+
+        return p2p_requests
+
+    def claim_oldest_not_user_without_reviews(self, reviewer_id: int, attempts: int = 3) -> models.P2PRequest | None:
+        """
+        Take the oldest not user pending p2p request from the queue (ix_p2p_requests_pending_queue),
+        mark it as in progress and create its review, all in one statement. Requests locked by concurrent claims
+        are skipped (FOR UPDATE SKIP LOCKED), so every concurrent reviewer gets its own request.
+        The p2p_request_id unique index is the last line of defence, a colliding claim is retried
+        """
+
+        claimed_request = select(self.model.id).filter(
+            self.model.review_state == ReviewStateEnum.PENDING, self.model.creator_id != reviewer_id
+        ).order_by(
+            self.model.publication_date, self.model.id
+        ).limit(1).with_for_update(skip_locked=True).cte('claimed_request')
+
+        updated_request = update(self.model).where(self.model.id == claimed_request.c.id).values(
+            review_state=ReviewStateEnum.PROGRESS
+        ).returning(*self.model.__table__.columns).cte('updated_request')
+
+        review = insert(models.P2PReview).from_select(
+            ['reviewer_id', 'p2p_request_id'], select(literal(reviewer_id), updated_request.c.id)
+        ).returning(models.P2PReview.p2p_request_id).cte('review')
+
+        updated_request_entity = aliased(self.model, updated_request)
+
+        statement = select(updated_request_entity).join(
+            review, review.c.p2p_request_id == updated_request_entity.id
+        )
+
+        for attempt in range(attempts):
+
+            # the rollback of a colliding claim must not roll back the rest of the unit of work
+            savepoint = self.db.begin_nested() if self.in_unit_of_work else None
+
+            try:
+
+                p2p_request = self.db.scalars(statement).first()
+
+                if savepoint:
+                    savepoint.commit()
+
+                self._commit()
+
+                return p2p_request
+
+            except IntegrityError:
+
+                (savepoint or self.db).rollback()
+
+                if attempt == attempts - 1:
+                    raise
+
+
+class RateLimitBucketCrud(BaseCrud):
+
+    def __init__(self, db: Session) -> None:
+        super().__init__(models.RateLimitBucket, db)
+
+    def acquire(self, key: str, rate: float, burst: int) -> float:
+        """
+        Take a token from the key bucket (refilled by rate tokens per second up to burst) in one upsert, concurrent
+        workers are serialized by the row lock. Return the tokens left, negative if there was not a whole token
+        (the request is rejected and no token is taken, -tokens is the wait for the next one in tokens)
+        """
+
+        now = func.extract('epoch', func.clock_timestamp())
+
+        # a negative value is the rejected request mark, the bucket has one more token
+        stored_tokens = case((self.model.tokens < 0, self.model.tokens + 1), else_=self.model.tokens)
+        refilled_tokens = func.least(burst, stored_tokens + (now - self.model.updated_at) * rate)
+
+        statement = postgresql.insert(self.model).values(key=key, tokens=burst - 1, updated_at=now)
+
+        statement = statement.on_conflict_do_update(
+            index_elements=[self.model.key], set_={'tokens': refilled_tokens - 1, 'updated_at': now}
+        ).returning(self.model.tokens)
+
+        tokens = self.db.scalar(statement)
+
+        self._commit()
+
+        return tokens
+
+    def delete_refilled(self, refill_seconds: dict[str, float]) -> int:
+        """
+        Delete the buckets refilled up to burst (a new bucket is the same), refill_seconds: the keys prefix ->
+        seconds in which an empty bucket of the limit is refilled (burst / rate). Return the deleted number
+        """
+
+        now = func.extract('epoch', func.clock_timestamp())
+
+        statement = delete(self.model).where(or_(*[
+            and_(self.model.key.startswith(prefix, autoescape=True), self.model.updated_at < now - seconds)
+            for prefix, seconds in refill_seconds.items()
+        ]))
+
+        deleted_number = self.db.execute(statement).rowcount
+
+        self._commit()
+
+        return deleted_number
+
+
+class AsyncBaseCrud(ABC):
+    """
+    Awaitable version of the sync crud (sync_crud_class), reuses its logic and works with both session types:
+    with AsyncSession the logic runs on the async driver (AsyncSession.run_sync),
+    with Session it runs in the threadpool, so the event loop is never blocked by the database
+    """
+
+    sync_crud_class: Type[BaseCrud]
+
+    def __init__(self, db: AsyncSession | Session) -> None:
+        self.db = db
+        self.sync_crud = self.sync_crud_class(db.sync_session if isinstance(db, AsyncSession) else db)
+
+    async def _run(self, function: Callable, *args, **kwargs) -> Any:
+
+        if isinstance(self.db, AsyncSession):
+            return await self.db.run_sync(lambda _: function(*args, **kwargs))
+
+        return await run_in_threadpool(function, *args, **kwargs)
+
+    async def refresh(self, objects_to_refresh: list[Type[Base]] | Type[Base]) -> None:
+        return await self._run(self.sync_crud.refresh, objects_to_refresh)
+
+    async def create(self, schema: Type[schemas.BaseModel]) -> Type[Base]:
+        return await self._run(self.sync_crud.create, schema)
+
+    async def get(self, **kwargs) -> Type[Base]:
+        return await self._run(self.sync_crud.get, **kwargs)
+
+    async def get_many(self, **kwargs) -> list[Type[Base]]:
+        return await self._run(self.sync_crud.get_many, **kwargs)
+
+    async def count(self, *criteria: ColumnElement[bool]) -> int:
+        return await self._run(self.sync_crud.count, *criteria)
+
+    async def get_page(
+            self, after: tuple | None, limit: int, *criteria: ColumnElement[bool], descending: bool = False
+    ) -> tuple[list[Type[Base]], tuple | None]:
+        return await self._run(self.sync_crud.get_page, after, limit, *criteria, descending=descending)
+
+    async def update(self, objects_to_update: Type[Base] | list[Type[Base]], **kwargs) -> None:
+        return await self._run(self.sync_crud.update, objects_to_update, **kwargs)
+
+    async def stream(self, statement: Select) -> AsyncIterator[list[RowMapping]]:
+        """
+        See BaseCrud.stream, with AsyncSession the server-side cursor is of the async driver
+        """
+
+        if isinstance(self.db, AsyncSession):
+
+            result = await self.db.stream(statement.execution_options(yield_per=SETTINGS.EXPORT_BATCH_SIZE))
+
+            async for partition in result.mappings().partitions():
+                yield partition
+
+        else:
+            async for partition in iterate_in_threadpool(self.sync_crud.stream(statement)):
+                yield partition
+
+    async def stream_export(
+            self, date_from: datetime | None, date_to: datetime | None
+    ) -> AsyncIterator[list[RowMapping]]:
+        """
+        For the cruds with the exports (get_export_statement)
+        """
+        async for partition in self.stream(self.sync_crud.get_export_statement(date_from, date_to)):
+            yield partition
+
+
+class AsyncUserCrud(AsyncBaseCrud):
+    sync_crud_class = UserCrud
+
+    async def create(self, user_create: schemas.UserCreate) -> Type[Base]:
+        # hashing is CPU-bound, so it is done in the password executor, not with the database logic
+        hashed_password = await get_password_hash_async(user_create.password)
+        return await self._run(self.sync_crud.create_with_hashed_password, user_create, hashed_password)
+
+    async def create_many(
+            self, users_create: list[schemas.UserCreate], scopes_names: Iterable[str] = SETTINGS.DEFAULT_USER_SCOPES
+    ) -> schemas.UsersBulkCreateResult:
+
+        users_to_create, conflicts = await self._run(self.sync_crud.split_conflicting, users_create)
+
+        # hashed in parallel by the password executor processes if it is started, else in the threadpool
+        # (with several workers PASSWORD_HASHING_PROCESSES is 0 by default)
+        hashed_passwords = await gather(*[get_password_hash_async(i.password) for _, i in users_to_create])
+
+        result = await self._run(
+            self.sync_crud.create_many_with_hashed_passwords, users_to_create, hashed_passwords, scopes_names
+        )
+
+        result.conflicts = sorted(conflicts + result.conflicts, key=lambda i: i.row)
+
+        return result
+
+
+class AsyncScopeCrud(AsyncBaseCrud):
+    sync_crud_class = ScopeCrud
+
+    async def create_many_if_not_exist(self, names: Iterable[str]) -> None:
+        return await self._run(self.sync_crud.create_many_if_not_exist, names)
+
+
+class AsyncUserToScopeCrud(AsyncBaseCrud):
+    sync_crud_class = UserToScopeCrud
+
+    async def get_user_scopes(self, user: schemas.User) -> list[schemas.Scope]:
+        return await self._run(self.sync_crud.get_user_scopes, user)
+
+
+class AsyncP2PReviewCrud(AsyncBaseCrud):
+    sync_crud_class = P2PReviewCrud
+
+    async def release(self, p2p_review: models.P2PReview) -> int:
+        return await self._run(self.sync_crud.release, p2p_review)
+
+
+class AsyncP2PRequestCrud(AsyncBaseCrud):
+    sync_crud_class = P2PRequestCrud
+
+    async def create_many(self, p2p_requests_create: Iterable[schemas.P2PRequestCreate]) -> list[schemas.P2PRequest]:
+        return await self._run(self.sync_crud.create_many, p2p_requests_create)
+
+    async def claim_oldest_not_user_without_reviews(
+            self, reviewer_id: int, attempts: int = 3
+    ) -> models.P2PRequest | None:
+        return await self._run(self.sync_crud.claim_oldest_not_user_without_reviews, reviewer_id, attempts)
+
+
+class AsyncRateLimitBucketCrud(AsyncBaseCrud):
+    sync_crud_class = RateLimitBucketCrud
+
+    async def acquire(self, key: str, rate: float, burst: int) -> float:
+        return await self._run(self.sync_crud.acquire, key, rate, burst)
+
+    async def delete_refilled(self, refill_seconds: dict[str, float]) -> int:
+        return await self._run(self.sync_crud.delete_refilled, refill_seconds)
@@ -1,23 +1,156 @@
-from sqlalchemy import create_engine
+from contextlib import contextmanager, asynccontextmanager
+from typing import AsyncGenerator, Generator
+
+from fastapi import Request
+from sqlalchemy import create_engine, make_url, pool
 from sqlalchemy.orm import sessionmaker, Session, declarative_base
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from starlette.concurrency import run_in_threadpool
 
-from core.config import get_settings
+from core.config import AUXILIARY_MAX_OVERFLOW, AUXILIARY_POOL_SIZE, get_settings
 
 
 SETTINGS = get_settings()
 
-engine = create_engine(str(SETTINGS.DATABASE_URL_TEST) if SETTINGS.IS_TEST else str(SETTINGS.DATABASE_URL))
+DATABASE_URL = str(SETTINGS.DATABASE_URL_TEST) if SETTINGS.IS_TEST else str(SETTINGS.DATABASE_URL)
+
+# the pool of the engine used by the routers is sized by the connections budget of a worker (see get_settings)
+ROUTE_POOL_LIMITS = {'pool_size': SETTINGS.DATABASE_POOL_SIZE, 'max_overflow': SETTINGS.DATABASE_MAX_OVERFLOW}
+AUXILIARY_POOL_LIMITS = {'pool_size': AUXILIARY_POOL_SIZE, 'max_overflow': AUXILIARY_MAX_OVERFLOW}
+
+# the tests use the sync engine whatever the routers use
+engine = create_engine(
+    DATABASE_URL, **(AUXILIARY_POOL_LIMITS if SETTINGS.ASYNC_DATABASE and not SETTINGS.IS_TEST else ROUTE_POOL_LIMITS)
+)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# the objects are not expired on commit, crud writes get the server values back by RETURNING instead of a refresh
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, expire_on_commit=False)
+
+# the test client starts a new event loop for every request, so asyncpg connections can not be reused between them
+async_engine = create_async_engine(
+    make_url(DATABASE_URL).set(drivername='postgresql+asyncpg'),
+    **(
+        {'poolclass': pool.NullPool} if SETTINGS.IS_TEST
+        else ROUTE_POOL_LIMITS if SETTINGS.ASYNC_DATABASE
+        else AUXILIARY_POOL_LIMITS
+    ),
+)
+
+AsyncSessionLocal = async_sessionmaker(autoflush=False, bind=async_engine, expire_on_commit=False)
 
 Base = declarative_base()
 
+# the session info key of the unit of work flag, crud flushes instead of committing while it is set
+UNIT_OF_WORK_KEY = 'unit_of_work'
 
-def get_db():
-    with SessionLocal() as db:
+
+def get_db(request: Request) -> Generator[Session, None, None]:
+    """
+    One session per request. FastAPI caches dependencies per security scopes too, so a security dependency
+    (LoginManager) would get its own session without the request state
+    """
+
+    if (db := getattr(request.state, 'db', None)) is not None:
         yield db
 
+    else:
+        with SessionLocal() as db:
+            request.state.db = db
+            yield db
+
+
+async def get_async_db(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    """
+    One session per request, see get_db
+    """
+
+    if (db := getattr(request.state, 'db', None)) is not None:
+        yield db
+
+    else:
+        async with AsyncSessionLocal() as db:
+            request.state.db = db
+            yield db
+
+
+# routers must depend on this, it gives a session according to the ASYNC_DATABASE setting
+get_route_db = get_async_db if SETTINGS.ASYNC_DATABASE else get_db
+
 
 def get_db_not_dependency() -> Session:
     with SessionLocal() as db:
         return db
+
+
+@asynccontextmanager
+async def get_route_db_not_dependency() -> AsyncGenerator[AsyncSession | Session, None]:
+    """
+    A session of the routers type (see get_route_db) for the code running after the dependencies are closed,
+    for example streaming responses
+    """
+
+    if SETTINGS.ASYNC_DATABASE:
+        async with AsyncSessionLocal() as db:
+            yield db
+
+    else:
+        with SessionLocal() as db:
+            yield db
+
+
+@contextmanager
+def unit_of_work(db: Session) -> Generator[Session, None, None]:
+    """
+    Group crud calls into one transaction: they only flush, the transaction is committed on exit
+    (rolled back on an exception). A nested unit of work is a part of the outer one
+    """
+
+    if db.info.get(UNIT_OF_WORK_KEY):
+        yield db
+        return
+
+    db.info[UNIT_OF_WORK_KEY] = True
+
+    try:
+        yield db
+        db.commit()
+
+    except BaseException:
+        db.rollback()
+        raise
+
+    finally:
+        db.info.pop(UNIT_OF_WORK_KEY, None)
+
+
+@asynccontextmanager
+async def async_unit_of_work(db: AsyncSession | Session) -> AsyncGenerator[AsyncSession | Session, None]:
+    """
+    unit_of_work for routers, works with both session types (see get_route_db)
+    """
+
+    if db.info.get(UNIT_OF_WORK_KEY):
+        yield db
+        return
+
+    db.info[UNIT_OF_WORK_KEY] = True
+
+    try:
+        yield db
+
+        if isinstance(db, AsyncSession):
+            await db.commit()
+        else:
+            await run_in_threadpool(db.commit)
+
+    except BaseException:
+
+        if isinstance(db, AsyncSession):
+            await db.rollback()
+        else:
+            await run_in_threadpool(db.rollback)
+
+        raise
+
+    finally:
+        db.info.pop(UNIT_OF_WORK_KEY, None)
@@ -1,4 +1,6 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, UniqueConstraint, BigInteger, DateTime, Enum
+from sqlalchemy import (
+    Column, Integer, String, Boolean, ForeignKey, UniqueConstraint, BigInteger, DateTime, Enum, Index, Float
+)
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 
@@ -43,12 +45,32 @@ class UserToScope(Base):
 
 class P2PRequest(Base):
     __tablename__ = 'p2p_requests'
+    __table_args__ = (
+        # the pending review queue, the oldest pending request is the first entry of this index
+        Index(
+            'ix_p2p_requests_pending_queue',
+            'publication_date',
+            'id',
+            postgresql_include=['creator_id'],
+            postgresql_where="review_state = 'pending'",
+        ),
+        # keyset pagination of the requests of a user and of all the requests
+        Index('ix_p2p_requests_creator_id_publication_date_id', 'creator_id', 'publication_date', 'id'),
+        Index('ix_p2p_requests_publication_date_id', 'publication_date', 'id'),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     repository_link = Column(String, index=True, nullable=False)
     comment = Column(String, nullable=False, default='')
     creator_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     publication_date = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    # denormalized state of the request review, P2PReviewCrud keeps it in sync with the reviews
+    review_state = Column(
+        Enum(ReviewStateEnum, name='review_state_enums', values_callable=lambda obj: [e.value for e in obj]),
+        nullable=False,
+        default=ReviewStateEnum.PENDING,
+        server_default=ReviewStateEnum.PENDING.value,
+    )
 
     creator = relationship('User', back_populates='p2p_requests')
     p2p_reviews = relationship('P2PReview', back_populates='p2p_request')
@@ -56,6 +78,11 @@ class P2PRequest(Base):
 
 class P2PReview(Base):
     __tablename__ = 'p2p_reviews'
+    __table_args__ = (
+        # keyset pagination of the reviews of a user and of all the reviews
+        Index('ix_p2p_reviews_reviewer_id_creation_date_id', 'reviewer_id', 'creation_date', 'id'),
+        Index('ix_p2p_reviews_creation_date_id', 'creation_date', 'id'),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     link = Column(String)
@@ -67,7 +94,22 @@ class P2PReview(Base):
         default=ReviewStateEnum.PROGRESS,
     )
     reviewer_id = Column(Integer, ForeignKey('users.id'), nullable=False)
-    p2p_request_id = Column(Integer, ForeignKey('p2p_requests.id'), nullable=False)
+    p2p_request_id = Column(Integer, ForeignKey('p2p_requests.id'), unique=True, index=True, nullable=False)
 
     reviewer = relationship('User', back_populates='p2p_reviews')
     p2p_request = relationship('P2PRequest', back_populates='p2p_reviews')
+
+
+class RateLimitBucket(Base):
+    """
+    The token buckets of the shared rate limiter backend (RATE_LIMIT_BACKEND=postgres). The table is unlogged,
+    the buckets are lost on a database crash, that only resets the limits
+    """
+
+    __tablename__ = 'rate_limit_buckets'
+    __table_args__ = {'prefixes': ['UNLOGGED']}
+
+    key = Column(String, primary_key=True)
+    # negative - the last request was rejected, the bucket had tokens + 1 tokens (see RateLimitBucketCrud.acquire)
+    tokens = Column(Float, nullable=False)
+    updated_at = Column(Float, nullable=False)  # unix time by the database clock
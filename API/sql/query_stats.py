@@ -0,0 +1,48 @@
+from collections import Counter
+from contextvars import ContextVar
+from time import perf_counter
+
+from sqlalchemy import event
+
+from .database import engine, async_engine
+
+
+class QueryStats:
+    """
+    The queries of a unit of code (a request): their number, total time (seconds) and the number of every statement
+    """
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.duration = 0.0
+        self.statements: Counter[str] = Counter()
+
+    def add(self, statement: str, duration: float) -> None:
+        self.count += 1
+        self.duration += duration
+        self.statements[statement] += 1
+
+    def get_repeated_statements(self, threshold: int) -> list[tuple[str, int]]:
+        """
+        The statements executed at least threshold times, a sign of N+1 queries (like lazy loads in a loop)
+        """
+        return [(statement, count) for statement, count in self.statements.most_common() if count >= threshold]
+
+
+# the stats of the current request, QueryStatsMiddleware sets them. The threadpool and the async driver greenlets
+# copy the context, they get the same (mutable) stats object
+current_query_stats: ContextVar[QueryStats | None] = ContextVar('current_query_stats', default=None)
+
+
+def _before_cursor_execute(connection, cursor, statement, parameters, context, executemany) -> None:
+    context.query_start_time = perf_counter()
+
+
+def _after_cursor_execute(connection, cursor, statement, parameters, context, executemany) -> None:
+    if (query_stats := current_query_stats.get()) is not None:
+        query_stats.add(statement, perf_counter() - context.query_start_time)
+
+
+for instrumented_engine in (engine, async_engine.sync_engine):
+    event.listen(instrumented_engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(instrumented_engine, 'after_cursor_execute', _after_cursor_execute)
@@ -1,8 +1,13 @@
 from typing import Generator
 
 from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlalchemy.orm import Session
 
+from core.config import get_settings
 from core.login_manager import login_manager
+from sql.crud import ScopeCrud
+from sql.database import engine, async_engine
 
 
 class UserAccessCookie:
@@ -25,6 +30,30 @@ class UserAccessCookie:
         self.client.cookies.clear()
 
 
+class ConnectionCheckoutsCounter:
+    """
+    Count connection checkouts from the pools of both (sync and async) engines
+    """
+
+    def __init__(self) -> None:
+        self.engines = (engine, async_engine.sync_engine)
+        self.checkouts = 0
+
+    def _on_checkout(self, *_) -> None:
+        self.checkouts += 1
+
+    def __enter__(self):
+
+        for counted_engine in self.engines:
+            event.listen(counted_engine, 'checkout', self._on_checkout)
+
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        for counted_engine in self.engines:
+            event.remove(counted_engine, 'checkout', self._on_checkout)
+
+
 def _get_new_discord_id() -> Generator[int, None, None]:
 
     i = 0
@@ -62,3 +91,10 @@ def get_field_detail_type(details: list[dict], field_name: str) -> str:
             return detail['type']
 
     return ''
+
+
+def create_scopes(db: Session) -> None:
+    """
+    Create all scopes, that are not in the database yet (test modules share the database)
+    """
+    ScopeCrud(db).create_many_if_not_exist(get_settings().OAUTH2_SCHEME_SCOPES)
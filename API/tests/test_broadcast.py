@@ -0,0 +1,243 @@
+from asyncio import run, sleep, to_thread, wait_for
+
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from core import schemas
+from core.main import app
+from core.config import get_settings
+from core.broadcast import (
+    Broadcaster, PostgresBroadcaster, broadcaster, publish_review_available, format_sse, END_OF_EVENTS
+)
+from routers import p2p_request
+from routers.p2p_request import iterate_review_events
+from sql.crud import UserCrud, P2PRequestCrud
+from sql.database import get_db_not_dependency, engine, DATABASE_URL
+from _testing_utils import UserAccessCookie, get_new_discord_id, create_scopes
+
+
+SETTINGS = get_settings()
+
+client = TestClient(app)
+
+CONNECTED_CHUNK = f': connected\nretry: {SETTINGS.SSE_RETRY_SECONDS * 1000}\n\n'
+
+db = get_db_not_dependency()
+
+create_scopes(db)
+
+test_creator = UserCrud(db).create(schemas.UserCreate(
+    username='events_creator', password='events_creator', discord_id=next(get_new_discord_id)
+))
+test_reviewer = UserCrud(db).create(schemas.UserCreate(
+    username='events_reviewer', password='events_reviewer', discord_id=next(get_new_discord_id)
+))
+
+
+class TestBroadcaster:
+
+    @staticmethod
+    def test_fan_out():
+
+        test_broadcaster = Broadcaster(2)
+
+        async def subscribe_and_publish() -> tuple[list[dict], list[dict]]:
+
+            async with test_broadcaster.subscribe() as first_queue, test_broadcaster.subscribe() as second_queue:
+
+                assert len(test_broadcaster) == 2
+
+                for i in range(3):
+                    await test_broadcaster.publish({'number': i})
+
+                # the events are put by the loop callbacks
+                events = [await wait_for(first_queue.get(), 1) for _ in range(2)]
+                second_events = [await wait_for(second_queue.get(), 1) for _ in range(2)]
+
+            assert len(test_broadcaster) == 0
+
+            return events, second_events
+
+        # the oldest event is dropped from the full queues
+        assert run(subscribe_and_publish()) == ([{'number': 1}, {'number': 2}], [{'number': 1}, {'number': 2}])
+
+    @staticmethod
+    def test_postgres():
+
+        test_broadcaster = PostgresBroadcaster(10, DATABASE_URL, 'test_review_events')
+
+        async def subscribe_and_publish() -> dict:
+
+            await test_broadcaster.start()
+
+            try:
+                async with test_broadcaster.subscribe() as queue:
+                    await test_broadcaster.publish({'reason': 'created', 'creators_ids': [1]})
+                    return await wait_for(queue.get(), 5)
+
+            finally:
+                await test_broadcaster.stop()
+
+        assert run(subscribe_and_publish()) == {'reason': 'created', 'creators_ids': [1]}
+
+    @staticmethod
+    def test_postgres_reconnect():
+
+        test_broadcaster = PostgresBroadcaster(
+            10, DATABASE_URL, 'test_reconnect_events', check_interval=0.1, reconnect_delays=(0.05, 0.1)
+        )
+
+        def terminate_backend(pid: int) -> None:
+            with engine.begin() as connection:
+                connection.execute(text('SELECT pg_terminate_backend(:pid)'), {'pid': pid})
+
+        async def wait_connected() -> None:
+            while not test_broadcaster.connected:
+                await sleep(0.05)
+
+        async def lose_connection_and_publish() -> tuple[dict | None, dict]:
+
+            await test_broadcaster.start()
+
+            try:
+                async with test_broadcaster.subscribe() as queue:
+
+                    # like a postgres restart
+                    await to_thread(terminate_backend, test_broadcaster._connection.get_server_pid())
+
+                    # the events may be lost, so the subscriptions end
+                    end_of_events = await wait_for(queue.get(), 5)
+
+                async with test_broadcaster.subscribe() as queue:
+
+                    await wait_for(wait_connected(), 5)
+
+                    await test_broadcaster.publish({'reason': 'released', 'creators_ids': [1]})
+
+                    return end_of_events, await wait_for(queue.get(), 5)
+
+            finally:
+                await test_broadcaster.stop()
+
+        assert run(lose_connection_and_publish()) == (END_OF_EVENTS, {'reason': 'released', 'creators_ids': [1]})
+
+
+class TestReviewEvents:
+
+    @staticmethod
+    def test_own_requests_are_skipped():
+
+        async def read_events() -> list[str]:
+
+            events = iterate_review_events(test_reviewer.id)
+
+            chunks = [await anext(events)]
+
+            await publish_review_available('created', {test_reviewer.id})
+            await publish_review_available('released', {test_reviewer.id, test_creator.id})
+
+            chunks.append(await wait_for(anext(events), 1))
+
+            await events.aclose()
+
+            return chunks
+
+        assert run(read_events()) == [
+            CONNECTED_CHUNK,
+            format_sse(
+                'review_available',
+                {'reason': 'released', 'creators_ids': sorted([test_reviewer.id, test_creator.id])},
+            ),
+        ]
+
+    @staticmethod
+    def test_heartbeat(monkeypatch):
+
+        monkeypatch.setattr(SETTINGS, 'SSE_HEARTBEAT_SECONDS', 0.01)
+
+        async def read_events() -> list[str]:
+
+            events = iterate_review_events(test_reviewer.id)
+
+            chunks = [await anext(events), await wait_for(anext(events), 1)]
+
+            await events.aclose()
+
+            return chunks
+
+        assert run(read_events()) == [CONNECTED_CHUNK, ': heartbeat\n\n']
+
+    @staticmethod
+    def test_end_of_events():
+
+        async def read_events() -> list[str]:
+
+            events = iterate_review_events(test_reviewer.id)
+
+            chunks = [await anext(events)]
+
+            broadcaster._end_subscriptions()
+
+            # the stream ends
+            chunks += [chunk async for chunk in events]
+
+            return chunks
+
+        assert run(read_events()) == [CONNECTED_CHUNK]
+        assert len(broadcaster) == 0
+
+    @staticmethod
+    def test_not_authorized():
+        assert client.get('/p2p_request/review/events').status_code == 401
+
+    @staticmethod
+    def test_not_connected(monkeypatch):
+
+        # not started, so not connected
+        monkeypatch.setattr(p2p_request, 'broadcaster', PostgresBroadcaster(10, DATABASE_URL))
+
+        with UserAccessCookie(client, test_reviewer.username, 'p2p_request'):
+            response = client.get('/p2p_request/review/events')
+
+        assert response.status_code == 503
+        assert response.headers['retry-after'] == str(SETTINGS.SSE_RETRY_SECONDS)
+
+
+class TestPublishingRoutes:
+
+    @staticmethod
+    def test_create_and_release():
+
+        async def request_and_get_event(method: str, url: str, params: dict) -> dict:
+
+            async with broadcaster.subscribe() as queue:
+
+                # the route publishes in the event loop of the test client
+                response = await to_thread(client.request, method, url, params=params)
+
+                assert response.status_code == 200
+
+                return await wait_for(queue.get(), 1)
+
+        with UserAccessCookie(client, test_creator.username, 'p2p_request'):
+            event = run(request_and_get_event(
+                'POST', '/p2p_request/create', {'repository_link': 'events_link', 'comment': ''}
+            ))
+
+        assert event == {'reason': 'created', 'creators_ids': [test_creator.id]}
+
+        p2p_request = P2PRequestCrud(db).get(repository_link='events_link')
+
+        with UserAccessCookie(client, test_reviewer.username, 'p2p_request'):
+
+            assert client.get('/p2p_request/review/start').json()['id'] == p2p_request.id
+
+            event = run(request_and_get_event(
+                'POST', '/p2p_request/review/release', {'p2p_request_id': p2p_request.id}
+            ))
+
+            assert event == {'reason': 'released', 'creators_ids': [test_creator.id]}
+
+            # the released request is completed so the other tests do not get it
+            assert client.get('/p2p_request/review/start').json()['id'] == p2p_request.id
+            client.post('/p2p_request/review/complete', params={'link': 'link', 'p2p_request_id': p2p_request.id})
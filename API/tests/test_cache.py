@@ -0,0 +1,161 @@
+from asyncio import run
+from datetime import timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from core import cache, schemas
+from core.cache import TTLCache, TokenDenyList, user_cache, token_payload_cache
+from core.login_manager import login_manager
+from sql.crud import UserCrud
+from sql.database import get_db_not_dependency, SessionLocal
+from routers.users import get_user
+from _testing_utils import get_new_discord_id
+
+
+db = get_db_not_dependency()
+
+
+class TestTTLCache:
+
+    @staticmethod
+    def test_hits_and_misses():
+
+        test_cache = TTLCache(max_size=2, ttl=60)
+
+        assert test_cache.get('key') is None
+
+        test_cache.set('key', 'value')
+
+        assert test_cache.get('key') == 'value'
+        assert test_cache.hits == 1
+        assert test_cache.misses == 1
+        assert test_cache.hit_ratio == 0.5
+
+    @staticmethod
+    def test_least_recently_used_is_evicted():
+
+        test_cache = TTLCache(max_size=2, ttl=60)
+
+        test_cache.set('first', 1)
+        test_cache.set('second', 2)
+        test_cache.get('first')
+        test_cache.set('third', 3)
+
+        assert len(test_cache) == 2
+        assert test_cache.get('second') is None
+        assert test_cache.get('first') == 1
+        assert test_cache.get('third') == 3
+
+    @staticmethod
+    def test_expired(monkeypatch):
+
+        test_cache = TTLCache(max_size=2, ttl=60)
+
+        test_cache.set('key', 'value')
+        test_cache.set('short_key', 'value', ttl=1)
+
+        now = cache.monotonic()
+
+        monkeypatch.setattr(cache, 'monotonic', lambda: now + 30)
+
+        assert test_cache.get('key') == 'value'
+        assert test_cache.get('short_key') is None
+
+        monkeypatch.setattr(cache, 'monotonic', lambda: now + 61)
+
+        assert test_cache.get('key') is None
+        assert len(test_cache) == 0
+
+
+class TestTokenDenyList:
+
+    @staticmethod
+    def test_not_expired_are_not_evicted(monkeypatch):
+
+        deny_list = TokenDenyList(max_size=2, ttl=60)
+
+        now = cache.monotonic()
+
+        deny_list.set(1, 100.0)
+        deny_list.set(2, 200.0)
+
+        # the third revocation is not kept, so the tokens issued before it are checked by the database
+        deny_list.set(3, 300.0)
+
+        assert (deny_list.get(1), deny_list.get(2), deny_list.get(3)) == (100.0, 200.0, None)
+        assert deny_list.overflows == 1
+        assert not deny_list.is_complete(issued_at=250.0)
+        assert deny_list.is_complete(issued_at=301.0)
+
+        # the revoked tokens expire, the expired revocations make room
+        monkeypatch.setattr(cache, 'monotonic', lambda: now + 61)
+
+        assert deny_list.is_complete(issued_at=250.0)
+
+        deny_list.set(4, 400.0)
+
+        assert deny_list.get(4) == 400.0
+        assert len(deny_list) == 1
+
+
+class TestUserCache:
+
+    @staticmethod
+    def load_user(username: str):
+        with SessionLocal() as loader_db:
+            return run(get_user(username, loader_db))
+
+    def test_user_loader_is_cached_and_invalidated(self):
+
+        user = UserCrud(db).create(schemas.UserCreate(
+            username='cached_user', password='cached_user', discord_id=next(get_new_discord_id)
+        ))
+
+        hits_before = user_cache.hits
+
+        assert self.load_user(user.username).is_active
+        assert self.load_user(user.username).is_active
+        assert user_cache.hits == hits_before + 1
+
+        UserCrud(db).update(user, is_active=False)
+
+        assert not self.load_user(user.username).is_active
+
+        UserCrud(db).update(user, username='renamed_cached_user')
+
+        assert self.load_user('cached_user') is None
+        assert self.load_user('renamed_cached_user').id == user.id
+
+
+class TestTokenPayloadCache:
+
+    @staticmethod
+    def test_verified_payload_is_cached():
+
+        token = login_manager.create_access_token(data={'sub': 'payload_cache_user', 'scopes': ['me']})
+
+        hits_before = token_payload_cache.hits
+
+        assert login_manager._get_payload(token)['sub'] == 'payload_cache_user'
+        assert login_manager._get_payload(token)['sub'] == 'payload_cache_user'
+        assert token_payload_cache.hits == hits_before + 1
+
+    @staticmethod
+    def test_invalid_token_is_not_cached():
+
+        token = login_manager.create_access_token(data={'sub': 'payload_cache_user'})
+
+        size_before = len(token_payload_cache)
+
+        with pytest.raises(HTTPException):
+            login_manager._get_payload(token[:-2])
+
+        expired_token = login_manager.create_access_token(
+            data={'sub': 'payload_cache_user'}, expires=timedelta(seconds=-1)
+        )
+
+        with pytest.raises(HTTPException):
+            login_manager._get_payload(expired_token)
+
+        assert len(token_payload_cache) == size_before
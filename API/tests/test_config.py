@@ -0,0 +1,114 @@
+from pytest import raises
+
+from core import config
+from core.config import get_settings, set_database_pool_limits, set_workers_defaults
+
+
+SETTINGS = get_settings()
+
+
+def make_settings(**settings):
+    return SETTINGS.model_copy(update={'DATABASE_POOL_SIZE': None, 'DATABASE_MAX_OVERFLOW': None} | settings)
+
+
+class TestDatabasePoolLimits:
+
+    @staticmethod
+    def test_limits_from_budget():
+
+        settings = make_settings(
+            WEB_WORKERS=4, DATABASE_MAX_CONNECTIONS=100, DATABASE_RESERVED_CONNECTIONS=10, ASYNC_DATABASE=True
+        )
+        set_database_pool_limits(settings)
+
+        # 90 // 4 - 2 auxiliary connections
+        assert (settings.DATABASE_POOL_SIZE, settings.DATABASE_MAX_OVERFLOW) == (10, 10)
+
+        settings = make_settings(
+            WEB_WORKERS=1, DATABASE_MAX_CONNECTIONS=100, ASYNC_DATABASE=False, WEB_THREADPOOL_SIZE=16
+        )
+        set_database_pool_limits(settings)
+
+        assert (settings.DATABASE_POOL_SIZE, settings.DATABASE_MAX_OVERFLOW) == (8, 8)
+
+        settings = make_settings(
+            WEB_WORKERS=4, DATABASE_MAX_CONNECTIONS=100, ASYNC_DATABASE=True, BROADCAST_BACKEND='postgres'
+        )
+        set_database_pool_limits(settings)
+
+        # and the LISTEN connection of every worker
+        assert (settings.DATABASE_POOL_SIZE, settings.DATABASE_MAX_OVERFLOW) == (9, 10)
+
+    @staticmethod
+    def test_limits_over_budget():
+
+        with raises(ValueError):
+            set_database_pool_limits(make_settings(WEB_WORKERS=8, DATABASE_MAX_CONNECTIONS=50, DATABASE_POOL_SIZE=5))
+
+        with raises(ValueError):
+            set_database_pool_limits(make_settings(WEB_WORKERS=100, DATABASE_MAX_CONNECTIONS=100))
+
+
+class TestWorkersDefaults:
+
+    @staticmethod
+    def test_broadcast_backend():
+
+        settings = make_settings(WEB_WORKERS=1, BROADCAST_BACKEND='auto')
+        set_workers_defaults(settings)
+
+        assert settings.BROADCAST_BACKEND == 'memory'
+
+        # the events must reach the subscribers of every worker
+        settings = make_settings(WEB_WORKERS=4, BROADCAST_BACKEND='auto')
+        set_workers_defaults(settings)
+
+        assert settings.BROADCAST_BACKEND == 'postgres'
+
+        with raises(ValueError):
+            set_workers_defaults(make_settings(WEB_WORKERS=4, BROADCAST_BACKEND='memory'))
+
+    @staticmethod
+    def test_stateless_auth():
+
+        set_workers_defaults(make_settings(WEB_WORKERS=1, STATELESS_AUTH=True))
+
+        # the tokens are revoked only in one worker
+        with raises(ValueError):
+            set_workers_defaults(make_settings(WEB_WORKERS=4, BROADCAST_BACKEND='postgres', STATELESS_AUTH=True))
+
+    @staticmethod
+    def test_user_cache_ttl():
+
+        settings = make_settings(WEB_WORKERS=1, USER_CACHE_TTL_SECONDS=None)
+        set_workers_defaults(settings)
+
+        assert settings.USER_CACHE_TTL_SECONDS == 60
+
+        # the changes of the other workers are seen only when the cached users expire
+        settings = make_settings(WEB_WORKERS=4, BROADCAST_BACKEND='postgres', USER_CACHE_TTL_SECONDS=None)
+        set_workers_defaults(settings)
+
+        assert settings.USER_CACHE_TTL_SECONDS == 5
+
+    @staticmethod
+    def test_password_hashing_processes(monkeypatch):
+
+        monkeypatch.setattr(config, 'cpu_count', lambda: 8)
+
+        settings = make_settings(WEB_WORKERS=1, PASSWORD_HASHING_PROCESSES=None)
+        set_workers_defaults(settings)
+
+        assert settings.PASSWORD_HASHING_PROCESSES == 2
+
+        # the workers use all the CPUs
+        settings = make_settings(WEB_WORKERS=0, PASSWORD_HASHING_PROCESSES=None, BROADCAST_BACKEND='auto')
+        set_workers_defaults(settings)
+
+        assert (settings.WEB_WORKERS, settings.PASSWORD_HASHING_PROCESSES) == (8, 0)
+
+        # every worker and its hashing processes get 1 + 3 CPUs
+        settings = make_settings(WEB_WORKERS=0, PASSWORD_HASHING_PROCESSES=3, BROADCAST_BACKEND='auto')
+        set_workers_defaults(settings)
+
+        assert (settings.WEB_WORKERS, settings.PASSWORD_HASHING_PROCESSES) == (2, 3)
@@ -0,0 +1,171 @@
+from gzip import decompress
+
+from fastapi.testclient import TestClient
+
+from core import schemas
+from core.config import get_settings
+from core.main import app
+from core.middlewares import make_etag
+from sql.crud import UserCrud
+from sql.database import get_db_not_dependency
+from _testing_utils import UserAccessCookie, get_new_discord_id
+
+
+SETTINGS = get_settings()
+
+client = TestClient(app)
+
+db = get_db_not_dependency()
+
+test_user = UserCrud(db).create(
+    schemas.UserCreate(username='http_caching_user', password='http_caching_user', discord_id=next(get_new_discord_id))
+)
+
+
+class TestCompression:
+
+    @staticmethod
+    def test_gzip():
+
+        response = client.get('/metrics', headers={'Accept-Encoding': 'br;q=0, gzip'})
+
+        assert response.headers['content-encoding'] == 'gzip'
+        assert response.headers['vary'] == 'Accept-Encoding'
+        assert response.text.startswith('# HELP')
+
+        # the raw body is gzip, httpx decompresses it
+        assert int(response.headers['content-length']) < len(response.content)
+
+    @staticmethod
+    def test_not_compressed():
+
+        response = client.get('/metrics', headers={'Accept-Encoding': 'identity'})
+
+        assert 'content-encoding' not in response.headers
+
+        # smaller than COMPRESSION_MINIMUM_SIZE
+        with UserAccessCookie(client, test_user.username, 'me'):
+            response = client.get('/users/me', headers={'Accept-Encoding': 'gzip'})
+
+        assert 'content-encoding' not in response.headers
+        assert response.headers['vary'] == 'Accept-Encoding'
+
+    @staticmethod
+    def test_streamed_gzip(monkeypatch):
+
+        monkeypatch.setattr(SETTINGS, 'COMPRESSION_MINIMUM_SIZE', 0)
+
+        chunks = []
+
+        with UserAccessCookie(client, test_user.username, 'me'):
+            with client.stream('GET', '/metrics', headers={'Accept-Encoding': 'gzip'}) as response:
+                chunks = list(response.iter_raw())
+
+        assert response.headers['content-encoding'] == 'gzip'
+        assert decompress(b''.join(chunks)).startswith(b'# HELP')
+
+
+class TestETag:
+
+    @staticmethod
+    def test_not_modified(monkeypatch):
+
+        with UserAccessCookie(client, test_user.username, 'me'):
+
+            response = client.get('/users/me', headers={'Accept-Encoding': 'identity'})
+
+            etag = response.headers['etag']
+
+            def build_body(*_):
+                raise AssertionError('The body is built')
+
+            # the route answers 304 before building the body
+            monkeypatch.setattr(schemas.User, 'model_validate', build_body)
+
+            response = client.get('/users/me', headers={'If-None-Match': f'"other", {etag}'})
+
+            assert response.status_code == 304
+            assert response.content == b''
+            assert response.headers['etag'] == etag
+
+    @staticmethod
+    def test_user_changed():
+
+        with UserAccessCookie(client, test_user.username, 'me'):
+
+            etag = client.get('/users/me').headers['etag']
+
+            UserCrud(db).update(test_user, discord_id=next(get_new_discord_id))
+
+            response = client.get('/users/me', headers={'If-None-Match': etag})
+
+        assert response.status_code == 200
+        assert response.headers['etag'] != etag
+
+    @staticmethod
+    def test_compressed_not_modified(monkeypatch):
+
+        monkeypatch.setattr(SETTINGS, 'COMPRESSION_MINIMUM_SIZE', 0)
+
+        with UserAccessCookie(client, test_user.username, 'me'):
+
+            etag = client.get('/users/me', headers={'Accept-Encoding': 'gzip'}).headers['etag']
+
+            assert etag.startswith('W/"')
+
+            response = client.get('/users/me', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+
+        assert response.status_code == 304
+
+    @staticmethod
+    def test_listing_not_modified():
+
+        with UserAccessCookie(client, test_user.username, 'p2p_request'):
+
+            response = client.get('/p2p_request/mine', headers={'Accept-Encoding': 'identity'})
+
+            etag = response.headers['etag']
+
+            assert etag == make_etag(response.content)
+
+            response = client.get('/p2p_request/mine', headers={'If-None-Match': etag})
+
+        assert response.status_code == 304
+        assert response.content == b''
+
+    @staticmethod
+    def test_docs_not_modified():
+
+        etag = client.get(SETTINGS.OPENAPI_URL, headers={'Accept-Encoding': 'gzip'}).headers['etag']
+
+        response = client.get(SETTINGS.OPENAPI_URL, headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+
+        assert response.status_code == 304
+        assert response.headers['etag'] == etag
+        assert response.headers['cache-control'] == 'no-cache'
+
+    @staticmethod
+    def test_modified():
+
+        response = client.get(SETTINGS.OPENAPI_URL, headers={'If-None-Match': '"other"'})
+
+        assert response.status_code == 200
+        assert response.json()['openapi']
+
+        # only the successful GET responses
+        response = client.post('/p2p_request/create', headers={'If-None-Match': '*'})
+
+        assert response.status_code == 401
+        assert 'etag' not in response.headers
+
+    @staticmethod
+    def test_not_cached_routes():
+
+        # the state changing and the service GET routes
+        assert 'etag' not in client.get('/metrics').headers
+
+        with UserAccessCookie(client, test_user.username, 'p2p_request'):
+            response = client.get('/p2p_request/review/start', headers={'If-None-Match': '*'})
+
+        assert response.status_code == 200
+        assert 'etag' not in response.headers
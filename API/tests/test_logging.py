@@ -0,0 +1,61 @@
+from json import loads
+from logging import ERROR, INFO, WARNING, LogRecord
+from queue import Queue
+
+from core.logging_utils import DroppingQueueHandler, InfoSamplingFilter, JSONFormatter
+
+
+def make_record(level: int = INFO, message: str = 'message %s', args: tuple = ('arg',), **extra) -> LogRecord:
+
+    record = LogRecord('main', level, __file__, 1, message, args, None, func='function')
+    record.__dict__.update(extra)
+
+    return record
+
+
+class TestLogging:
+
+    @staticmethod
+    def test_json_formatter():
+
+        data = loads(JSONFormatter().format(make_record(route='/users/me', db_queries=2)))
+
+        assert data['level'] == 'INFO'
+        assert data['function'] == 'function'
+        assert data['message'] == 'message arg'
+        assert data['route'] == '/users/me'
+        assert data['db_queries'] == 2
+
+    @staticmethod
+    def test_info_sampling_filter():
+
+        assert InfoSamplingFilter(1).filter(make_record())
+        assert not InfoSamplingFilter(0).filter(make_record())
+        assert InfoSamplingFilter(0).filter(make_record(WARNING))
+
+        sampled = sum(InfoSamplingFilter(0.5).filter(make_record()) for _ in range(1000))
+
+        assert 350 < sampled < 650
+
+    @staticmethod
+    def test_dropping_queue_handler():
+
+        queue = Queue(2)
+        queue_handler = DroppingQueueHandler(queue)
+
+        try:
+            raise ValueError('error')
+
+        except ValueError as error:
+            queue_handler.handle(make_record(ERROR, exc_info=(type(error), error, error.__traceback__)))
+
+        for _ in range(3):
+            queue_handler.handle(make_record())
+
+        assert queue_handler.dropped_records == 2
+
+        record = queue.get_nowait()
+
+        assert record.msg == 'message arg' and record.args is None
+        assert record.exc_info is None and 'ValueError: error' in record.exc_text
+        assert 'ValueError: error' in loads(JSONFormatter().format(record))['exception']
@@ -0,0 +1,89 @@
+from fastapi.testclient import TestClient
+from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
+
+from core.main import app
+from core.metrics import Counter, Histogram
+from routers.system import review_queue_depth_cache
+from sql.crud import AsyncP2PRequestCrud
+from _testing_utils import UserAccessCookie
+
+client = TestClient(app)
+
+# like server.py behind nginx (the test client has no address, so every one is trusted)
+proxied_client = TestClient(ProxyHeadersMiddleware(app, trusted_hosts='*'))
+
+
+class TestMetrics:
+
+    @staticmethod
+    def test_counter_and_histogram_format():
+
+        counter = Counter('test_total', 'Test counter', ('label',))
+        counter.inc('a"b')
+        counter.inc('a"b', amount=2)
+
+        assert list(counter.collect()) == [
+            '# HELP test_total Test counter', '# TYPE test_total counter', 'test_total{label="a\\"b"} 3.0'
+        ]
+
+        histogram = Histogram('test_seconds', 'Test histogram', buckets=(0.1, 1))
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(5)
+
+        assert list(histogram.collect())[2:] == [
+            'test_seconds_bucket{le="0.1"} 1',
+            'test_seconds_bucket{le="1.0"} 2',
+            'test_seconds_bucket{le="+Inf"} 3',
+            'test_seconds_sum 5.55',
+            'test_seconds_count 3',
+        ]
+
+    @staticmethod
+    def test_metrics_route():
+
+        client.get('/rapidoc')
+        client.get('/not_existing_page')
+
+        with UserAccessCookie(client, 'metrics_user', 'me'):
+            client.get('/users/me')
+
+        response = client.get('/metrics')
+
+        assert response.status_code == 200
+        assert response.headers['content-type'].startswith('text/plain')
+
+        lines = response.text.splitlines()
+
+        assert any(i.startswith('http_requests_total{method="GET",route="/rapidoc",status="200"}') for i in lines)
+        # the route templates, not the paths
+        assert any(i.startswith('http_requests_total{method="GET",route="/{_:path}",status="307"}') for i in lines)
+        assert any(i.startswith('http_requests_total{method="GET",route="/users/me",status="401"}') for i in lines)
+        assert 'http_requests_in_progress{method="GET",route="/metrics"} 1.0' in lines
+        assert any(i.startswith('p2p_review_queue_depth ') for i in lines)
+        assert any(i.startswith('cache_hit_ratio{cache="user"} ') for i in lines)
+        assert any(i.startswith('db_pool_checked_out{engine="sync"} ') for i in lines)
+
+    @staticmethod
+    def test_metrics_route_is_internal():
+
+        assert proxied_client.get('/metrics', headers={'X-Forwarded-For': '8.8.8.8'}).status_code == 404
+        assert proxied_client.get('/metrics', headers={'X-Forwarded-For': '10.1.2.3'}).status_code == 200
+
+    @staticmethod
+    def test_review_queue_depth_is_cached(monkeypatch):
+
+        counts = []
+
+        async def count(*_) -> int:
+            counts.append(1)
+            return 0
+
+        monkeypatch.setattr(AsyncP2PRequestCrud, 'count', count)
+
+        review_queue_depth_cache.clear()
+
+        for _ in range(3):
+            assert client.get('/metrics').status_code == 200
+
+        assert len(counts) == 1
@@ -0,0 +1,386 @@
+import csv
+import json
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi.testclient import TestClient
+from httpx import Response
+
+from core.main import app
+from core import schemas
+from core.config import get_settings
+from sql.crud import UserCrud, P2PRequestCrud, P2PReviewCrud, P2P_EXPORT_COLUMNS
+from sql.database import get_db_not_dependency, SessionLocal
+from sql.models_enums import ReviewStateEnum
+from _testing_utils import UserAccessCookie, get_new_discord_id, create_scopes
+
+
+SETTINGS = get_settings()
+
+client = TestClient(app)
+
+
+db = get_db_not_dependency()
+
+create_scopes(db)
+
+test_creator = UserCrud(db).create(
+    schemas.UserCreate(username='p2p_creator', password='p2p_creator', discord_id=next(get_new_discord_id))
+)
+test_reviewer = UserCrud(db).create(
+    schemas.UserCreate(username='p2p_reviewer', password='p2p_reviewer', discord_id=next(get_new_discord_id))
+)
+
+
+class TestCreateP2PRequestRoute:
+
+    @staticmethod
+    def do_request(*args, **kwargs) -> Response:
+        return client.post('/p2p_request/create', *args, **kwargs)
+
+    def test_not_authorized(self):
+
+        response = self.do_request(params={'repository_link': 'link', 'comment': 'comment'})
+
+        assert response.status_code == 401
+
+    def test_user_does_not_have_scope(self):
+
+        with UserAccessCookie(client, test_creator.username, 'me'):
+            response = self.do_request(params={'repository_link': 'link', 'comment': 'comment'})
+
+        assert response.status_code == 401
+
+    def test_correct(self):
+
+        requests_before_request = len(P2PRequestCrud(db).get_many(creator_id=test_creator.id))
+
+        with UserAccessCookie(client, test_creator.username, 'p2p_request'):
+            response = self.do_request(params={'repository_link': 'test_correct_link', 'comment': 'comment'})
+
+        assert response.status_code == 200
+        assert response.json() is True
+
+        assert requests_before_request + 1 == len(P2PRequestCrud(db).get_many(creator_id=test_creator.id))
+
+
+class TestP2PReviewRoutes:
+
+    @staticmethod
+    def start_review() -> Response:
+        return client.get('/p2p_request/review/start')
+
+    @staticmethod
+    def complete_review(*args, **kwargs) -> Response:
+        return client.post('/p2p_request/review/complete', *args, **kwargs)
+
+    def test_own_request_is_not_given(self):
+
+        with UserAccessCookie(client, test_creator.username, 'p2p_request'):
+            response = self.start_review()
+
+        assert response.status_code == 200
+        assert response.json() == {'context': 'There are not any pending projects'}
+
+    def test_start_and_complete(self):
+
+        with UserAccessCookie(client, test_reviewer.username, 'p2p_request'):
+
+            response = self.start_review()
+
+            assert response.status_code == 200
+
+            p2p_request = schemas.P2PRequest.model_validate(response.json())
+
+            db.expire_all()
+
+            assert P2PRequestCrud(db).get(id=p2p_request.id).review_state == ReviewStateEnum.PROGRESS
+
+            response = self.start_review()
+
+            assert response.json() == {'context': 'You already have a review, complete it first'}
+
+            response = self.complete_review(params={'link': 'review_link', 'p2p_request_id': p2p_request.id})
+
+        assert response.status_code == 200
+
+        review = schemas.P2PReview.model_validate(response.json())
+
+        assert review.p2p_request_id == p2p_request.id
+        assert review.reviewer_id == test_reviewer.id
+        assert review.review_state == ReviewStateEnum.COMPLETED
+        assert review.link == 'review_link'
+
+        db.expire_all()
+
+        assert P2PReviewCrud(db).get(id=review.id).review_state == ReviewStateEnum.COMPLETED
+        assert P2PRequestCrud(db).get(id=p2p_request.id).review_state == ReviewStateEnum.COMPLETED
+
+    def test_complete_not_found(self):
+
+        with UserAccessCookie(client, test_reviewer.username, 'p2p_request'):
+            response = self.complete_review(params={'link': 'review_link', 'p2p_request_id': -1})
+
+        assert response.status_code == 200
+        assert response.json() == {'context': 'Review not found'}
+
+    def test_start_and_release(self):
+
+        P2PRequestCrud(db).create(
+            schemas.P2PRequestCreate(repository_link='release_link', comment='', creator_id=test_creator.id)
+        )
+
+        with UserAccessCookie(client, test_reviewer.username, 'p2p_request'):
+
+            p2p_request = schemas.P2PRequest.model_validate(self.start_review().json())
+
+            response = client.post('/p2p_request/review/release', params={'p2p_request_id': p2p_request.id})
+
+            assert response.status_code == 200
+            assert response.json() is True
+
+            db.expire_all()
+
+            assert P2PRequestCrud(db).get(id=p2p_request.id).review_state == ReviewStateEnum.PENDING
+            assert not P2PReviewCrud(db).get(p2p_request_id=p2p_request.id)
+
+            response = client.post('/p2p_request/review/release', params={'p2p_request_id': p2p_request.id})
+
+            assert response.json() == {'context': 'Review not found'}
+
+            # the released request is given again, it is completed so the next tests do not get it
+            assert self.start_review().json()['id'] == p2p_request.id
+
+            self.complete_review(params={'link': 'review_link', 'p2p_request_id': p2p_request.id})
+
+
+class TestConcurrentReviewClaim:
+
+    claimers_number = 16
+    p2p_requests_number = 400
+
+    @staticmethod
+    def claim_all(reviewer_id: int) -> list[int]:
+
+        claimed_ids = []
+
+        with SessionLocal() as claimer_db:
+            while p2p_request := P2PRequestCrud(claimer_db).claim_oldest_not_user_without_reviews(reviewer_id):
+                claimed_ids.append(p2p_request.id)
+
+        return claimed_ids
+
+    def test_no_request_is_claimed_twice(self):
+
+        creator = UserCrud(db).create(
+            schemas.UserCreate(username='claim_creator', password='claim_creator', discord_id=next(get_new_discord_id))
+        )
+
+        reviewers_ids = [
+            UserCrud(db).create(schemas.UserCreate(
+                username=f'claim_reviewer_{i}', password='claim_reviewer', discord_id=next(get_new_discord_id)
+            )).id
+            for i in range(self.claimers_number)
+        ]
+
+        for i in range(self.p2p_requests_number):
+            db.add(P2PRequestCrud(db).model(repository_link=f'claim_link_{i}', comment='', creator_id=creator.id))
+
+        db.commit()
+
+        # the throughput is measured by benchmarks/review_claim.py
+        with ThreadPoolExecutor(self.claimers_number) as executor:
+            claimed_ids = [i for ids in executor.map(self.claim_all, reviewers_ids) for i in ids]
+
+        assert len(claimed_ids) == len(set(claimed_ids))
+        assert len(claimed_ids) == self.p2p_requests_number
+
+
+class TestCreateManyP2PRequestsRoute:
+
+    @staticmethod
+    def do_request(*args, **kwargs) -> Response:
+        return client.post('/p2p_request/create_many', *args, **kwargs)
+
+    def test_user_does_not_have_scope(self):
+
+        with UserAccessCookie(client, test_creator.username, 'p2p_request'):
+            response = self.do_request(json=[])
+
+        assert response.status_code == 401
+
+    def test_correct(self, monkeypatch):
+
+        # several batches
+        monkeypatch.setattr(SETTINGS, 'P2P_REQUESTS_BULK_CREATE_BATCH_SIZE', 2)
+
+        p2p_requests = [
+            {'repository_link': f'create_many_link_{i}', 'comment': str(i), 'creator_id': creator_id}
+            for i, creator_id in enumerate([test_creator.id, test_reviewer.id] * 3)
+        ]
+
+        with UserAccessCookie(client, test_creator.username, 'admin'):
+            response = self.do_request(json=p2p_requests)
+
+        assert response.status_code == 200
+
+        created = [schemas.P2PRequest.model_validate(i) for i in response.json()]
+
+        assert [i.repository_link for i in created] == [i['repository_link'] for i in p2p_requests]
+
+        for p2p_request, p2p_request_db in zip(p2p_requests, [P2PRequestCrud(db).get(id=i.id) for i in created]):
+            assert p2p_request_db.creator_id == p2p_request['creator_id']
+            assert p2p_request_db.comment == p2p_request['comment']
+            assert p2p_request_db.review_state == ReviewStateEnum.PENDING
+
+    def test_not_existing_creator(self):
+
+        p2p_requests = [
+            {'repository_link': 'create_many_not_created', 'comment': '', 'creator_id': test_creator.id},
+            {'repository_link': 'create_many_not_created', 'comment': '', 'creator_id': -1},
+        ]
+
+        with UserAccessCookie(client, test_creator.username, 'admin'):
+            response = self.do_request(json=p2p_requests)
+
+        assert response.status_code == 400
+        assert not P2PRequestCrud(db).get_many(repository_link='create_many_not_created')
+
+
+class TestListingRoutes:
+
+    @staticmethod
+    def get_all_pages(url: str, username: str, scopes: str, limit: int = 2) -> list[dict]:
+
+        items, params = [], {'limit': limit}
+
+        with UserAccessCookie(client, username, scopes):
+            while True:
+
+                response = client.get(url, params=params)
+
+                assert response.status_code == 200
+
+                page = response.json()
+
+                assert len(page['items']) <= limit
+
+                items.extend(page['items'])
+
+                if not page['next_cursor']:
+                    return items
+
+                params['cursor'] = page['next_cursor']
+
+    def test_mine_and_pending(self):
+
+        creator = UserCrud(db).create(
+            schemas.UserCreate(username='listing_creator', password='listing', discord_id=next(get_new_discord_id))
+        )
+
+        created = P2PRequestCrud(db).create_many(
+            schemas.P2PRequestCreate(repository_link=f'listing_link_{i}', comment='', creator_id=creator.id)
+            for i in range(5)
+        )
+
+        mine = self.get_all_pages('/p2p_request/mine', creator.username, 'p2p_request')
+
+        assert [i['id'] for i in mine] == [i.id for i in reversed(created)]
+
+        pending = self.get_all_pages('/p2p_request/pending', creator.username, 'p2p_request', limit=50)
+        pending_ids = [i['id'] for i in pending]
+
+        assert all(i['review_state'] == ReviewStateEnum.PENDING.value for i in pending)
+        assert pending_ids == sorted(pending_ids, key=lambda i: (P2PRequestCrud(db).get(id=i).publication_date, i))
+        assert {i.id for i in created} <= set(pending_ids)
+
+    def test_reviews(self):
+
+        reviewer = UserCrud(db).create(
+            schemas.UserCreate(username='listing_reviewer', password='listing', discord_id=next(get_new_discord_id))
+        )
+
+        P2PRequestCrud(db).create_many([
+            schemas.P2PRequestCreate(repository_link='listing_review_link', comment='', creator_id=test_creator.id)
+        ])
+
+        claimed = P2PRequestCrud(db).claim_oldest_not_user_without_reviews(reviewer.id)
+
+        reviews = self.get_all_pages('/p2p_request/review/mine', reviewer.username, 'p2p_request')
+
+        assert [i['p2p_request_id'] for i in reviews] == [claimed.id]
+        assert reviews[0]['review_state'] == ReviewStateEnum.PROGRESS.value
+
+        all_reviews = self.get_all_pages('/p2p_request/review/all', reviewer.username, 'admin', limit=50)
+
+        assert claimed.id in [i['p2p_request_id'] for i in all_reviews]
+
+    def test_all_requires_admin(self):
+
+        with UserAccessCookie(client, test_creator.username, 'p2p_request'):
+            assert client.get('/p2p_request/all').status_code == 401
+
+        all_requests = self.get_all_pages('/p2p_request/all', test_creator.username, 'admin', limit=100)
+        keys = [(datetime.fromisoformat(i['publication_date']), i['id']) for i in all_requests]
+
+        assert len(all_requests) == len(P2PRequestCrud(db).get_many())
+        assert keys == sorted(keys, reverse=True)
+
+    def test_invalid_cursor(self):
+
+        with UserAccessCookie(client, test_creator.username, 'p2p_request'):
+            response = client.get('/p2p_request/mine', params={'cursor': 'invalid'})
+
+        assert response.status_code == 400
+
+
+class TestExportRoutes:
+
+    @staticmethod
+    def export(url: str, **params) -> Response:
+        with UserAccessCookie(client, test_creator.username, 'admin'):
+            return client.get(url, params=params)
+
+    def test_not_admin(self):
+
+        with UserAccessCookie(client, test_creator.username, 'p2p_request'):
+            response = client.get('/p2p_request/export')
+
+        assert response.status_code == 401
+
+    def test_ndjson(self, monkeypatch):
+
+        # several chunks
+        monkeypatch.setattr(SETTINGS, 'EXPORT_BATCH_SIZE', 2)
+
+        response = self.export('/p2p_request/export')
+
+        assert response.status_code == 200
+        assert response.headers['content-type'].startswith('application/x-ndjson')
+
+        rows = [json.loads(i) for i in response.text.splitlines()]
+
+        assert len(rows) == len(P2PRequestCrud(db).get_many())
+        assert tuple(rows[0]) == P2P_EXPORT_COLUMNS
+
+        reviews_rows = [json.loads(i) for i in self.export('/p2p_request/review/export').text.splitlines()]
+
+        assert len(reviews_rows) == len(P2PReviewCrud(db).get_many())
+        assert all(i['p2p_review_id'] is not None for i in reviews_rows)
+
+    def test_csv_and_dates(self):
+
+        response = self.export('/p2p_request/review/export', export_format='csv')
+
+        assert response.status_code == 200
+
+        rows = list(csv.reader(response.text.splitlines()))
+
+        assert tuple(rows[0]) == P2P_EXPORT_COLUMNS
+        assert len(rows) - 1 == len(P2PReviewCrud(db).get_many())
+
+        response = self.export(
+            '/p2p_request/export', export_format='csv', date_from=(datetime.now(timezone.utc) + timedelta(days=1))
+        )
+
+        assert response.text.splitlines() == [','.join(P2P_EXPORT_COLUMNS)]
@@ -0,0 +1,82 @@
+from asyncio import run, get_running_loop
+
+from passlib.hash import bcrypt
+
+from core import passwords
+from core.passwords import (
+    get_password_hash,
+    verify_password,
+    get_password_hash_async,
+    verify_and_update_password,
+    verify_and_update_password_async,
+    pwd_context,
+    start_password_executor,
+    shutdown_password_executor,
+)
+
+
+class TestPasswords:
+
+    @staticmethod
+    def test_hash_and_verify():
+
+        hashed_password = get_password_hash('password')
+
+        assert verify_password('password', hashed_password)
+        assert not verify_password('incorrect_password', hashed_password)
+
+    @staticmethod
+    def test_hash_and_verify_async_in_threadpool():
+
+        hashed_password = run(get_password_hash_async('password'))
+
+        assert run(verify_and_update_password_async('password', hashed_password)) == (True, None)
+        assert run(verify_and_update_password_async('incorrect_password', hashed_password)) == (False, None)
+
+    @staticmethod
+    def test_hash_and_verify_async_in_process_pool():
+
+        start_password_executor(1)
+
+        try:
+
+            hashed_password = run(get_password_hash_async('password'))
+
+            assert run(verify_and_update_password_async('password', hashed_password)) == (True, None)
+            assert run(verify_and_update_password_async('incorrect_password', hashed_password)) == (False, None)
+
+        finally:
+            shutdown_password_executor()
+
+    @staticmethod
+    def test_process_pool_does_not_import_database():
+
+        start_password_executor(1)
+
+        async def hash_and_get_modules() -> bool:
+
+            loop = get_running_loop()
+
+            # the process imports the module of the function
+            await loop.run_in_executor(passwords._password_executor, get_password_hash, 'password')
+
+            return await loop.run_in_executor(
+                passwords._password_executor, eval, "'sql.database' in __import__('sys').modules"
+            )
+
+        try:
+            assert not run(hash_and_get_modules())
+
+        finally:
+            shutdown_password_executor()
+
+    @staticmethod
+    def test_outdated_hash_is_updated():
+
+        outdated_hashed_password = bcrypt.using(rounds=4).hash('password')
+
+        is_password_correct, new_hashed_password = verify_and_update_password('password', outdated_hashed_password)
+
+        assert is_password_correct
+        assert new_hashed_password and not pwd_context.needs_update(new_hashed_password)
+        assert verify_password('password', new_hashed_password)
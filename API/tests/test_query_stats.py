@@ -0,0 +1,60 @@
+from logging import WARNING
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from core.config import get_settings
+from core.main import app
+from core.middlewares import QueryStatsMiddleware
+from sql.crud import UserCrud
+from sql.database import SessionLocal
+from _testing_utils import UserAccessCookie
+
+
+SETTINGS = get_settings()
+
+client = TestClient(app)
+
+# an app with the same middleware and a route making N+1 queries
+n_plus_one_app = FastAPI()
+n_plus_one_app.add_middleware(QueryStatsMiddleware)
+
+
+@n_plus_one_app.get('/users/{users_number}')
+def get_users_one_by_one(users_number: int) -> int:
+    with SessionLocal() as db:
+        return len([UserCrud(db).get(id=i) for i in range(users_number)])
+
+
+n_plus_one_client = TestClient(n_plus_one_app)
+
+
+class TestQueryStats:
+
+    @staticmethod
+    def test_server_timing_header():
+
+        with UserAccessCookie(client, 'query_stats_user', 'me'):
+            response = client.get('/users/me')
+
+        assert response.headers['server-timing'].startswith('db;dur=')
+        assert 'queries", app;dur=' in response.headers['server-timing']
+
+    @staticmethod
+    def test_n_plus_one_warning(monkeypatch, caplog):
+
+        monkeypatch.setattr(SETTINGS, 'DEBUG', True)
+        monkeypatch.setattr(SETTINGS, 'N_PLUS_ONE_THRESHOLD', 3)
+
+        with caplog.at_level(WARNING, logger='main'):
+
+            response = n_plus_one_client.get('/users/2')
+
+            assert response.headers['server-timing'].startswith('db;dur=')
+            assert '"2 queries"' in response.headers['server-timing']
+            assert not caplog.records
+
+            n_plus_one_client.get('/users/3')
+
+        assert len(caplog.records) == 1
+        assert 'Possible N+1 queries: GET /users/{users_number} executed 3 times' in caplog.records[0].message
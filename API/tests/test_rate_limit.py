@@ -0,0 +1,164 @@
+from fastapi.testclient import TestClient
+from pytest import fixture, mark
+from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
+
+from core import rate_limit
+from core.config import get_settings
+from core.main import app
+from core.rate_limit import MemoryTokenBuckets, memory_token_buckets
+from sql import models
+from sql.crud import RateLimitBucketCrud
+from sql.database import get_db_not_dependency
+
+
+SETTINGS = get_settings()
+
+client = TestClient(app)
+
+# like server.py behind nginx (the test client has no address, so every one is trusted)
+proxied_client = TestClient(ProxyHeadersMiddleware(app, trusted_hosts='*'))
+
+
+@fixture
+def rate_limits(monkeypatch):
+
+    monkeypatch.setattr(SETTINGS, 'RATE_LIMIT_ENABLED', True)
+    monkeypatch.setattr(SETTINGS, 'RATE_LIMITS', SETTINGS.RATE_LIMITS | {'login_ip': (6, 2), 'login_username': (6, 3)})
+
+    yield
+
+    memory_token_buckets.clear()
+
+
+class TestTokenBuckets:
+
+    @staticmethod
+    def test_memory(monkeypatch):
+
+        now = 0.0
+        monkeypatch.setattr(rate_limit, 'monotonic', lambda: now)
+
+        buckets = MemoryTokenBuckets(max_size=2)
+
+        assert [buckets.acquire('key', rate=0.5, burst=2) for _ in range(3)] == [1, 0, -1]
+
+        # the rejected requests do not take tokens
+        assert buckets.acquire('key', rate=0.5, burst=2) == -1
+
+        now = 1.0
+
+        assert buckets.acquire('key', rate=0.5, burst=2) == -0.5
+
+        now = 2.0
+
+        assert buckets.acquire('key', rate=0.5, burst=2) == 0
+
+        buckets.acquire('other_key', rate=0.5, burst=2)
+        buckets.acquire('another_key', rate=0.5, burst=2)
+
+        # the least recently used is evicted, its bucket is full again
+        assert len(buckets) == 2
+        assert buckets.acquire('key', rate=0.5, burst=2) == 1
+
+    @staticmethod
+    def test_postgres():
+
+        crud = RateLimitBucketCrud(get_db_not_dependency())
+
+        assert [round(crud.acquire('test_postgres_key', rate=0.001, burst=2), 2) for _ in range(2)] == [1, 0]
+
+        for _ in range(3):
+            assert -1 <= crud.acquire('test_postgres_key', rate=0.001, burst=2) < -0.99
+
+    @staticmethod
+    def test_postgres_delete_refilled():
+
+        db = get_db_not_dependency()
+        crud = RateLimitBucketCrud(db)
+
+        for key in ('refilled:old', 'refilled:new', 'other_limit:old'):
+            crud.acquire(key, rate=1, burst=2)
+
+        # taken 100 seconds ago
+        db.query(models.RateLimitBucket).filter(models.RateLimitBucket.key.endswith(':old')).update(
+            {'updated_at': models.RateLimitBucket.updated_at - 100}, synchronize_session=False
+        )
+        db.commit()
+
+        # the old bucket of the limit is full (burst / rate = 2 seconds), the other limit is refilled in 1000 seconds
+        assert crud.delete_refilled({'refilled:': 2, 'other_limit:': 1000}) == 1
+
+        assert crud.get(key='refilled:old') is None
+        assert crud.get(key='refilled:new') and crud.get(key='other_limit:old')
+
+
+class TestRateLimitedRoutes:
+
+    @staticmethod
+    @mark.parametrize('backend', ['memory', 'postgres'])
+    def test_login_ip(backend, rate_limits, monkeypatch):
+
+        monkeypatch.setattr(SETTINGS, 'RATE_LIMIT_BACKEND', backend)
+
+        for i in range(2):
+            response = client.post('/token', data={'username': f'{backend}_{i}', 'password': 'password'})
+            assert response.status_code == 401
+
+        response = client.post('/token', data={'username': f'{backend}_2', 'password': 'password'})
+
+        assert response.status_code == 429
+        assert response.headers['retry-after'] == '10'
+
+    @staticmethod
+    def test_refilled_buckets_are_deleted(rate_limits, monkeypatch):
+
+        monkeypatch.setattr(SETTINGS, 'RATE_LIMIT_BACKEND', 'postgres')
+        monkeypatch.setattr(SETTINGS, 'RATE_LIMIT_CLEANUP_INTERVAL', 1)
+
+        db = get_db_not_dependency()
+        crud = RateLimitBucketCrud(db)
+
+        # a not existing username, its bucket was taken before the refill (login_username: 3 / 0.1 seconds)
+        crud.acquire('login_username:cleanup_username', rate=0.1, burst=3)
+
+        db.query(models.RateLimitBucket).filter_by(key='login_username:cleanup_username').update(
+            {'updated_at': models.RateLimitBucket.updated_at - 31}, synchronize_session=False
+        )
+        db.commit()
+
+        # the login_ip bucket of the test client address is empty after the other tests
+        proxied_client.post(
+            '/token',
+            data={'username': 'cleanup_other_username', 'password': 'password'},
+            headers={'X-Forwarded-For': '10.0.0.3'},
+        )
+
+        assert crud.get(key='login_username:cleanup_username') is None
+        assert crud.get(key='login_username:cleanup_other_username') is not None
+
+    @staticmethod
+    def test_login_username(rate_limits, monkeypatch):
+
+        monkeypatch.setattr(SETTINGS, 'RATE_LIMITS', SETTINGS.RATE_LIMITS | {'login_ip': (60, 100)})
+
+        statuses = [
+            client.post('/token', data={'username': 'limited_username', 'password': 'password'}).status_code
+            for _ in range(4)
+        ]
+
+        assert statuses == [401, 401, 401, 429]
+
+        assert client.post('/token', data={'username': 'other_username', 'password': 'password'}).status_code == 401
+
+    @staticmethod
+    def test_login_ip_forwarded(rate_limits):
+
+        def login(forwarded_for: str, username: str) -> int:
+            return proxied_client.post(
+                '/token', data={'username': username, 'password': 'password'}, headers={'X-Forwarded-For': forwarded_for}
+            ).status_code
+
+        assert [login('10.0.0.1', f'forwarded_{i}') for i in range(3)] == [401, 401, 429]
+
+        # the other client has its own bucket
+        assert [login('10.0.0.2', f'forwarded_{i}') for i in range(3, 5)] == [401, 401]
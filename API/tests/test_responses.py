@@ -0,0 +1,27 @@
+from datetime import datetime
+from json import loads
+
+from core import schemas
+from sql.models_enums import ReviewStateEnum
+from core.responses import SchemaResponse
+
+
+class TestSchemaResponse:
+
+    @staticmethod
+    def test_render():
+
+        review = schemas.P2PReview(
+            id=1,
+            reviewer_id=2,
+            p2p_request_id=3,
+            creation_date=datetime(2024, 1, 1),
+            end_date=None,
+            review_state=ReviewStateEnum.PROGRESS,
+            link=None,
+        )
+
+        assert loads(SchemaResponse(review).body) == review.model_dump(mode='json')
+        assert loads(SchemaResponse([review, review]).body) == [review.model_dump(mode='json')] * 2
+        assert loads(SchemaResponse([]).body) == []
+        assert loads(SchemaResponse({'a': datetime(2024, 1, 1)}).body) == {'a': '2024-01-01T00:00:00'}
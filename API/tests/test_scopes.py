@@ -0,0 +1,41 @@
+from core.config import get_settings
+from sql.crud import ScopeCrud, scope_registry
+from sql.database import get_db_not_dependency
+from _testing_utils import create_scopes, ConnectionCheckoutsCounter
+
+
+SETTINGS = get_settings()
+
+
+db = get_db_not_dependency()
+
+create_scopes(db)
+
+
+class TestScopeRegistry:
+
+    @staticmethod
+    def test_all_scopes_are_seeded():
+        assert {i.name for i in scope_registry.get_all()} == set(SETTINGS.OAUTH2_SCHEME_SCOPES)
+
+    @staticmethod
+    def test_lookups_match_database():
+
+        scopes = ScopeCrud(db).get_many()
+
+        with ConnectionCheckoutsCounter() as counter:
+            for scope in scopes:
+
+                assert scope_registry.get_by_id(scope.id).name == scope.name
+                assert scope_registry.get_by_name(scope.name).id == scope.id
+
+        assert counter.checkouts == 0
+
+    @staticmethod
+    def test_seeding_is_idempotent():
+
+        scopes_before = ScopeCrud(db).get_many()
+
+        create_scopes(db)
+
+        assert len(scopes_before) == len(ScopeCrud(db).get_many())
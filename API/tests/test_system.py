@@ -1,8 +1,16 @@
+from gzip import decompress
+
 from fastapi.testclient import TestClient
+from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
 
+from core import docs
+from core.config import get_settings
 from core.main import app
 
 
+SETTINGS = get_settings()
+
+
 BASE_URL = 'http://testserver'
 
 client = TestClient(app, base_url=BASE_URL)
@@ -24,3 +32,74 @@ class TestSystem:
 
         assert response.status_code == 200
         assert response.url == f'{BASE_URL}/rapidoc'
+
+    @staticmethod
+    def test_probe_not_found():
+
+        for path in ('/wp-login.php', '/.env', '/.git/config', '/cgi-bin/test', '/backup.sql'):
+
+            response = client.get(path, follow_redirects=False)
+
+            assert response.status_code == 404
+            assert response.content == b''
+
+    @staticmethod
+    def test_precompressed_openapi():
+
+        response = client.get(SETTINGS.OPENAPI_URL, headers={'Accept-Encoding': 'gzip'})
+
+        assert response.headers['content-encoding'] == 'gzip'
+        assert response.headers['cache-control'] == 'no-cache'
+        assert response.json() == app.openapi()
+
+        response = client.get(SETTINGS.OPENAPI_URL, headers={'If-None-Match': response.headers['etag']})
+
+        assert response.status_code == 304
+
+    @staticmethod
+    def test_local_rapidoc(monkeypatch, tmp_path):
+
+        (tmp_path / docs.RAPIDOC_FILENAME).write_text('console.log("rapidoc")' * 100)
+
+        monkeypatch.setattr(SETTINGS, 'STATIC_DIR', tmp_path)
+        monkeypatch.setattr(docs, '_assets', {})
+
+        page = client.get('/rapidoc').text
+
+        script_url = page.split('src="')[1].split('"')[0]
+
+        assert script_url.startswith(f'/static/{docs.RAPIDOC_FILENAME}?v=')
+
+        with client.stream('GET', script_url, headers={'Accept-Encoding': 'gzip'}) as response:
+            body = decompress(b''.join(response.iter_raw()))
+
+        assert body.startswith(b'console.log("rapidoc")')
+        assert response.headers['cache-control'] == docs.STATIC_CACHE_CONTROL
+
+        assert client.get('/static/openapi').status_code == 404
+
+    @staticmethod
+    def test_swagger_and_redoc():
+
+        for path in ('/docs', '/docs/oauth2-redirect', '/redoc'):
+
+            response = client.get(path, follow_redirects=False)
+
+            assert response.status_code == 200
+            assert response.headers['content-type'] == 'text/html; charset=utf-8'
+
+        assert f"url: '{SETTINGS.OPENAPI_URL}'" in client.get('/docs').text
+        assert f'spec-url="{SETTINGS.OPENAPI_URL}"' in client.get('/redoc').text
+
+    @staticmethod
+    def test_caches_route():
+
+        response = client.get('/caches')
+
+        assert response.status_code == 200
+        assert set(response.json()['token_payload']) == {'size', 'hits', 'misses', 'hit_ratio'}
+
+        # behind nginx, an external client
+        proxied_client = TestClient(ProxyHeadersMiddleware(app, trusted_hosts='*'))
+
+        assert proxied_client.get('/caches', headers={'X-Forwarded-For': '8.8.8.8'}).status_code == 404
@@ -0,0 +1,88 @@
+from asyncio import run
+
+import pytest
+from sqlalchemy import event
+
+from core import schemas
+from sql.crud import UserCrud, P2PRequestCrud, AsyncP2PRequestCrud
+from sql.database import get_db_not_dependency, engine, SessionLocal, AsyncSessionLocal
+from sql.database import unit_of_work, async_unit_of_work
+from _testing_utils import get_new_discord_id
+
+
+db = get_db_not_dependency()
+
+test_creator = UserCrud(db).create(schemas.UserCreate(
+    username='unit_of_work_creator', password='unit_of_work_creator', discord_id=next(get_new_discord_id)
+))
+
+
+def make_p2p_request_create(repository_link: str) -> schemas.P2PRequestCreate:
+    return schemas.P2PRequestCreate(repository_link=repository_link, comment='', creator_id=test_creator.id)
+
+
+class TestUnitOfWork:
+
+    @staticmethod
+    def test_one_commit():
+
+        commits = []
+
+        def on_commit(connection) -> None:
+            commits.append(connection)
+
+        with SessionLocal() as uow_db:
+
+            event.listen(engine, 'commit', on_commit)
+
+            try:
+                with unit_of_work(uow_db):
+                    p2p_request = P2PRequestCrud(uow_db).create(make_p2p_request_create('uow_one_commit'))
+                    P2PRequestCrud(uow_db).update(p2p_request, comment='updated')
+
+                    # the nested unit of work is a part of the outer one
+                    with unit_of_work(uow_db):
+                        P2PRequestCrud(uow_db).create(make_p2p_request_create('uow_one_commit'))
+
+            finally:
+                event.remove(engine, 'commit', on_commit)
+
+        assert len(commits) == 1
+        assert len(P2PRequestCrud(db).get_many(repository_link='uow_one_commit')) == 2
+
+    @staticmethod
+    def test_rolled_back_on_exception():
+
+        with SessionLocal() as uow_db, pytest.raises(ValueError):
+            with unit_of_work(uow_db):
+                P2PRequestCrud(uow_db).create(make_p2p_request_create('uow_rolled_back'))
+                raise ValueError
+
+        assert not P2PRequestCrud(db).get_many(repository_link='uow_rolled_back')
+
+    @staticmethod
+    def test_async():
+
+        async def create_in_unit_of_work(fail: bool) -> None:
+            async with AsyncSessionLocal() as uow_db, async_unit_of_work(uow_db):
+
+                await AsyncP2PRequestCrud(uow_db).create(make_p2p_request_create(f'uow_async_{fail}'))
+
+                if fail:
+                    raise ValueError
+
+        run(create_in_unit_of_work(False))
+
+        with pytest.raises(ValueError):
+            run(create_in_unit_of_work(True))
+
+        assert len(P2PRequestCrud(db).get_many(repository_link='uow_async_False')) == 1
+        assert not P2PRequestCrud(db).get_many(repository_link='uow_async_True')
+
+    @staticmethod
+    def test_per_call_commit_by_default():
+
+        with SessionLocal() as other_db:
+            P2PRequestCrud(other_db).create(make_p2p_request_create('uow_per_call_commit'))
+
+        assert P2PRequestCrud(db).get(repository_link='uow_per_call_commit')
@@ -1,12 +1,17 @@
 from fastapi.testclient import TestClient
 from httpx import Response
+from passlib.hash import bcrypt
 
 from core.main import app
 from core.config import get_settings
 from core import schemas
 from sql.crud import UserCrud, ScopeCrud, UserToScopeCrud
 from sql.database import get_db_not_dependency
-from _testing_utils import UserAccessCookie, get_new_discord_id, get_field_detail_type
+from core.cache import user_cache, token_deny_list
+from core.passwords import pwd_context
+from _testing_utils import (
+    UserAccessCookie, ConnectionCheckoutsCounter, get_new_discord_id, get_field_detail_type, create_scopes
+)
 
 
 SETTINGS = get_settings()
@@ -16,8 +21,7 @@ client = TestClient(app)
 
 db = get_db_not_dependency()
 
-for scope_name in SETTINGS.OAUTH2_SCHEME_SCOPES:
-    ScopeCrud(db).create(schemas.ScopeCreate(name=scope_name))
+create_scopes(db)
 
 test_user_1_create_schema = schemas.UserCreate(
     username='username_1', password='password_1', discord_id=next(get_new_discord_id)
@@ -100,6 +104,27 @@ class TestLoginRoute:
         assert response.status_code == 200
         assert response.json().get('access_token', False)
 
+    def test_outdated_password_hash_is_updated(self):
+
+        user_create_schema = schemas.UserCreate(
+            username='outdated_hash_user', password='outdated_hash_user', discord_id=next(get_new_discord_id)
+        )
+
+        user = UserCrud(db).create_with_hashed_password(
+            user_create_schema, bcrypt.using(rounds=4).hash(user_create_schema.password)
+        )
+
+        response = self.do_request(data={'username': user.username, 'password': user_create_schema.password})
+
+        client.cookies.clear()
+
+        assert response.status_code == 200
+
+        db.refresh(user)
+
+        assert not pwd_context.needs_update(user.hashed_password)
+        assert pwd_context.verify(user_create_schema.password, user.hashed_password)
+
 
 class TestGetUserMeDataRoute:
 
@@ -132,6 +157,32 @@ class TestGetUserMeDataRoute:
 
         assert user_schema.model_dump() == response.json()
 
+    def test_inactive_user(self):
+
+        user_create_schema = schemas.UserCreate(
+            username='inactive_user', password='inactive_user', discord_id=next(get_new_discord_id)
+        )
+        user = UserCrud(db).create(user_create_schema)
+        UserToScopeCrud(db).create(schemas.UserToScopeCreate(user_id=user.id, scope_id=test_user_scope.id))
+
+        UserCrud(db).update(user, is_active=False)
+
+        with UserAccessCookie(client, user.username, 'me'):
+            response = self.do_request()
+
+        assert response.status_code == 401
+
+    def test_one_connection_checkout(self):
+
+        # the user loader must query the database too
+        user_cache.clear()
+
+        with UserAccessCookie(client, test_user_1.username, 'me'), ConnectionCheckoutsCounter() as counter:
+            response = self.do_request()
+
+        assert response.status_code == 200
+        assert counter.checkouts == 1
+
 
 class TestCreateUserRoute:
 
@@ -252,3 +303,142 @@ class TestCreateUserRoute:
         user_schema.available_scopes = UserToScopeCrud(db).get_user_scopes(test_correct_user_db)
 
         assert user_schema.model_dump() == response.json()
+
+
+class TestStatelessAuth:
+
+    @staticmethod
+    def login(username: str, password: str, scope: str) -> None:
+
+        response = client.post(
+            f'/{SETTINGS.TOKEN_URL}', data={'username': username, 'password': password, 'scope': scope}
+        )
+
+        assert response.status_code == 200
+
+    def test_no_database_queries(self, monkeypatch):
+
+        monkeypatch.setattr(SETTINGS, 'STATELESS_AUTH', True)
+
+        self.login(test_user_1.username, test_user_1_create_schema.password, test_user_scope.name)
+
+        with ConnectionCheckoutsCounter() as counter:
+            response = client.get('/users/me')
+
+        client.cookies.clear()
+
+        assert response.status_code == 200
+        assert counter.checkouts == 0
+
+        user_schema = schemas.User.model_validate(test_user_1)
+        user_schema.available_scopes = UserToScopeCrud(db).get_user_scopes(test_user_1)
+
+        assert user_schema.model_dump() == response.json()
+
+    def test_revoked_on_user_update(self, monkeypatch):
+
+        monkeypatch.setattr(SETTINGS, 'STATELESS_AUTH', True)
+
+        user_create_schema = schemas.UserCreate(
+            username='stateless_user', password='stateless_user', discord_id=next(get_new_discord_id)
+        )
+        user = UserCrud(db).create(user_create_schema)
+        UserToScopeCrud(db).create(schemas.UserToScopeCreate(user_id=user.id, scope_id=test_user_scope.id))
+
+        self.login(user.username, user_create_schema.password, test_user_scope.name)
+
+        UserCrud(db).update(user, is_active=False)
+
+        response = client.get('/users/me')
+
+        client.cookies.clear()
+        token_deny_list.clear()
+
+        assert response.status_code == 401
+
+    def test_deny_list_is_full(self, monkeypatch):
+
+        monkeypatch.setattr(SETTINGS, 'STATELESS_AUTH', True)
+        # every revocation does not fit
+        monkeypatch.setattr(token_deny_list, 'max_size', 0)
+
+        user_create_schema = schemas.UserCreate(
+            username='stateless_full_user', password='stateless_full_user', discord_id=next(get_new_discord_id)
+        )
+        user = UserCrud(db).create(user_create_schema)
+        UserToScopeCrud(db).create(schemas.UserToScopeCreate(user_id=user.id, scope_id=test_user_scope.id))
+
+        self.login(user.username, user_create_schema.password, test_user_scope.name)
+
+        UserCrud(db).update(user, username='stateless_full_user_renamed')
+
+        # the token is checked by the database, its user is not found by the old username
+        response = client.get('/users/me')
+
+        client.cookies.clear()
+        token_deny_list.clear()
+
+        assert response.status_code == 401
+
+
+class TestCreateUsersRoute:
+
+    @staticmethod
+    def do_request(*args, **kwargs) -> Response:
+        return client.post('/create_users', *args, **kwargs)
+
+    def test_not_authorized(self):
+
+        response = self.do_request(json=[])
+
+        assert response.status_code == 401
+
+    def test_correct_with_conflicts(self, monkeypatch):
+
+        # several batches
+        monkeypatch.setattr(SETTINGS, 'USERS_BULK_CREATE_BATCH_SIZE', 2)
+
+        discord_id = next(get_new_discord_id)
+
+        users = [
+            {'username': 'bulk_user_1', 'password': 'bulk_user_1', 'discord_id': discord_id},
+            {'username': test_user_1.username, 'password': 'bulk_user', 'discord_id': next(get_new_discord_id)},
+            {'username': 'bulk_user_2', 'password': 'bulk_user_2', 'discord_id': discord_id},
+            {'username': 'bulk_user_3', 'password': 'bulk_user_3', 'discord_id': next(get_new_discord_id)},
+            {'username': 'bulk_user_4', 'password': 'bulk_user_4', 'discord_id': next(get_new_discord_id)},
+        ]
+
+        with UserAccessCookie(client, test_user_1.username, 'register'):
+            response = self.do_request(json=users)
+
+        assert response.status_code == 200
+
+        result = schemas.UsersBulkCreateResult.model_validate(response.json())
+
+        assert [i.username for i in result.created] == ['bulk_user_1', 'bulk_user_3', 'bulk_user_4']
+        assert [(i.row, i.fields) for i in result.conflicts] == [(1, ['username']), (2, ['discord_id'])]
+
+        for user in result.created:
+
+            user_db = UserCrud(db).get(username=user.username)
+
+            assert pwd_context.verify(user.username, user_db.hashed_password)
+            assert [i.name for i in UserToScopeCrud(db).get_user_scopes(user_db)] == SETTINGS.DEFAULT_USER_SCOPES
+            assert [i.name for i in user.available_scopes] == SETTINGS.DEFAULT_USER_SCOPES
+
+    def test_csv(self):
+
+        csv = 'username,password,discord_id\n' + '\n'.join(
+            f'bulk_csv_user_{i},bulk_csv_user,{next(get_new_discord_id)}' for i in range(3)
+        )
+
+        with UserAccessCookie(client, test_user_1.username, 'register'):
+            response = client.post('/create_users/csv', files={'file': ('users.csv', csv.encode())})
+
+        assert response.status_code == 200
+        assert len(response.json()['created']) == 3
+
+        with UserAccessCookie(client, test_user_1.username, 'register'):
+            response = client.post('/create_users/csv', files={'file': ('users.csv', b'username\nbulk_csv_user')})
+
+        assert response.status_code == 422
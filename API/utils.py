@@ -1,5 +1,9 @@
-from sys import argv
+from os import cpu_count
+from sys import argv, stdout
+from asyncio import run
 from logging import INFO, basicConfig, info, warning, error
+from datetime import datetime
+from pathlib import Path
 from typing import Callable
 
 from sqlalchemy.orm import Session
@@ -8,6 +12,10 @@ from sqlalchemy.exc import IntegrityError
 from sql.database import get_db_not_dependency
 from sql import crud
 from core import schemas
+from core.passwords import start_password_executor, shutdown_password_executor
+from core.users_file import parse_users_csv, parse_users_json
+from core.export import ExportFormat, iterate_export
+from core.docs import download_rapidoc
 
 
 basicConfig(level=INFO)
@@ -41,13 +49,62 @@ def create_superuser(username: str, password: str, discord_id: str, db: Session)
 
     all_user_scopes = crud.UserToScopeCrud(db).get_user_scopes(user)
 
-    for scope in crud.ScopeCrud(db).get_many():
+    for scope in crud.scope_registry.get_all():
         if scope not in all_user_scopes:
             crud.UserToScopeCrud(db).create(schemas.UserToScopeCreate(user_id=user.id, scope_id=scope.id))
 
     log_with_color(info, 'Superuser successfully created/updated')
 
 
+def create_users(path: str, db: Session) -> None:
+    """
+    Create users with the default scopes from a json or csv file (see core/users_file.py), skip the existing ones
+    """
+
+    path = Path(path)
+
+    with path.open(encoding='utf-8-sig', newline='') as file:
+        users_create = parse_users_csv(file) if path.suffix == '.csv' else parse_users_json(file.read())
+
+    # the passwords are hashed in parallel by the password executor processes, a process per CPU
+    # (not PASSWORD_HASHING_PROCESSES of a worker, which is 0 with several workers)
+    start_password_executor(cpu_count() or 1)
+
+    try:
+        result = run(crud.AsyncUserCrud(db).create_many(users_create))
+
+    finally:
+        shutdown_password_executor()
+
+    for conflict in result.conflicts:
+        log_with_color(
+            warning,
+            f'Row {conflict.row} ({conflict.username}) is skipped, not unique: {", ".join(conflict.fields)}',
+            YELLOW,
+        )
+
+    log_with_color(info, f'{len(result.created)} users successfully created, {len(result.conflicts)} skipped')
+
+
+# the exports of the export command
+EXPORTS_CRUDS = {'p2p_requests': crud.P2PRequestCrud, 'p2p_reviews': crud.P2PReviewCrud}
+
+
+def export(
+        name: str, export_format: str, db: Session, date_from: str | None = None, date_to: str | None = None
+) -> None:
+    """
+    Stream an export (see EXPORTS_CRUDS) to stdout, optionally only the rows in [date_from, date_to) (iso format)
+    """
+
+    partitions = EXPORTS_CRUDS[name](db).stream_export(
+        *[datetime.fromisoformat(i) if i else None for i in (date_from, date_to)]
+    )
+
+    for chunk in iterate_export(partitions, crud.P2P_EXPORT_COLUMNS, ExportFormat(export_format)):
+        stdout.write(chunk)
+
+
 if __name__ == '__main__':
 
     if 'create_superuser' in argv and len(argv) == 5:
@@ -58,5 +115,30 @@ if __name__ == '__main__':
         except Exception as e:
             log_with_color(error, f'Something went wrong\n{e}', RED)
 
+    elif 'create_users' in argv and len(argv) == 3:
+
+        try:
+            create_users(argv[2], db=get_db_not_dependency())
+
+        except Exception as e:
+            log_with_color(error, f'Something went wrong\n{e}', RED)
+
+    elif 'export' in argv and 4 <= len(argv) <= 6:
+
+        try:
+            export(*argv[2:4], get_db_not_dependency(), *argv[4:])
+
+        except Exception as e:
+            log_with_color(error, f'Something went wrong\n{e}', RED)
+
+    elif 'download_docs_assets' in argv and len(argv) == 2:
+
+        try:
+            download_rapidoc()
+            log_with_color(info, 'The docs assets are downloaded')
+
+        except Exception as e:
+            log_with_color(error, f'Something went wrong\n{e}', RED)
+
     else:
         log_with_color(error, 'Unknown command or incorrect command arguments', RED)